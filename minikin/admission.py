@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+admission control of concurrent requests
+"""
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Tuple
+
+
+class Overloaded(Exception):
+    """
+    request rejected because too many are in flight
+    """
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(reason)
+
+
+class Admission:
+    """
+    let at most limit requests in at a time. others wait in a queue of up to
+    queue_size for at most timeout seconds and are let in by priority, 0
+    first. a request arriving at a full queue takes the place of a waiting
+    request of lower priority or is rejected.
+    """
+
+    def __init__(self, limit: int, queue_size: int=0,
+                 timeout: float=1) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._turn = itertools.count()
+
+    async def acquire(self, priority: int=0) -> None:
+        """
+        wait for a slot, raises Overloaded if the request isn't let in
+        """
+        if self.in_flight < self.limit and not self._waiting:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiting) >= self.queue_size:
+            self._make_room(priority)
+        future = asyncio.get_event_loop().create_future()
+        entry = (priority, next(self._turn), future)
+        heapq.heappush(self._waiting, entry)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            if future.done() and not future.cancelled():
+                return  # let in just as the deadline passed
+            self.rejected += 1
+            raise Overloaded('timeout')
+        except asyncio.CancelledError:
+            self._remove(entry)
+            if future.done() and not future.cancelled() and \
+                    future.exception() is None:
+                self.release()
+            raise
+
+    def _make_room(self, priority: int) -> None:
+        if self._waiting:
+            worst = max(self._waiting)
+            if worst[0] > priority:
+                self._remove(worst)
+                self.rejected += 1
+                worst[2].set_exception(Overloaded('evicted'))
+                return
+        self.rejected += 1
+        raise Overloaded('queue_full')
+
+    def _remove(self, entry: Tuple[int, int, asyncio.Future]) -> None:
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+
+    def release(self) -> None:
+        """
+        hand the slot to the first waiting request or free it
+        """
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                self.admitted += 1
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiting),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
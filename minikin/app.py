@@ -5,7 +5,9 @@ entry point of the application
 """
 import argparse
 import logging
-import logging.config
+import os
+import socket
+import sys
 
 import aioredis
 import asyncio
@@ -13,59 +15,271 @@ import asyncpg
 import uvloop
 from aiohttp import web
 
-from minikin import handlers, middlewares
+from minikin import (
+    assets, codec, db, handlers, hotkeys, logs, metrics, middlewares,
+    queries, warmup, workers)
+from minikin.admission import Admission
+from minikin.batch import InsertBatcher
+from minikin.bloom import SharedBloomFilter
+from minikin.breaker import CircuitBreaker, GuardedRedis
+from minikin.cache import LRUCache
+from minikin.clicks import ClickCounter
+from minikin.layout import LAYOUTS, with_layout
+from minikin.pools import ReplicaPool, ShardRouter, dsn_options, parse_shard
+from minikin.snapshot import LiveSnapshot
 
 
-def get_logger() -> logging.Logger:
+logger = logging.getLogger('root')
+
+
+async def close_batcher(app):
+    await app['batcher'].close()
+
+
+async def close_clicks(app):
+    await app['clicks'].close()
+
+
+async def wait_for_write_backs(app):
+    await db.wait_for_write_backs()
+
+
+async def close_read_pool(app):
+    await app['read_pool'].close()
+
+
+async def close_pool(app):
+    await app['pool'].close()
+
+
+async def start_loop_monitor(app):
+    app['loop_monitor'] = asyncio.ensure_future(metrics.monitor_loop_lag())
+
+
+async def stop_loop_monitor(app):
+    app['loop_monitor'].cancel()
+
+
+async def start_warm_up(app):
+    app['warm_up'] = asyncio.ensure_future(warmup.warm_up(
+        app, app['settings']['warm_up_file'],
+        app['settings']['warm_up_size']))
+
+
+async def stop_warm_up(app):
+    app['warm_up'].cancel()
+
+
+async def start_hot_keys(app):
+    app['hot_keys_task'] = asyncio.ensure_future(hotkeys.track(
+        app, app['settings']['hot_interval'],
+        app['settings']['hot_keys_file']))
+
+
+async def stop_hot_keys(app):
+    app['hot_keys_task'].cancel()
+
+
+async def start_bloom_watch(app):
+    app['bloom_watch'] = asyncio.ensure_future(db.watch_bloom_filter(
+        app['pool'], app['bloom'], app['settings']['bloom_check_interval']))
+
+
+async def stop_bloom_watch(app):
+    app['bloom_watch'].cancel()
+
+
+async def start_snapshot_watch(app):
+    app['snapshot_watch'] = asyncio.ensure_future(app['snapshot'].watch(
+        app['settings']['snapshot_check_interval']))
+
+
+async def stop_snapshot_watch(app):
+    app['snapshot_watch'].cancel()
+
+
+async def close_snapshot(app):
+    app['snapshot'].close()
+
+
+async def create_shard_router(shards, previous_shards, database, user,
+                              **options):
+    pools = {}
+    for name, dsn in list(shards) + list(previous_shards):
+        if name not in pools:
+            pools[name] = await asyncpg.create_pool(
+                dsn, **dsn_options(dsn, database, user), **options)
+    previous = None
+    if previous_shards:
+        previous = ShardRouter(
+            {name: pools[name] for name, _ in previous_shards})
+    return ShardRouter(
+        {name: pools[name] for name, _ in shards}, previous=previous)
+
+
+async def init_app(database, user, redis_uri, length, base_url,
+                   cache_size=0, cache_ttl=None, bloom_capacity=0,
+                   bloom_error_rate=0.001, negative_cache_size=0,
+                   negative_cache_ttl=None, batch_window=0, batch_size=100,
+                   db_host=None, replicas=(), replica_fallback=False,
+                   replica_check_interval=5, shards=(), previous_shards=(),
+                   max_inflight=0, max_queue=0, queue_timeout=1,
+                   retry_after=1, redis_timeout=None, redis_failures=0,
+                   redis_cooldown=5, redis_slow=None, shortened_cache_size=0,
+                   check_redis=False, pool_min_size=10, pool_max_size=10,
+                   redis_min_size=1, redis_max_size=10, warm_up_file=None,
+                   warm_up_size=10000, count_clicks=False, click_interval=1,
+                   click_max_slugs=10000, redis_layout='flat',
+                   bucket_prefix=4, redis_flat_fallback=False, hot_keys=0,
+                   hot_interval=10, hot_keys_file=None,
+                   bloom_check_interval=10, pool=None, redis=None):
     """
-    a simple logger that logs to both console and file
+    create the application. an existing pool and redis can be passed in,
+    e.g. stand-ins for benchmarking, instead of connecting to the database.
     """
-    LOGGING = {
-        'version': 1,
-        'formatters': {
-            'simple': {
-                'class': 'logging.Formatter',
-                'format': '%(asctime)s - %(levelname)s - %(message)s'
-            }
-        },
-        'handlers': {
-            'console': {
-                'level': 'INFO',
-                'class': 'logging.StreamHandler',
-                'formatter': 'simple'
-            },
-            'file': {
-                'level': 'INFO',
-                'class': 'logging.FileHandler',
-                'filename': 'output.log',
-                'formatter': 'simple'
-            },
-        },
-        'loggers': {
-            'root': {
-                'handlers': ['console', 'file'],
-                'level': 'INFO'
-            }
-        }
-    }
-    logging.config.dictConfig(LOGGING)
-    return logging.getLogger('root')
-
-
-logger = get_logger()
-
-
-async def init_app(database, user, redis_uri, length, base_url):
     app = web.Application()
-    app['settings'] = {'length': length, 'base_url': base_url}
-    app['pool'] = await asyncpg.create_pool(database=database, user=user)
-    app['redis'] = await aioredis.create_redis_pool(
-        redis_uri, encoding='utf-8')
+    # the hot keys saved by a previous process, unless told otherwise
+    if warm_up_file is None and hot_keys_file and \
+            os.path.exists(hot_keys_file):
+        warm_up_file = hot_keys_file
+    app['settings'] = {
+        'length': length, 'base_url': base_url, 'check_redis': check_redis,
+        'warm_up_file': warm_up_file, 'warm_up_size': warm_up_size,
+        'hot_interval': hot_interval, 'hot_keys_file': hot_keys_file,
+        'bloom_check_interval': bloom_check_interval}
+    # min_size connections are opened up front, each prepares the
+    # statements of the hot path as it is opened
+    options = {'min_size': pool_min_size, 'max_size': pool_max_size}
+    if pool is not None:
+        app['pool'] = pool
+    elif shards:
+        app['pool'] = await create_shard_router(
+            shards, previous_shards, database, user, init=queries.warm_up,
+            **options)
+        app.on_cleanup.append(close_pool)
+    else:
+        app['pool'] = await asyncpg.create_pool(
+            database=database, user=user, host=db_host,
+            init=queries.warm_up, **options)
+    app['read_pool'] = app['pool']
+    if replicas:
+        app['read_pool'] = ReplicaPool(
+            app['pool'],
+            [await asyncpg.create_pool(
+                dsn, **dsn_options(dsn, database, user),
+                init=queries.warm_up_reads, **options)
+             for dsn in replicas],
+            fallback_on_miss=replica_fallback,
+            check_interval=replica_check_interval)
+        app['read_pool'].start()
+        app.on_cleanup.append(close_read_pool)
+    app['redis'] = redis
+    if redis is None:
+        app['redis'] = await aioredis.create_redis_pool(
+            redis_uri, encoding='utf-8', minsize=redis_min_size,
+            maxsize=redis_max_size)
+    # the bloom filter is a bitmap of its own, whatever the layout
+    raw_redis = app['redis']
+    app['redis'] = with_layout(
+        app['redis'], redis_layout, bucket_prefix, redis_flat_fallback)
+    app['redis_breaker'] = None
+    if redis_failures > 0:
+        app['redis_breaker'] = CircuitBreaker(
+            'redis', redis_failures, redis_cooldown, redis_slow)
+        app['redis'] = GuardedRedis(
+            app['redis'], app['redis_breaker'], redis_timeout)
+    app.on_cleanup.append(wait_for_write_backs)
+    app['cache'] = LRUCache(cache_size, cache_ttl)
+    app['negative'] = LRUCache(negative_cache_size, negative_cache_ttl)
+    app['shortened'] = LRUCache(shortened_cache_size)
+    app['bloom'] = None
+    if bloom_capacity > 0:
+        app['bloom'] = SharedBloomFilter(
+            raw_redis, bloom_capacity, bloom_error_rate,
+            timeout=redis_timeout, breaker=app['redis_breaker'])
+        # loaded in the background, misses are looked up until it is
+        app.on_startup.append(start_bloom_watch)
+        app.on_cleanup.insert(0, stop_bloom_watch)
+    app['batcher'] = None
+    if batch_window > 0:
+        app['batcher'] = InsertBatcher(app['pool'], batch_window, batch_size)
+        app.on_cleanup.insert(0, close_batcher)
+    app['clicks'] = None
+    if count_clicks:
+        app['clicks'] = ClickCounter(
+            app['pool'], click_interval, click_max_slugs)
+        # before the pools are closed
+        app.on_cleanup.insert(0, close_clicks)
+    app['hot_keys'] = None
+    if hot_keys > 0:
+        app['hot_keys'] = hotkeys.HotKeys(hot_keys)
+        app.on_startup.append(start_hot_keys)
+        app.on_cleanup.insert(0, stop_hot_keys)
+    app['index'] = assets.load_asset(assets.INDEX)
+    app['assets'] = assets.load_assets(assets.STATIC)
     app.router.add_get('/', handlers.index)
-    app.router.add_static('/static', 'static')
+    app.router.add_get('/static/{name:.+}', handlers.static)
+    # registered before the slug route which would match it otherwise
+    app.router.add_get('/metrics', handlers.get_metrics)
+    app.router.add_get('/ready', handlers.get_ready)
+    app.router.add_get('/admin/hot_keys', handlers.get_hot_keys)
     app.router.add_get(r'/{slug:[0-9a-zA-z]{%d}}' % length, handlers.get_url)
+    # stats are read from the click table, only there with --count-clicks
+    if count_clicks:
+        app.router.add_get(
+            r'/{slug:[0-9a-zA-Z]{%d}}/stats' % length, handlers.get_stats)
     app.router.add_post('/shorten_url', handlers.shorten_url)
+    app.router.add_post('/shorten_urls', handlers.shorten_urls)
+    app.middlewares.append(middlewares.metrics_middleware)
+    app['admission'] = None
+    if max_inflight > 0:
+        app['admission'] = Admission(max_inflight, max_queue, queue_timeout)
+        # redirects are let in before anything else when busy
+        app.middlewares.append(middlewares.create_admission_middleware(
+            app['admission'], {'/{slug}': 0},
+            exempt=('/metrics', '/ready'), retry_after=retry_after))
+    app.middlewares.append(middlewares.error_middleware)
+    app.on_startup.append(start_loop_monitor)
+    app.on_cleanup.append(stop_loop_monitor)
+    app['ready'] = asyncio.Event()
+    if warm_up_file:
+        app.on_startup.append(start_warm_up)
+        app.on_cleanup.append(stop_warm_up)
+    else:
+        app['ready'].set()
+    return app
+
+
+async def init_snapshot_app(snapshot, length, base_url, cache_size=0,
+                            cache_ttl=None, check_interval=5):
+    """
+    create a read only application that answers redirects from a snapshot
+    file, without postgres or redis. the file is checked for a new snapshot
+    every check_interval seconds.
+    """
+    app = web.Application()
+    app['settings'] = {
+        'length': length, 'base_url': base_url,
+        'snapshot_check_interval': check_interval}
+    app['snapshot'] = LiveSnapshot(snapshot)
+    logger.info('loaded snapshot %s of %d slugs',
+                snapshot, len(app['snapshot'].current))
+    app.on_cleanup.append(close_snapshot)
+    if check_interval > 0:
+        app.on_startup.append(start_snapshot_watch)
+        app.on_cleanup.insert(0, stop_snapshot_watch)
+    app['cache'] = LRUCache(cache_size, cache_ttl)
+    app['index'] = assets.load_asset(assets.INDEX)
+    app['assets'] = assets.load_assets(assets.STATIC)
+    app.router.add_get('/', handlers.index)
+    app.router.add_get('/static/{name:.+}', handlers.static)
+    app.router.add_get('/metrics', handlers.get_metrics)
+    app.router.add_get('/ready', handlers.get_ready)
+    app.router.add_get(r'/{slug:[0-9a-zA-Z]{%d}}' % length, handlers.get_url)
+    app.middlewares.append(middlewares.metrics_middleware)
     app.middlewares.append(middlewares.error_middleware)
+    app.on_startup.append(start_loop_monitor)
+    app.on_cleanup.append(stop_loop_monitor)
     return app
 
 
@@ -76,8 +290,34 @@ def argument_parser():
         'database', nargs='?', help='database name', default='minikin')
     parser.add_argument(
         '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--db-host', help='host of the primary database', default=None)
+    parser.add_argument(
+        '--replica', dest='replicas', action='append', default=[],
+        help='dsn of a read replica, can be given more than once')
+    parser.add_argument(
+        '--replica-fallback', action='store_true',
+        help='look up slugs missing on a replica again on the primary')
+    parser.add_argument(
+        '--replica-check-interval', type=float, default=5,
+        help='seconds between replica health checks')
+    parser.add_argument(
+        '--shard', dest='shards', action='append', type=parse_shard,
+        default=[], help='name=dsn of a shard, can be given more than once')
+    parser.add_argument(
+        '--previous-shard', dest='previous_shards', action='append',
+        type=parse_shard, default=[],
+        help='name=dsn of a shard in the layout being migrated from')
     parser.add_argument(
         '--length', help='length of the short url path', type=int, default=7)
+    parser.add_argument(
+        '--snapshot', default=None,
+        help='serve redirects read only from this snapshot file, made with '
+             'minikin.export_snapshot, instead of postgres and redis')
+    parser.add_argument(
+        '--snapshot-check-interval', type=float, default=5,
+        help='seconds between checks for a new --snapshot file, 0 to '
+             'disable')
     parser.add_argument(
         '--base-url', help='base url', default='http://localhost:8080')
     parser.add_argument('--path', help='path', default=None)
@@ -85,18 +325,240 @@ def argument_parser():
     parser.add_argument(
         '--redis', '-r', help='redis uri', dest='redis_uri',
         default='redis://localhost')
+    parser.add_argument(
+        '--pool-min-size', type=int, default=10,
+        help='postgres connections opened at startup, per pool')
+    parser.add_argument(
+        '--pool-max-size', type=int, default=10,
+        help='max number of postgres connections, per pool')
+    parser.add_argument(
+        '--redis-min-size', type=int, default=1,
+        help='redis connections opened at startup')
+    parser.add_argument(
+        '--redis-max-size', type=int, default=10,
+        help='max number of redis connections')
+    parser.add_argument(
+        '--warm-up-file', default=None,
+        help='file of the hottest slugs, one per line, looked up at startup '
+             'before /ready reports ready')
+    parser.add_argument(
+        '--warm-up-size', type=int, default=10000,
+        help='max number of slugs looked up from --warm-up-file')
+    parser.add_argument(
+        '--redis-layout', choices=LAYOUTS, default='flat',
+        help='store each slug as a key, or in hashes of slugs with the same '
+             'prefix which take less memory')
+    parser.add_argument(
+        '--bucket-prefix', type=int, default=4,
+        help='number of slug characters in the name of a hash with '
+             '--redis-layout bucket')
+    parser.add_argument(
+        '--redis-flat-fallback', action='store_true',
+        help='also look slugs up as keys with --redis-layout bucket, while '
+             'the cache is migrated')
+    parser.add_argument(
+        '--redis-timeout', type=float, default=100,
+        help='milliseconds before a redis command is given up, unless '
+             '--redis-failures is 0')
+    parser.add_argument(
+        '--redis-failures', type=int, default=5,
+        help='failed or slow redis commands in a row before redis is '
+             'skipped for a while, 0 to never skip it')
+    parser.add_argument(
+        '--redis-cooldown', type=float, default=5,
+        help='seconds redis is skipped before it is tried again')
+    parser.add_argument(
+        '--redis-slow', type=float, default=0,
+        help='milliseconds over which a redis command counts as failed, '
+             '0 to disable')
+    parser.add_argument(
+        '--cache-size', type=int, default=10000,
+        help='max number of slugs kept in the in-process cache, 0 to disable')
+    parser.add_argument(
+        '--cache-ttl', type=float, default=None,
+        help='seconds before an in-process cache entry expires')
+    parser.add_argument(
+        '--shortened-cache-size', type=int, default=10000,
+        help='max number of recently shortened urls for which nothing is '
+             'written when they are shortened again, 0 to disable')
+    parser.add_argument(
+        '--check-redis', action='store_true',
+        help='look a url up in redis before writing it when shortening')
+    parser.add_argument(
+        '--bloom-capacity', type=int, default=0,
+        help='expected number of slugs for the bloom filter, 0 to disable')
+    parser.add_argument(
+        '--bloom-error-rate', type=float, default=0.001,
+        help='false positive rate of the bloom filter')
+    parser.add_argument(
+        '--bloom-check-interval', type=float, default=10,
+        help='seconds between checks that the bloom filter in redis is '
+             'loaded')
+    parser.add_argument(
+        '--negative-cache-size', type=int, default=10000,
+        help='max number of recent misses remembered, 0 to disable')
+    parser.add_argument(
+        '--negative-cache-ttl', type=float, default=5,
+        help='seconds a recent miss is remembered')
+    parser.add_argument(
+        '--batch-window', type=float, default=0,
+        help='milliseconds to gather inserts into one batch, 0 to disable')
+    parser.add_argument(
+        '--batch-size', type=int, default=100,
+        help='max number of inserts in one batch')
+    parser.add_argument(
+        '--count-clicks', action='store_true',
+        help='count redirects per slug in the click table')
+    parser.add_argument(
+        '--click-interval', type=float, default=1,
+        help='seconds between writes of click counts')
+    parser.add_argument(
+        '--click-max-slugs', type=int, default=10000,
+        help='max number of slugs with click counts kept in memory')
+    parser.add_argument(
+        '--hot-keys', type=int, default=0,
+        help='number of the most redirected slugs tracked and pinned in the '
+             'in-process cache, 0 to disable')
+    parser.add_argument(
+        '--hot-interval', type=float, default=10,
+        help='seconds between pinning the hot keys, counts are halved each '
+             'time')
+    parser.add_argument(
+        '--hot-keys-file', default=None,
+        help='file the hot keys are saved to, and warmed up from at startup '
+             'without --warm-up-file')
+    parser.add_argument(
+        '--max-inflight', type=int, default=0,
+        help='max number of requests handled at a time, 0 for no limit')
+    parser.add_argument(
+        '--max-queue', type=int, default=1000,
+        help='max number of requests waiting when --max-inflight is reached')
+    parser.add_argument(
+        '--queue-timeout', type=float, default=1000,
+        help='milliseconds a request waits before it gets a 503')
+    parser.add_argument(
+        '--retry-after', type=int, default=1,
+        help='seconds in the Retry-After header of a 503')
+    parser.add_argument(
+        '--json-codec', choices=sorted(codec.CODECS), default=codec.DEFAULT,
+        help='library used to encode and decode json')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='number of worker processes sharing the listening socket')
+    parser.add_argument(
+        '--log-level', default='INFO',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='log level')
+    parser.add_argument(
+        '--log-file', default='output.log',
+        help='file to log to as well as the console, empty to disable. '
+             'with --workers each worker logs to its own file named after '
+             'its pid, e.g. output.1234.log')
+    parser.add_argument(
+        '--log-max-bytes', type=int, default=0,
+        help='size at which the log file is rotated, 0 to disable')
+    parser.add_argument(
+        '--log-backups', type=int, default=5,
+        help='number of rotated log files kept')
+    parser.add_argument(
+        '--log-format', choices=['text', 'json'], default='text',
+        help='plain text or json lines')
+    parser.add_argument(
+        '--log-sample', dest='log_samples', action='append',
+        type=logs.parse_rate, default=[],
+        help='route=rate, fraction of requests to the route that are '
+             'logged, can be given more than once')
+    parser.add_argument(
+        '--log-sample-default', type=float, default=1,
+        help='fraction of requests logged for other routes')
+    parser.add_argument(
+        '--log-batch-size', type=int, default=100,
+        help='max number of log records written at a time')
+    parser.add_argument('--fd', type=int, help=argparse.SUPPRESS)
     return parser
 
 
 def main(argv=None):
-    args = argument_parser().parse_args(argv)
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argument_parser()
+    args = parser.parse_args(argv)
+    if args.shards and args.replicas:
+        parser.error('--replica can not be used with --shard')
+    log_file = args.log_file
+    if log_file and args.fd is not None:
+        # workers rotating the same file would overwrite each other's logs
+        log_file = logs.worker_file(log_file, os.getpid())
+    listener = logs.configure(
+        args.log_level, log_file, max_bytes=args.log_max_bytes,
+        backups=args.log_backups, json_format=args.log_format == 'json',
+        sample_rates=args.log_samples,
+        sample_default=args.log_sample_default,
+        batch_size=args.log_batch_size)
+    try:
+        serve(args, argv)
+    finally:
+        listener.stop()
+
+
+def serve(args, argv):
+    if args.workers > 1:
+        sock = workers.create_socket(args.path, args.port)
+        workers.Supervisor(sock, argv, args.workers).run()
+        return
+    codec.use(args.json_codec)
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     loop = asyncio.get_event_loop()
-    app = loop.run_until_complete(
-        init_app(args.database, args.user, args.redis_uri,
-                 args.length, args.base_url)
-    )
-    web.run_app(app, path=args.path, port=args.port)
+    if args.snapshot:
+        app = loop.run_until_complete(init_snapshot_app(
+            args.snapshot, args.length, args.base_url,
+            cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+            check_interval=args.snapshot_check_interval))
+    else:
+        app = loop.run_until_complete(init_app(
+            args.database, args.user, args.redis_uri,
+            args.length, args.base_url,
+            cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+            bloom_capacity=args.bloom_capacity,
+            bloom_error_rate=args.bloom_error_rate,
+            bloom_check_interval=args.bloom_check_interval,
+            negative_cache_size=args.negative_cache_size,
+            negative_cache_ttl=args.negative_cache_ttl,
+            batch_window=args.batch_window / 1000,
+            batch_size=args.batch_size, db_host=args.db_host,
+            replicas=args.replicas,
+            replica_fallback=args.replica_fallback,
+            replica_check_interval=args.replica_check_interval,
+            shards=args.shards, previous_shards=args.previous_shards,
+            max_inflight=args.max_inflight, max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout / 1000,
+            retry_after=args.retry_after,
+            redis_timeout=args.redis_timeout / 1000 or None,
+            redis_failures=args.redis_failures,
+            redis_cooldown=args.redis_cooldown,
+            redis_slow=args.redis_slow / 1000 or None,
+            shortened_cache_size=args.shortened_cache_size,
+            check_redis=args.check_redis,
+            pool_min_size=args.pool_min_size,
+            pool_max_size=args.pool_max_size,
+            redis_min_size=args.redis_min_size,
+            redis_max_size=args.redis_max_size,
+            warm_up_file=args.warm_up_file,
+            warm_up_size=args.warm_up_size,
+            count_clicks=args.count_clicks,
+            click_interval=args.click_interval,
+            click_max_slugs=args.click_max_slugs,
+            redis_layout=args.redis_layout,
+            bucket_prefix=args.bucket_prefix,
+            redis_flat_fallback=args.redis_flat_fallback,
+            hot_keys=args.hot_keys, hot_interval=args.hot_interval,
+            hot_keys_file=args.hot_keys_file))
+    if args.fd is not None:
+        # a worker started by the supervisor with an inherited socket
+        web.run_app(app, sock=socket.socket(fileno=args.fd),
+                    access_log_class=logs.AccessLogger)
+    else:
+        web.run_app(app, path=args.path, port=args.port,
+                    access_log_class=logs.AccessLogger)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+static files served from memory
+
+files are read once together with their gzip and brotli encodings. they are
+served with an etag and last modified date so that browsers can revalidate
+them with a 304. file names with a content hash, e.g. logo.3f2a9b1c.png,
+never change and are cached by browsers for a year.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from typing import Dict, List
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+INDEX = os.path.join(ROOT, 'index.html')
+STATIC = os.path.join(ROOT, 'static')
+
+FINGERPRINT = re.compile(r'\.[0-9a-f]{8,}\.[^.]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+
+    def __init__(self, body: bytes, content_type: str, mtime: float,
+                 cache_control: str=REVALIDATE) -> None:
+        self.body = body
+        self.etag = '"%s"' % hashlib.md5(body).hexdigest()
+        self.mtime = int(mtime)
+        self.headers = {
+            'Content-Type': content_type,
+            'ETag': self.etag,
+            'Last-Modified': formatdate(self.mtime, usegmt=True),
+            'Cache-Control': cache_control,
+        }
+        # encodings in order of preference, only kept if smaller
+        self.encodings: Dict[str, bytes] = {}
+        if brotli is not None:
+            self._add_encoding('br', brotli.compress(body))
+        self._add_encoding('gzip', gzip.compress(body, mtime=0))
+        if self.encodings:
+            self.headers['Vary'] = 'Accept-Encoding'
+
+    def _add_encoding(self, name: str, body: bytes) -> None:
+        if len(body) < len(self.body):
+            self.encodings[name] = body
+
+    def not_modified(self, request: web.Request) -> bool:
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or self.etag in tags or \
+                f'W/{self.etag}' in tags
+        since = request.if_modified_since
+        return since is not None and self.mtime <= since.timestamp()
+
+    def response(self, request: web.Request) -> web.Response:
+        if self.not_modified(request):
+            headers = dict(self.headers)
+            del headers['Content-Type']
+            return web.Response(status=304, headers=headers)
+        accepted = accepted_encodings(request.headers.get(
+            'Accept-Encoding', ''))
+        for name, body in self.encodings.items():
+            if name in accepted:
+                headers = dict(self.headers, **{'Content-Encoding': name})
+                return web.Response(body=body, headers=headers)
+        return web.Response(body=self.body, headers=self.headers)
+
+
+def accepted_encodings(header: str) -> List[str]:
+    encodings = []
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00'):
+            continue
+        encodings.append(name.strip().lower())
+    return encodings
+
+
+def load_asset(path: str) -> Asset:
+    content_type = mimetypes.guess_type(path)[0] or \
+        'application/octet-stream'
+    if content_type.startswith('text/'):
+        content_type += '; charset=utf8'
+    cache_control = IMMUTABLE if FINGERPRINT.search(path) else REVALIDATE
+    with open(path, 'rb') as fo:
+        return Asset(fo.read(), content_type, os.path.getmtime(path),
+                     cache_control)
+
+
+def load_assets(directory: str) -> Dict[str, Asset]:
+    """
+    assets of all the files under directory by their relative path
+    """
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, '/')
+            assets[relative] = load_asset(path)
+    return assets
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+group commit of concurrent inserts
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from asyncpg.pool import Pool
+
+from . import queries
+from .pools import run_rows
+
+logger = logging.getLogger('root')
+
+
+async def insert_many(connection, rows: List[Tuple[str, str]]) -> None:
+    """
+    insert (slug, url) rows with one statement, existing slugs are ignored
+    """
+    if not rows:
+        return
+    slugs, urls = zip(*rows)
+    await queries.execute(
+        connection, 'insert_many', list(slugs), list(urls))
+
+
+class InsertBatcher:
+    """
+    gather inserts from concurrent requests for up to window seconds or
+    max_size rows and write them with a single statement. the caller of
+    insert returns once its row is committed.
+    """
+
+    def __init__(self, pool: Pool, window: float=0.002,
+                 max_size: int=100) -> None:
+        self.pool = pool
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.flush_seconds = 0.0
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Future] = set()
+
+    async def insert(self, slug: str, url: str) -> None:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((slug, url, future))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        await future
+
+    def flush(self) -> None:
+        """
+        start writing the pending rows without waiting for the window
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._write(pending))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _write(self, pending) -> None:
+        rows: Dict[str, str] = {}
+        for slug, url, _ in pending:
+            rows.setdefault(slug, url)
+        start = time.monotonic()
+        try:
+            await run_rows(self.pool, insert_many, list(rows.items()))
+        except Exception as exc:
+            logger.warning('error inserting batch of %d rows', len(rows))
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.batches += 1
+            self.rows += len(rows)
+            self.max_batch_size = max(self.max_batch_size, len(rows))
+            self.flush_seconds += time.monotonic() - start
+        for _, _, future in pending:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self) -> None:
+        """
+        write what is pending and wait for all writes to finish
+        """
+        self.flush()
+        if self._flushing:
+            await asyncio.wait(set(self._flushing))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'max_batch_size': self.max_batch_size,
+            'mean_batch_size': self.rows / self.batches if self.batches else 0,
+            'mean_flush_seconds': (
+                self.flush_seconds / self.batches if self.batches else 0),
+        }
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+bloom filter for answering "definitely not stored" without a lookup
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from typing import Iterable, List, Set, Tuple
+
+from .breaker import CLOSED, CircuitBreaker
+
+logger = logging.getLogger('root')
+
+KEY = 'minikin:bloom'
+
+
+def dimensions(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """
+    number of bits and of hashes of a filter of capacity items at
+    error_rate false positive probability
+    """
+    if capacity <= 0:
+        raise ValueError('capacity must be positive')
+    if not 0 < error_rate < 1:
+        raise ValueError('error_rate must be between 0 and 1')
+    size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return size, max(1, round(size / capacity * math.log(2)))
+
+
+def positions(key: str, size: int, hash_count: int) -> List[int]:
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
+
+
+class BloomFilter:
+    """
+    fixed size bloom filter sized for capacity items at error_rate
+    false positive probability. there are no false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float=0.001) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hash_count = dimensions(capacity, error_rate)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, key: str) -> None:
+        for pos in positions(key, self.size, self.hash_count):
+            self._bits[pos >> 3] |= 0x80 >> (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[pos >> 3] & (0x80 >> (pos & 7))
+            for pos in positions(key, self.size, self.hash_count))
+
+    def to_bytes(self) -> bytes:
+        """
+        the bits in the order of a redis bitmap, most significant first
+        """
+        return bytes(self._bits)
+
+
+class SharedBloomFilter:
+    """
+    bloom filter in a redis bitmap shared by all processes. slugs are added
+    before they are stored, and the bit after the bits of the filter is set
+    once it holds every slug in the database.
+
+    a miss is only authoritative while that bit is set. until the filter is
+    loaded, after redis lost the key, or when redis can't be reached every
+    slug might be stored and is looked up.
+    """
+
+    def __init__(self, redis, capacity: int, error_rate: float=0.001,
+                 key: str=KEY, timeout: float=None,
+                 breaker: CircuitBreaker=None) -> None:
+        self.redis = redis
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hash_count = dimensions(capacity, error_rate)
+        self.key = key
+        self.timeout = timeout
+        self.breaker = breaker
+        # slugs stored while redis couldn't be written to
+        self.pending: Set[str] = set()
+
+    async def _call(self, coroutines) -> List:
+        return await asyncio.wait_for(
+            asyncio.gather(*coroutines), self.timeout)
+
+    async def might_contain(self, slug: str) -> bool:
+        if self.pending or \
+                self.breaker is not None and self.breaker.state != CLOSED:
+            return True
+        try:
+            bits = await self._call(
+                self.redis.getbit(self.key, pos) for pos in
+                [self.size, *positions(slug, self.size, self.hash_count)])
+        except Exception:
+            logger.warning('error checking bloom filter for %s', slug)
+            return True
+        return not bits[0] or all(bits[1:])
+
+    async def add(self, slugs: Iterable[str]) -> None:
+        """
+        add slugs about to be stored. if redis fails, or isn't tried while
+        the circuit is open, they are kept in pending until sync gets them
+        in.
+        """
+        slugs = list(slugs)
+        if self.breaker is not None and self.breaker.state != CLOSED:
+            self.pending.update(slugs)
+            return
+        try:
+            await self._set(slugs)
+        except Exception:
+            logger.warning('error adding %d slugs to bloom filter',
+                           len(slugs))
+            self.pending.update(slugs)
+
+    async def _set(self, slugs: List[str]) -> None:
+        offsets = {pos for slug in slugs
+                   for pos in positions(slug, self.size, self.hash_count)}
+        await self._call(
+            self.redis.setbit(self.key, pos, 1) for pos in offsets)
+
+    async def is_loaded(self) -> bool:
+        return bool(await self.redis.getbit(self.key, self.size))
+
+    async def sync(self) -> None:
+        """
+        add the pending slugs. other processes may have answered misses
+        for them meanwhile, so the filter is marked as not loaded first.
+        """
+        if not self.pending:
+            return
+        slugs = list(self.pending)
+        await self.redis.setbit(self.key, self.size, 0)
+        await self._set(slugs)
+        self.pending.difference_update(slugs)
+
+    async def upload(self, bloom: BloomFilter,
+                     chunk_size: int=1 << 20) -> None:
+        """
+        merge the bits of bloom, of the same dimensions, into the shared
+        filter, which keeps the slugs added meanwhile, and mark it loaded
+        """
+        data = bloom.to_bytes()
+        upload = f'{self.key}:upload'
+        await self.redis.delete(upload)
+        for i in range(0, len(data), chunk_size):
+            await self.redis.setrange(upload, i, data[i:i + chunk_size])
+        await self.redis.bitop_or(self.key, self.key, upload)
+        await self.redis.delete(upload)
+        await self.redis.setbit(self.key, self.size, 1)
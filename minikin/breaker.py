@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+circuit breaker for calls to a service that may be slow or down
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger('root')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """
+    call skipped because the circuit is open
+    """
+
+
+class CircuitBreaker:
+    """
+    open after failure_threshold failed or slow calls in a row, then skip
+    calls for reset_timeout seconds. after that a single probing call is let
+    through, the circuit closes again if it succeeds.
+
+    every change of state starts a new generation. the outcome of a call
+    let through in an earlier generation, e.g. one that was still running
+    when the circuit opened, doesn't count.
+    """
+
+    def __init__(self, name: str, failure_threshold: int=5,
+                 reset_timeout: float=5, slow_call: float=None) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.skipped = 0
+        self.generation = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _change(self, state: str) -> None:
+        self.state = state
+        self.generation += 1
+
+    def allow(self) -> bool:
+        if self.state == OPEN and \
+                time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._change(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.skipped += 1
+        return False
+
+    def record(self, ok: bool, duration: float=0,
+               generation: int=None) -> None:
+        """
+        outcome of a call let through in generation, the current one if
+        not given
+        """
+        if generation is not None and generation != self.generation:
+            return
+        if ok and self.slow_call is not None and duration > self.slow_call:
+            ok = False
+        self._probing = False
+        if ok:
+            if self.state != CLOSED:
+                logger.warning('%s circuit closed', self.name)
+                self._change(CLOSED)
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or \
+                self.failures >= self.failure_threshold:
+            if self.state == CLOSED:
+                logger.warning('%s circuit open after %d failures',
+                               self.name, self.failures)
+                self.opened += 1
+            self._change(OPEN)
+            self._opened_at = time.monotonic()
+
+    def abandon(self, generation: int=None) -> None:
+        """
+        a call let through was cancelled before it finished
+        """
+        if generation is None or generation == self.generation:
+            self._probing = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'open': int(self.state != CLOSED),
+            'opened': self.opened,
+            'skipped': self.skipped,
+        }
+
+
+class GuardedRedis:
+    """
+    redis commands with a timeout, skipped while the circuit is open
+    """
+
+    def __init__(self, redis, breaker: CircuitBreaker,
+                 timeout: float=None) -> None:
+        self.redis = redis
+        self.breaker = breaker
+        self.timeout = timeout
+
+    async def _call(self, command: str, *args) -> Any:
+        if not self.breaker.allow():
+            raise CircuitOpen(self.breaker.name)
+        generation = self.breaker.generation
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                getattr(self.redis, command)(*args), self.timeout)
+        except asyncio.CancelledError:
+            self.breaker.abandon(generation)
+            raise
+        except Exception:
+            self.breaker.record(False, generation=generation)
+            raise
+        self.breaker.record(
+            True, time.perf_counter() - start, generation)
+        return result
+
+    async def get(self, key):
+        return await self._call('get', key)
+
+    async def set(self, key, value):
+        return await self._call('set', key, value)
+
+    async def mset(self, *pairs):
+        return await self._call('mset', *pairs)
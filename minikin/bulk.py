@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+bulk copy of short_url between postgres and dump files
+
+a dump is a directory of gzipped files, one per range of slugs, and a
+manifest listing them. a file holds either the postgres binary copy stream
+of its range as is, or its rows as newline delimited json. both are read
+and written a chunk at a time so memory stays constant however big the
+table is.
+
+the binary copy format is a header, then per row a 16 bit field count and
+per field a 32 bit length followed by that many bytes, -1 for null, then a
+16 bit -1. text is sent as its utf-8 bytes.
+"""
+import json
+import os
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+HEADER = SIGNATURE + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+BINARY = 'binary'
+NDJSON = 'ndjson'
+FORMATS = (BINARY, NDJSON)
+MANIFEST = 'manifest.json'
+COLUMNS = ['slug', 'url']
+
+FIELD_COUNT = struct.Struct('!h')
+FIELD_SIZE = struct.Struct('!i')
+Row = Tuple[Optional[str], Optional[str]]
+
+
+def _field(value: Optional[str]) -> bytes:
+    if value is None:
+        return FIELD_SIZE.pack(-1)
+    data = value.encode('utf-8')
+    return FIELD_SIZE.pack(len(data)) + data
+
+
+def encode_rows(rows: Iterable[Row]) -> bytes:
+    """
+    rows in binary copy format, without the header and trailer
+    """
+    return b''.join(
+        FIELD_COUNT.pack(2) + _field(slug) + _field(url)
+        for slug, url in rows)
+
+
+class CopyDecoder:
+    """
+    rows of a binary copy stream fed in chunks of any size
+    """
+
+    def __init__(self) -> None:
+        self.done = False
+        self._buffer = bytearray()
+        self._header = False
+
+    def feed(self, chunk: bytes) -> List[Row]:
+        buffer = self._buffer
+        buffer += chunk
+        position = 0
+        if not self._header:
+            if len(buffer) < len(HEADER):
+                return []
+            if not buffer.startswith(SIGNATURE):
+                raise ValueError('not a binary copy stream')
+            extension = FIELD_SIZE.unpack_from(buffer, len(SIGNATURE) + 4)[0]
+            if len(buffer) < len(HEADER) + extension:
+                return []
+            position = len(HEADER) + extension
+            self._header = True
+        rows = []
+        while not self.done and len(buffer) - position >= 2:
+            count = FIELD_COUNT.unpack_from(buffer, position)[0]
+            if count == -1:
+                self.done = True
+                position += 2
+                break
+            fields: List[Optional[str]] = []
+            cursor = position + 2
+            for _ in range(count):
+                if len(buffer) - cursor < 4:
+                    break
+                size = FIELD_SIZE.unpack_from(buffer, cursor)[0]
+                cursor += 4
+                if size == -1:
+                    fields.append(None)
+                    continue
+                if len(buffer) - cursor < size:
+                    break
+                fields.append(buffer[cursor:cursor + size].decode('utf-8'))
+                cursor += size
+            if len(fields) < count:
+                break  # the rest of the row is in the next chunk
+            slug, url = fields[0], fields[1]
+            # slug is a char column padded with spaces
+            rows.append((slug.rstrip() if slug else slug, url))
+            position = cursor
+        del buffer[:position]
+        return rows
+
+
+def ranges(bounds: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    ranges of slugs split at bounds, the first and the last open ended
+    """
+    edges: List[Optional[str]] = [None, *bounds, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def range_query(low: Optional[str],
+                high: Optional[str]) -> Tuple[str, List[str]]:
+    """
+    query of the rows of a range and its arguments
+    """
+    conditions, args = [], []
+    if low is not None:
+        args.append(low)
+        conditions.append(f'slug >= ${len(args)}')
+    if high is not None:
+        args.append(high)
+        conditions.append(f'slug < ${len(args)}')
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    return f'SELECT slug, url FROM short_url{where}', args
+
+
+async def sample_bounds(connection, partitions: int,
+                        percent: float=1) -> List[str]:
+    """
+    slugs splitting the table into partitions ranges of about the same
+    size, estimated from a sample of percent of its pages. they are in the
+    order of the column's collation, the one range_query compares in, which
+    needn't be the order of python strings.
+    """
+    if partitions <= 1:
+        return []
+    bounds = await connection.fetchval(
+        'SELECT percentile_disc($1::float8[]) WITHIN GROUP (ORDER BY slug) '
+        'FROM short_url TABLESAMPLE SYSTEM ($2)',
+        [i / partitions for i in range(1, partitions)], percent)
+    # ascending fractions give ascending slugs, equal ones are adjacent
+    result: List[str] = []
+    for bound in bounds or []:
+        if bound is not None and (not result or bound != result[-1]):
+            result.append(bound)
+    return result
+
+
+def file_name(index: int, fmt: str) -> str:
+    return f'part-{index:05d}.{"copy" if fmt == BINARY else "ndjson"}.gz'
+
+
+def write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(directory, MANIFEST)
+    with open(f'{path}.tmp', 'w') as fo:
+        json.dump(manifest, fo, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST)) as fo:
+        return json.load(fo)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+in-process cache
+"""
+from collections import OrderedDict
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+class LRUCache:
+    """
+    bounded least recently used cache with optional time to live.
+    a maxsize of 0 disables the cache. pinned keys are passed over when
+    evicting as long as there are others to evict.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float]=None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pinned: Set = set()
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None) -> Any:
+        try:
+            value, expires = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = None if not self.ttl else time.monotonic() + self.ttl
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        passed = 0
+        while len(self._data) > self.maxsize:
+            oldest, item = self._data.popitem(last=False)
+            if oldest in self.pinned and passed < len(self._data):
+                self._data[oldest] = item
+                passed += 1
+                continue
+            self.evictions += 1
+
+    def pin(self, keys: Iterable) -> None:
+        """
+        pin keys instead of the ones pinned before
+        """
+        self.pinned = set(keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def discard(self, key) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
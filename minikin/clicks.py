@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+click counting
+
+clicks are counted in memory and written to the click table every interval
+seconds, or as soon as max_slugs slugs are pending, with one upsert per
+shard. counts are best effort: clicks of new slugs are dropped while
+max_slugs are pending and clicks are lost if a write fails.
+
+CREATE TABLE click (
+    slug CHAR(7),
+    clicks BIGINT NOT NULL,
+    last_click TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (slug)
+);
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from asyncpg.pool import Pool
+
+from . import queries
+from .pools import run_query, run_rows
+
+logger = logging.getLogger('root')
+
+# writes in flight before flushing waits for them
+MAX_FLUSHING = 2
+
+
+async def upsert_clicks(connection,
+                        rows: List[Tuple[str, int, datetime]]) -> None:
+    """
+    add (slug, clicks, last click) rows to the counts
+    """
+    if not rows:
+        return
+    slugs, clicks, last_clicks = zip(*rows)
+    await queries.execute(connection, 'upsert_clicks', list(slugs),
+                          list(clicks), list(last_clicks))
+
+
+async def fetch_clicks(connection, slug: str):
+    return await queries.fetchrow(connection, 'select_clicks', slug)
+
+
+class ClickCounter:
+
+    def __init__(self, pool: Pool, interval: float=1,
+                 max_slugs: int=10000) -> None:
+        self.pool = pool
+        self.interval = interval
+        self.max_slugs = max_slugs
+        self.recorded = 0
+        self.dropped = 0
+        self.lost = 0
+        self.flushes = 0
+        # slug -> [clicks, time of last click]
+        self._counts: Dict[str, List] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Future] = set()
+
+    def record(self, slug: str) -> None:
+        count = self._counts.get(slug)
+        if count is not None:
+            count[0] += 1
+            count[1] = time.time()
+        elif len(self._counts) >= self.max_slugs:
+            self.dropped += 1
+            self.flush()
+            return
+        else:
+            self._counts[slug] = [1, time.time()]
+        self.recorded += 1
+        if len(self._counts) >= self.max_slugs:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(
+                self.interval, self.flush)
+
+    def pending(self, slug: str) -> Tuple[int, Optional[float]]:
+        """
+        clicks of slug and the time of the last one not written yet
+        """
+        count = self._counts.get(slug)
+        return (count[0], count[1]) if count else (0, None)
+
+    def flush(self) -> None:
+        """
+        start writing the pending counts
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._counts:
+            return
+        if len(self._flushing) >= MAX_FLUSHING:
+            # try again later, or once a write is done if full
+            self._timer = asyncio.get_event_loop().call_later(
+                self.interval, self.flush)
+            return
+        counts, self._counts = self._counts, {}
+        task = asyncio.ensure_future(self._write(counts))
+        self._flushing.add(task)
+        task.add_done_callback(self._written)
+
+    def _written(self, task: asyncio.Future) -> None:
+        self._flushing.discard(task)
+        if len(self._counts) >= self.max_slugs:
+            self.flush()
+
+    async def _write(self, counts: Dict[str, List]) -> None:
+        rows = [
+            (slug, clicks, datetime.fromtimestamp(last, timezone.utc))
+            for slug, (clicks, last) in counts.items()]
+        self.flushes += 1
+        try:
+            await run_rows(self.pool, upsert_clicks, rows)
+        except Exception:
+            self.lost += sum(clicks for _, clicks, _ in rows)
+            logger.warning('error writing clicks of %d slugs', len(rows))
+
+    async def close(self) -> None:
+        """
+        write what is pending and wait for all writes to finish
+        """
+        while self._counts or self._flushing:
+            self.flush()
+            if self._flushing:
+                await asyncio.wait(set(self._flushing))
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._counts),
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'lost': self.lost,
+            'flushes': self.flushes,
+        }
+
+
+async def get_clicks(
+        pool: Pool, slug: str,
+        counter: ClickCounter=None) -> Tuple[int, Optional[float]]:
+    """
+    clicks of slug and the time of the last one as a timestamp, including
+    those of this process not written yet
+    """
+    record = await run_query(pool, fetch_clicks, slug, slug=slug, read=True)
+    clicks, last = 0, None
+    if record is not None:
+        clicks, last = record['clicks'], record['last_click'].timestamp()
+    if counter is not None:
+        pending, pending_last = counter.pending(slug)
+        clicks += pending
+        if pending_last is not None:
+            last = max(last or 0, pending_last)
+    return clicks, last
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+json encoding and decoding
+
+orjson is used when it is installed, otherwise the standard library. another
+codec can be registered with register and chosen with use.
+"""
+import json
+from typing import Any, Callable, Dict, Tuple, Union
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+Codec = Tuple[Callable[[Any], bytes], Callable[[Union[str, bytes]], Any]]
+
+CODECS: Dict[str, Codec] = {
+    'json': (lambda obj: json.dumps(obj).encode(), json.loads),
+}
+if orjson is not None:
+    CODECS['orjson'] = (orjson.dumps, orjson.loads)
+
+DEFAULT = 'orjson' if orjson is not None else 'json'
+
+_dumps, _loads = CODECS[DEFAULT]
+
+
+def register(name: str, dumps: Callable[[Any], bytes],
+             loads: Callable[[Union[str, bytes]], Any]) -> None:
+    CODECS[name] = (dumps, loads)
+
+
+def use(name: str) -> None:
+    """
+    encode and decode with the codec registered as name
+    """
+    global _dumps, _loads
+    try:
+        _dumps, _loads = CODECS[name]
+    except KeyError:
+        raise ValueError(f'unknown json codec {name}') from None
+
+
+def dumps(obj: Any) -> bytes:
+    return _dumps(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    decode json, raises ValueError for invalid json
+    """
+    return _loads(data)
+
+
+def json_response(data: Any, status: int=200) -> web.Response:
+    return web.Response(
+        body=_dumps(data), status=status, content_type='application/json',
+        charset='utf-8')
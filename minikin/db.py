@@ -2,14 +2,31 @@
 """
 database operations
 """
+import asyncio
+import itertools
 import logging
+import os
+import time
+from typing import List, Optional, Set, Tuple
 
 from asyncpg.pool import Pool
 from aioredis.commands import Redis
+from . import metrics, queries
+from .batch import InsertBatcher, insert_many
+from .bloom import BloomFilter, SharedBloomFilter
+from .breaker import CircuitOpen
+from .cache import LRUCache
+from .pools import run_query, run_rows, stored_pools
+from .singleflight import SingleFlight
 from .utils import generate_slug
 
 logger = logging.getLogger('root')
 
+# lookups that missed the local cache, shared by all concurrent requests
+lookups = SingleFlight()
+# redis writes of urls found in postgres, kept until they are done
+write_backs: Set[asyncio.Future] = set()
+
 
 class URLNotFound(Exception):
     """
@@ -20,51 +37,233 @@ class URLNotFound(Exception):
         super().__init__(slug)
 
 
+async def fetch_url(connection, slug: str) -> Optional[str]:
+    return await queries.fetchval(connection, 'select_url', slug)
+
+
 async def write_to_redis_if_exists(key, value, redis: Redis=None):
     if redis:
+        start = time.perf_counter()
         try:
             await redis.set(key, value)
+        except CircuitOpen:
+            return
         except Exception:
+            metrics.REDIS_ERRORS.inc('set')
             logger.warning('error set cache key=%s value=%s', key, value)
+        metrics.REDIS_SECONDS.observe(time.perf_counter() - start, 'set')
+
+
+async def write_many_to_redis_if_exists(
+        pairs: List[Tuple[str, str]], redis: Redis=None):
+    if redis and pairs:
+        start = time.perf_counter()
+        try:
+            await redis.mset(*itertools.chain.from_iterable(pairs))
+        except CircuitOpen:
+            return
+        except Exception:
+            metrics.REDIS_ERRORS.inc('mset')
+            logger.warning('error set %d cache keys', len(pairs))
+        metrics.REDIS_SECONDS.observe(time.perf_counter() - start, 'mset')
+
+
+def write_back(slug: str, url: str, redis: Redis=None) -> None:
+    """
+    write a url found in postgres to redis without waiting for it
+    """
+    if redis:
+        future = asyncio.ensure_future(
+            write_to_redis_if_exists(slug, url, redis))
+        write_backs.add(future)
+        future.add_done_callback(write_backs.discard)
+
+
+async def wait_for_write_backs() -> None:
+    if write_backs:
+        await asyncio.wait(list(write_backs))
+
+
+async def load_bloom_filter(pool: Pool, bloom: SharedBloomFilter,
+                            lock_ttl: int=600) -> bool:
+    """
+    add every existing slug to the shared bloom filter, unless it is loaded
+    already or another process is loading it. returns whether it was loaded.
+    """
+    if await bloom.is_loaded():
+        return False
+    lock = f'{bloom.key}:lock'
+    if not await bloom.redis.set(lock, os.getpid(), expire=lock_ttl,
+                                 exist=bloom.redis.SET_IF_NOT_EXIST):
+        return False
+    try:
+        local = BloomFilter(bloom.capacity, bloom.error_rate)
+        for shard in stored_pools(pool):
+            async with shard.acquire() as connection:
+                async with connection.transaction():
+                    async for record in connection.cursor(
+                            'SELECT slug FROM short_url'):
+                        local.add(record['slug'].strip())
+        await bloom.upload(local)
+    finally:
+        await bloom.redis.delete(lock)
+    logger.info('loaded %d slugs into bloom filter', len(local))
+    return True
+
+
+async def watch_bloom_filter(pool: Pool, bloom: SharedBloomFilter,
+                             interval: float) -> None:
+    """
+    get pending slugs into the bloom filter and load it again whenever
+    redis lost it
+    """
+    while True:
+        try:
+            await bloom.sync()
+            await load_bloom_filter(pool, bloom)
+        except Exception:
+            logger.exception('error loading bloom filter')
+        await asyncio.sleep(interval)
+
+
+def remember_slug(slug: str, negative: LRUCache=None) -> None:
+    """
+    make a newly stored slug visible to the cache of recent misses
+    """
+    if negative is not None:
+        negative.discard(slug)
+
+
+async def insert_url(connection, slug: str, url: str) -> None:
+    await queries.execute(connection, 'insert_url', slug, url)
+
+
+async def stored_tier(slug: str, url: str, redis: Redis=None,
+                      shortened: LRUCache=None) -> Optional[str]:
+    """
+    where slug is already known to be stored for url, the local cache of
+    recently shortened urls or redis, or None
+    """
+    if shortened is not None and shortened.get(slug) == url:
+        return 'local'
+    if redis:
+        try:
+            if await redis.get(slug) == url:
+                return 'redis'
+        except CircuitOpen:
+            pass
+        except Exception:
+            metrics.REDIS_ERRORS.inc('get')
+            logger.warning('error get cache key=%s', slug)
+    return None
 
 
 async def shorten_url(
-        pool: Pool, url: str, size: int, redis: Redis=None) -> str:
+        pool: Pool, url: str, size: int, redis: Redis=None,
+        bloom: SharedBloomFilter=None, negative: LRUCache=None,
+        batcher: InsertBatcher=None, shortened: LRUCache=None,
+        check_redis: bool=False) -> str:
     """
-    shorten url
+    shorten url. with a batcher the insert is group committed together with
+    concurrent requests.
+
+    the slug of a url never changes, so nothing is written if the url was
+    shortened recently according to shortened, or according to redis with
+    check_redis.
     """
     slug = generate_slug(url, size)
-    async with pool.acquire() as connection:
-        async with connection.transaction():
-            # do an upsert and ignore hash collision as the probability
-            # is extremely low, however, if collision is to be eliminated
-            # completely, it can be done in sacrifice of efficiency.
-            await connection.execute(
-                '''
-                INSERT INTO short_url(slug, url)
-                VALUES($1, $2)
-                ON CONFLICT (slug) DO NOTHING;
-                ''', slug, url
-            )
+    tier = await stored_tier(
+        slug, url, redis if check_redis else None, shortened)
+    if tier is not None:
+        metrics.SHORTENS.inc(tier)
+        return slug
+    # in the filter before it is stored, so it is never missed
+    if bloom is not None:
+        await bloom.add([slug])
+    if batcher is not None:
+        await batcher.insert(slug, url)
+    else:
+        await run_query(pool, insert_url, slug, url, slug=slug)
+    metrics.SHORTENS.inc('postgres')
+    remember_slug(slug, negative)
     await write_to_redis_if_exists(slug, url, redis)
+    if shortened is not None:
+        shortened.set(slug, url)
     return slug
 
 
-async def get_url(pool: Pool, slug: str, redis: Redis=None) -> str:
+async def shorten_urls(
+        pool: Pool, urls: List[str], size: int, redis: Redis=None,
+        bloom: SharedBloomFilter=None, negative: LRUCache=None,
+        shortened: LRUCache=None) -> List[str]:
+    """
+    shorten many urls with one insert statement and one redis write, urls
+    shortened recently according to shortened are not written again
+    """
+    slugs = [generate_slug(url, size) for url in urls]
+    rows = [(slug, url) for slug, url in zip(slugs, urls)
+            if shortened is None or shortened.get(slug) != url]
+    metrics.SHORTENS.inc('local', amount=len(slugs) - len(rows))
+    if rows:
+        if bloom is not None:
+            await bloom.add(slug for slug, _ in rows)
+        await run_rows(pool, insert_many, rows)
+        metrics.SHORTENS.inc('postgres', amount=len(rows))
+    for slug, url in rows:
+        remember_slug(slug, negative)
+        if shortened is not None:
+            shortened.set(slug, url)
+    await write_many_to_redis_if_exists(rows, redis)
+    return slugs
+
+
+async def get_url(pool: Pool, slug: str, redis: Redis=None,
+                  bloom: SharedBloomFilter=None,
+                  negative: LRUCache=None) -> str:
     """
-    get url for slug
+    get url for slug. lookup order is recent misses, redis, bloom filter
+    then postgres. the in-process cache of redirects is up to the caller.
     """
+    if negative is not None and negative.get(slug):
+        metrics.LOOKUPS.inc('negative')
+        raise URLNotFound(slug)
+
+    return await lookups.do(slug, _lookup, pool, slug, redis, bloom, negative)
+
+
+async def _lookup(pool: Pool, slug: str, redis: Redis=None,
+                  bloom: SharedBloomFilter=None,
+                  negative: LRUCache=None) -> str:
+    url = None
     if redis:
-        url = await redis.get(slug)
+        start = time.perf_counter()
+        try:
+            url = await redis.get(slug)
+        except CircuitOpen:
+            pass
+        except Exception:
+            metrics.REDIS_ERRORS.inc('get')
+            logger.warning('error get cache key=%s', slug)
+        else:
+            metrics.REDIS_SECONDS.observe(
+                time.perf_counter() - start, 'get')
         if url:
             logger.debug('found from cache %s -> %s', slug, url)
+            metrics.LOOKUPS.inc('redis')
             return url
 
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow(
-            'SELECT * FROM short_url WHERE slug = $1', slug)
-        if not record:
-            raise URLNotFound(slug)
-        url = record['url']
-        await write_to_redis_if_exists(slug, url, redis)
-        return url
+    if bloom is not None and not await bloom.might_contain(slug):
+        metrics.LOOKUPS.inc('bloom')
+        if negative is not None:
+            negative.set(slug, True)
+        raise URLNotFound(slug)
+
+    url = await run_query(pool, fetch_url, slug, slug=slug, read=True)
+    if url is None:
+        metrics.LOOKUPS.inc('miss')
+        if negative is not None:
+            negative.set(slug, True)
+        raise URLNotFound(slug)
+    metrics.LOOKUPS.inc('postgres')
+    write_back(slug, url, redis)
+    return url
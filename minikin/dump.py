@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+script for dumping short_url, installed as minikin-dump
+
+the table is split into ranges of slugs from a sample and the ranges are
+copied out in parallel with binary COPY, each to its own gzipped file. all
+workers read from one snapshot exported by the coordinating connection, so
+the dump is consistent as of when it started.
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import asyncio
+import asyncpg
+
+from minikin import codec
+from minikin.bulk import (
+    BINARY, COLUMNS, FORMATS, CopyDecoder, file_name, range_query, ranges,
+    sample_bounds, write_manifest)
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='dump short_url')
+    parser.add_argument(
+        'database', nargs='?', help='database name', default='minikin')
+    parser.add_argument(
+        '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--db-host', help='host of the database', default=None)
+    parser.add_argument(
+        '--output', '-o', default='minikin.dump',
+        help='directory to write the dump to')
+    parser.add_argument(
+        '--format', choices=FORMATS, default=BINARY, dest='fmt',
+        help='postgres binary copy or newline delimited json')
+    parser.add_argument(
+        '--workers', type=int, default=4,
+        help='number of ranges copied in parallel')
+    parser.add_argument(
+        '--partitions', type=int, default=0,
+        help='number of ranges the table is split into, 4 per worker by '
+             'default')
+    parser.add_argument(
+        '--sample', type=float, default=1,
+        help='percent of the table sampled to split it into ranges')
+    parser.add_argument(
+        '--level', type=int, default=6, help='gzip compression level')
+    return parser
+
+
+async def dump_range(connection, path: str, low, high, fmt: str=BINARY,
+                     level: int=6) -> int:
+    """
+    copy the rows of a range to a gzipped file at path, returns the number
+    of bytes copied
+    """
+    loop = asyncio.get_event_loop()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    decoder = CopyDecoder()
+    copied = 0
+    query, args = range_query(low, high)
+    with open(f'{path}.tmp', 'wb') as fo:
+
+        async def write(chunk: bytes) -> None:
+            nonlocal copied
+            copied += len(chunk)
+            if fmt != BINARY:
+                chunk = b''.join(
+                    codec.dumps({'slug': slug, 'url': url}) + b'\n'
+                    for slug, url in decoder.feed(chunk))
+            # zlib lets go of the gil, so workers compress in parallel
+            fo.write(await loop.run_in_executor(
+                None, compressor.compress, chunk))
+
+        await connection.copy_from_query(
+            query, *args, output=write, format='binary')
+        fo.write(compressor.flush())
+    os.replace(f'{path}.tmp', path)
+    return copied
+
+
+async def dump_worker(pool, snapshot: str, queue: asyncio.Queue,
+                      directory: str, fmt: str, level: int,
+                      progress: dict) -> None:
+    async with pool.acquire() as connection:
+        while not queue.empty():
+            index, (low, high) = queue.get_nowait()
+            async with connection.transaction(
+                    isolation='repeatable_read', readonly=True):
+                await connection.execute(
+                    f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+                progress['bytes'] += await dump_range(
+                    connection, os.path.join(directory, file_name(
+                        index, fmt)), low, high, fmt, level)
+            progress['files'] += 1
+            elapsed = time.monotonic() - progress['started']
+            sys.stdout.write(
+                f'\r{progress["files"]}/{progress["total"]} files '
+                f'{progress["bytes"] / elapsed / 2 ** 20:.1f} MB/sec')
+            sys.stdout.flush()
+
+
+async def dump(database, user, output, fmt=BINARY, workers=4, partitions=0,
+               sample=1, level=6, db_host=None):
+    pool = await asyncpg.create_pool(
+        database=database, user=user, host=db_host, min_size=workers + 1,
+        max_size=workers + 1)
+    os.makedirs(output, exist_ok=True)
+    async with pool.acquire() as connection:
+        transaction = connection.transaction(
+            isolation='repeatable_read', readonly=True)
+        await transaction.start()
+        snapshot = await connection.fetchval('SELECT pg_export_snapshot()')
+        bounds = await sample_bounds(
+            connection, partitions or workers * 4, sample)
+        parts = ranges(bounds)
+        print(f'dumping {len(parts)} ranges.')
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(parts):
+            queue.put_nowait(item)
+        progress = {'files': 0, 'bytes': 0, 'total': len(parts),
+                    'started': time.monotonic()}
+        await asyncio.gather(*[
+            dump_worker(pool, snapshot, queue, output, fmt, level, progress)
+            for _ in range(workers)])
+        # the snapshot is only exported while this transaction is open
+        await transaction.commit()
+    write_manifest(output, {
+        'format': fmt,
+        'columns': COLUMNS,
+        'files': [{'name': file_name(index, fmt), 'low': low, 'high': high}
+                  for index, (low, high) in enumerate(parts)],
+    })
+    await pool.close()
+    print('\ndone!')
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        dump(args.database, args.user, args.output, fmt=args.fmt,
+             workers=args.workers, partitions=args.partitions,
+             sample=args.sample, level=args.level, db_host=args.db_host))
+
+
+if __name__ == '__main__':
+    main()
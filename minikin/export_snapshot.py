@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+script for exporting short_url to a snapshot file served with --snapshot
+
+rows are read through a cursor in byte order of slug, the order lookups
+search the snapshot in, and written as they are read so memory stays
+constant. the file is written next to output and moved over it at the end,
+so processes serving output pick it up without a restart.
+"""
+import argparse
+import sys
+import time
+
+import asyncio
+import asyncpg
+
+from minikin.snapshot import MAX_DICTIONARY, SnapshotWriter
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='export snapshot')
+    parser.add_argument(
+        'database', nargs='?', help='database name', default='minikin')
+    parser.add_argument(
+        '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--db-host', help='host of the database', default=None)
+    parser.add_argument(
+        '--output', '-o', default='minikin.snapshot',
+        help='snapshot file to write')
+    parser.add_argument(
+        '--length', help='length of the short url path', type=int, default=7)
+    parser.add_argument(
+        '--compress', action='store_true',
+        help='deflate urls against a dictionary sampled from the table')
+    parser.add_argument(
+        '--sample-size', type=int, default=1000,
+        help='number of urls the compression dictionary is built from')
+    return parser
+
+
+async def sample_dictionary(connection, size: int) -> bytes:
+    """
+    urls of some rows, which share the schemes, hosts and paths common in
+    the table
+    """
+    records = await connection.fetch(
+        'SELECT url FROM short_url LIMIT $1', size)
+    return b''.join(
+        record['url'].encode('utf-8') for record in records)[-MAX_DICTIONARY:]
+
+
+async def export_snapshot(database, user, output, length=7, db_host=None,
+                          compress=False, sample_size=1000):
+    connection = await asyncpg.connect(
+        database=database, user=user, host=db_host)
+    dictionary = b''
+    if compress:
+        dictionary = await sample_dictionary(connection, sample_size)
+    writer = SnapshotWriter(output, length, compress, dictionary)
+    started = time.monotonic()
+    async with connection.transaction():
+        async for record in connection.cursor(
+                'SELECT slug, url FROM short_url ORDER BY slug COLLATE "C"',
+                prefetch=10000):
+            writer.add(record['slug'].strip(), record['url'])
+            if writer.count % 100000 == 0:
+                rate = writer.count / (time.monotonic() - started)
+                sys.stdout.write(f'\r{writer.count} rows {rate:.0f} rows/sec')
+                sys.stdout.flush()
+    writer.close()
+    await connection.close()
+    print(f'\nwrote {writer.count} rows to {output}.')
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        export_snapshot(args.database, args.user, args.output,
+                        length=args.length, db_host=args.db_host,
+                        compress=args.compress,
+                        sample_size=args.sample_size))
+
+
+if __name__ == '__main__':
+    main()
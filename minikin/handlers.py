@@ -3,59 +3,252 @@
 http handlers
 """
 import logging
-import json
-import os
+from datetime import datetime, timezone
+from typing import Dict, Tuple
 
 from aiohttp import web
 
-from .utils import validate_url
-from . import db
+from .utils import iter_json_batches, validate_url
+from . import assets, codec, db, metrics
+from .clicks import get_clicks
+from .logs import route_of
+from .pools import primary_pools
 
 
 logger = logging.getLogger('root')
 
 
+def redirect_parts(url: str) -> Tuple[bytes, Dict[str, str]]:
+    """body and headers of the redirect to url"""
+    return codec.dumps({'location': url}), {
+        'Location': url, 'Content-Type': 'application/json'}
+
+
 async def get_url(request) -> web.Response:
     """redirect to the destination url from the short url"""
     slug = request.match_info['slug']
-    try:
-        url = await db.get_url(request.app['pool'], slug, request.app['redis'])
-    except db.URLNotFound:
-        raise web.HTTPNotFound
-    return web.HTTPFound(
-        location=url,
-        content_type='application/json',
-        body=json.dumps({'location': url})
-    )
+    # the in-process cache keeps the ready to send body and headers of the
+    # redirect, as a slug always maps to the same url
+    cache = request.app.get('cache')
+    parts = cache.get(slug) if cache is not None else None
+    if parts is not None:
+        metrics.LOOKUPS.inc('l1')
+    else:
+        # a read only process answers from its snapshot alone
+        snapshot = request.app.get('snapshot')
+        if snapshot is not None:
+            url = snapshot.get(slug)
+            metrics.LOOKUPS.inc('snapshot' if url is not None else 'miss')
+            if url is None:
+                raise web.HTTPNotFound
+        else:
+            try:
+                url = await db.get_url(
+                    request.app.get('read_pool', request.app['pool']), slug,
+                    request.app['redis'], bloom=request.app.get('bloom'),
+                    negative=request.app.get('negative'))
+            except db.URLNotFound:
+                raise web.HTTPNotFound
+        parts = redirect_parts(url)
+        if cache is not None:
+            cache.set(slug, parts)
+    counter = request.app.get('clicks')
+    if counter is not None:
+        counter.record(slug)
+    hot_keys = request.app.get('hot_keys')
+    if hot_keys is not None:
+        hot_keys.add(slug)
+    body, headers = parts
+    return web.Response(status=302, body=body, headers=headers)
+
+
+async def get_stats(request) -> web.Response:
+    """clicks of a short url and the time of the last one"""
+    slug = request.match_info['slug']
+    pool = request.app.get('read_pool', request.app['pool'])
+    clicks, last = await get_clicks(pool, slug, request.app.get('clicks'))
+    if not clicks:
+        try:
+            await db.get_url(pool, slug, request.app['redis'],
+                             bloom=request.app.get('bloom'),
+                             negative=request.app.get('negative'))
+        except db.URLNotFound:
+            raise web.HTTPNotFound
+    return codec.json_response({
+        'slug': slug,
+        'clicks': clicks,
+        'last_click': (
+            datetime.fromtimestamp(last, timezone.utc).isoformat()
+            if last is not None else None),
+    })
 
 
 async def shorten_url(request) -> web.Response:
     """convert a long url from json body into a short url"""
     body = await request.text()
-    logger.info(body)
+    logger.info('shorten url body=%s', body,
+                extra={'route': route_of(request)})
     try:
-        url = json.loads(body)['url']
-    except (json.decoder.JSONDecodeError, KeyError):
+        url = codec.loads(body)['url']
+    except (ValueError, KeyError):
         example = '{"url": "www.helloworld.com"}'
         error = f'invalid request body {body}, expected format {example}'
-        return web.json_response({'error': error}, status=400)
+        return codec.json_response({'error': error}, status=400)
     try:
         url = validate_url(url)
     except ValueError:
-        return web.json_response(
+        return codec.json_response(
             {'error': f'cannot shorten an invalid url {url}'}, status=400)
     settings = request.app['settings']
     slug = await db.shorten_url(
-        request.app['pool'], url, settings['length'], request.app['redis'])
+        request.app['pool'], url, settings['length'], request.app['redis'],
+        bloom=request.app.get('bloom'), negative=request.app.get('negative'),
+        batcher=request.app.get('batcher'),
+        shortened=request.app.get('shortened'),
+        check_redis=settings.get('check_redis', False))
     shortened_url = f'{settings["base_url"]}/{slug}'
-    return web.json_response({'shortened_url': shortened_url}, status=201)
+    return codec.json_response({'shortened_url': shortened_url}, status=201)
+
+
+async def shorten_batch(request, items) -> bytes:
+    """newline delimited json results of a batch of decoded items"""
+    settings = request.app['settings']
+    results = []
+    urls = []
+    for item in items:
+        if isinstance(item, ValueError):
+            results.append({'error': f'invalid json {item}'})
+            continue
+        if not isinstance(item, dict) or \
+                not isinstance(item.get('url'), str):
+            results.append({'error': f'invalid item {item}'})
+            continue
+        try:
+            url = validate_url(item['url'])
+        except ValueError:
+            results.append(
+                {'error': f'cannot shorten an invalid url {item["url"]}'})
+        else:
+            results.append({'url': url})
+            urls.append(url)
+    slugs = iter(await db.shorten_urls(
+        request.app['pool'], urls, settings['length'],
+        request.app['redis'], bloom=request.app.get('bloom'),
+        negative=request.app.get('negative'),
+        shortened=request.app.get('shortened')))
+    for result in results:
+        if 'url' in result:
+            result['shortened_url'] = f'{settings["base_url"]}/{next(slugs)}'
+    return b''.join(codec.dumps(result) + b'\n' for result in results)
+
+
+async def shorten_urls(request) -> web.StreamResponse:
+    """
+    convert long urls from a json array or newline delimited json body into
+    short urls. results are streamed back as newline delimited json in the
+    order of the request.
+
+    once streaming has started the status can't change anymore, an
+    unexpected error ends the stream with an error line instead.
+    """
+    response = web.StreamResponse(status=200)
+    response.content_type = 'application/x-ndjson'
+    await response.prepare(request)
+    try:
+        async for items in iter_json_batches(request.content):
+            await response.write(await shorten_batch(request, items))
+    except Exception:
+        logger.exception('unexpected error shortening urls',
+                         extra={'route': route_of(request)})
+        error = 'sorry, an unexpected error occurred. we are notified.'
+        await response.write(codec.dumps({'error': error}) + b'\n')
+    await response.write_eof()
+    return response
 
 
 async def index(request) -> web.Response:
-    with open(os.path.join(os.path.dirname(__file__), '../index.html')) as fo:
-        return web.Response(
-            status=200,
-            body=fo.read(),
-            content_type='text/html',
-            charset='utf8'
-        )
+    """the landing page, read from disk if the app hasn't loaded it"""
+    asset = request.app.get('index') or assets.load_asset(assets.INDEX)
+    return asset.response(request)
+
+
+async def static(request) -> web.Response:
+    """a file under the static directory, served from memory"""
+    try:
+        asset = request.app['assets'][request.match_info['name']]
+    except KeyError:
+        raise web.HTTPNotFound
+    return asset.response(request)
+
+
+async def get_ready(request) -> web.Response:
+    """200 once the process has warmed up, 503 until then"""
+    ready = request.app.get('ready')
+    if ready is None or ready.is_set():
+        return codec.json_response({'ready': True})
+    return codec.json_response({'ready': False}, status=503)
+
+
+async def get_hot_keys(request) -> web.Response:
+    """the slugs redirected to most recently, with estimated counts"""
+    hot_keys = request.app.get('hot_keys')
+    if hot_keys is None:
+        raise web.HTTPNotFound
+    try:
+        limit = int(request.query.get('limit', 100))
+    except ValueError:
+        return codec.json_response(
+            {'error': 'limit must be an integer'}, status=400)
+    stats = hot_keys.stats()
+    return codec.json_response({
+        'total': stats['total'],
+        # share of redirects that went to the tracked slugs, i.e. the hit
+        # ratio of a cache holding just them
+        'coverage': stats['top_count'] / stats['total']
+        if stats['total'] else 0,
+        'slugs': [{'slug': slug, 'count': count}
+                  for slug, count in hot_keys.most_common(limit)],
+    })
+
+
+async def get_metrics(request) -> web.Response:
+    """metrics in prometheus text format"""
+    app = request.app
+    lines = [metrics.REGISTRY.render()]
+    if app.get('cache') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_l1_cache', app['cache'].stats()))
+    if app.get('negative') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_negative_cache', app['negative'].stats()))
+    if app.get('shortened') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_shortened_cache', app['shortened'].stats()))
+    if app.get('admission') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_admission', app['admission'].stats()))
+    if app.get('redis_breaker') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_redis_circuit', app['redis_breaker'].stats()))
+    if app.get('clicks') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_clicks', app['clicks'].stats()))
+    if app.get('snapshot') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_snapshot', app['snapshot'].stats()))
+    if app.get('hot_keys') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_hot_keys', app['hot_keys'].stats()))
+    if app.get('batcher') is not None:
+        lines.extend(metrics.format_stats(
+            'minikin_insert_batch', app['batcher'].stats()))
+    lines.extend(metrics.format_stats('minikin_single_flight', {
+        'calls': db.lookups.calls, 'shared': db.lookups.shared}))
+    if app.get('pool') is not None:
+        for i, pool in enumerate(primary_pools(app['pool'])):
+            lines.extend(metrics.format_stats('minikin_pool', {
+                'size': pool.get_size(), 'idle': pool.get_idle_size(),
+            }, f'{{pool="{i}"}}'))
+    return web.Response(
+        body='\n'.join(lines).rstrip('\n') + '\n',
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
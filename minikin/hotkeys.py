@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+hottest slugs of the redirect traffic
+
+every redirect is counted in a count-min sketch, which estimates the count
+of any slug in constant memory and never underestimates it, and the slugs
+with the highest estimates are kept in a top k table. counts are halved
+every refresh so the table follows what is trending rather than what was
+ever popular.
+
+on refresh the top k are pinned in the local cache, the ones missing from
+it looked up, and they are written to a file a newly started process warms
+up from.
+"""
+import asyncio
+import hashlib
+import heapq
+import logging
+import os
+from array import array
+from typing import Dict, List, Tuple
+
+from .warmup import preload
+
+logger = logging.getLogger('root')
+
+
+class CountMinSketch:
+    """
+    depth rows of width counters, a key is counted in one counter per row
+    and its estimate is the smallest of them. with total the sum of all
+    counts, an estimate is within total * e / width of the real count with
+    probability 1 - e ** -depth.
+    """
+
+    def __init__(self, width: int=2048, depth: int=4) -> None:
+        if width <= 0 or depth <= 0:
+            raise ValueError('width and depth must be positive')
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._counters = array('Q', bytes(8 * width * depth))
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (h1 + row * h2) % self.width
+                for row in range(self.depth)]
+
+    def add(self, key: str, count: int=1) -> int:
+        """
+        count key and return its new estimate. only the counters at the
+        smallest are raised, which keeps estimates closer to the real count.
+        """
+        self.total += count
+        positions = self._positions(key)
+        counters = self._counters
+        estimate = min(counters[pos] for pos in positions) + count
+        for pos in positions:
+            if counters[pos] < estimate:
+                counters[pos] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(self._counters[pos] for pos in self._positions(key))
+
+    def halve(self) -> None:
+        self._counters = array('Q', (c >> 1 for c in self._counters))
+        self.total >>= 1
+
+
+class HotKeys:
+    """
+    the k slugs with the highest estimated counts
+    """
+
+    def __init__(self, k: int, width: int=2048, depth: int=4) -> None:
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.top: Dict[str, int] = {}
+        # counts in top when they were pushed, counts only go up between
+        # refreshes so the smallest one is at most the smallest in top
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, slug: str) -> None:
+        estimate = self.sketch.add(slug)
+        if slug in self.top:
+            self.top[slug] = estimate
+        elif len(self.top) < self.k:
+            self.top[slug] = estimate
+            heapq.heappush(self._heap, (estimate, slug))
+        elif estimate > self._heap[0][0]:
+            # bring the count at the top of the heap up to date until it is
+            # the real smallest
+            while self._heap[0][0] != self.top[self._heap[0][1]]:
+                heapq.heapreplace(
+                    self._heap, (self.top[self._heap[0][1]], self._heap[0][1]))
+            coldest = self._heap[0]
+            if estimate > coldest[0]:
+                heapq.heapreplace(self._heap, (estimate, slug))
+                del self.top[coldest[1]]
+                self.top[slug] = estimate
+
+    def most_common(self, n: int=None) -> List[Tuple[str, int]]:
+        ranked = sorted(self.top.items(), key=lambda item: -item[1])
+        return ranked if n is None else ranked[:n]
+
+    def halve(self) -> None:
+        self.sketch.halve()
+        self.top = {slug: count >> 1 for slug, count in self.top.items()
+                    if count > 1}
+        self._heap = [(count, slug) for slug, count in self.top.items()]
+        heapq.heapify(self._heap)
+
+    def stats(self) -> Dict[str, int]:
+        top = sum(self.top.values())
+        return {
+            'total': self.sketch.total,
+            'tracked': len(self.top),
+            'top_count': top,
+        }
+
+
+def write_slugs(path: str, slugs: List[str]) -> None:
+    # worker processes may save at the same time
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fo:
+        fo.writelines(f'{slug}\n' for slug in slugs)
+    os.replace(tmp, path)
+
+
+async def refresh(app, path: str=None) -> None:
+    """
+    pin the hottest slugs in the local cache, loading the ones it misses,
+    save them to path and halve the counts
+    """
+    hot_keys = app['hot_keys']
+    slugs = [slug for slug, _ in hot_keys.most_common()]
+    cache = app.get('cache')
+    if cache is not None and cache.maxsize > 0:
+        slugs = slugs[:cache.maxsize // 2]
+        cache.pin(slugs)
+        await preload(app, [slug for slug in slugs if slug not in cache])
+    if path:
+        write_slugs(path, slugs)
+    hot_keys.halve()
+
+
+async def track(app, interval: float, path: str=None) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh(app, path)
+        except Exception:
+            logger.exception('error refreshing hot keys')
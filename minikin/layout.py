@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+layouts of the slug -> url cache in redis
+
+the flat layout stores every slug as its own string key. the bucket layout
+stores slugs in small hashes keyed by a prefix of the slug, e.g. with a
+prefix of 4 characters url of slug PTFeSGv is field SGv of hash u:PTFe.
+redis keeps a hash of up to hash-max-listpack-entries (128 by default)
+fields in one compact listpack, which saves most of the overhead of a key
+per slug. pick the prefix so that the number of slugs divided by 62 to the
+power of the prefix stays well under that limit.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+FLAT = 'flat'
+BUCKET = 'bucket'
+LAYOUTS = (FLAT, BUCKET)
+BUCKET_KEY = 'u:'
+
+
+class BucketRedis:
+    """
+    get, set and mset of slugs in the bucket layout. with fallback a slug
+    missing from its bucket is also looked up as a flat key, for reading
+    both layouts while the cache is migrated.
+    """
+
+    def __init__(self, redis, prefix: int=4, fallback: bool=False) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self.fallback = fallback
+
+    def bucket(self, slug: str) -> Tuple[str, str]:
+        """
+        hash key and field of slug
+        """
+        return f'{BUCKET_KEY}{slug[:self.prefix]}', slug[self.prefix:]
+
+    async def get(self, slug: str) -> Optional[str]:
+        url = await self.redis.hget(*self.bucket(slug))
+        if url is None and self.fallback:
+            url = await self.redis.get(slug)
+        return url
+
+    async def set(self, slug: str, url: str) -> bool:
+        await self.redis.hset(*self.bucket(slug), url)
+        return True
+
+    async def mset(self, *pairs: str) -> bool:
+        """
+        one hmset per bucket, sent together as aioredis pipelines commands
+        issued concurrently
+        """
+        buckets: Dict[str, List[str]] = defaultdict(list)
+        for slug, url in zip(pairs[::2], pairs[1::2]):
+            key, field = self.bucket(slug)
+            buckets[key] += [field, url]
+        await asyncio.gather(*[
+            self.redis.hmset(key, *fields)
+            for key, fields in buckets.items()])
+        return True
+
+
+def with_layout(redis, layout: str=FLAT, prefix: int=4,
+                fallback: bool=False):
+    """
+    redis as seen through layout
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(
+            f'unknown cache layout {layout}, choose from {", ".join(LAYOUTS)}')
+    if layout == BUCKET:
+        return BucketRedis(redis, prefix, fallback)
+    return redis
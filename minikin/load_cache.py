@@ -2,14 +2,33 @@
 # -*- coding: utf-8 -*-
 """
 script for generating cache
+
+rows are read in pages ordered by slug and written to redis with one MSET
+per page by several writers in parallel. the slug of the last page written
+is saved to a checkpoint file so an interrupted load can resume from it.
+
+an incremental load only writes rows inserted since the last complete load,
+found by comparing the row's xmin with the transaction id saved when that
+load started. xmin is a 32 bit counter so run a full load again after a
+transaction id wraparound.
+
+with --layout bucket the rows are written to hashes of slugs with the same
+prefix instead of one key per slug, see minikin.layout.
 """
 import argparse
+import itertools
+import json
+import os
 import sys
+import time
+from typing import Dict, Optional, Tuple
 
 import aioredis
 import asyncio
 import asyncpg
 
+from minikin.layout import LAYOUTS, with_layout
+
 
 def argument_parser():
     parser = argparse.ArgumentParser(description='generate cache')
@@ -20,28 +39,171 @@ def argument_parser():
     parser.add_argument(
         '--redis', '-r', help='redis uri', dest='redis_uri',
         default='redis://localhost')
+    parser.add_argument(
+        '--layout', choices=LAYOUTS, default='flat',
+        help='layout of the cache in redis')
+    parser.add_argument(
+        '--bucket-prefix', type=int, default=4,
+        help='number of slug characters in the name of a bucket')
+    parser.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='number of rows written to redis in one round trip')
+    parser.add_argument(
+        '--writers', type=int, default=4,
+        help='number of parallel redis writers')
+    parser.add_argument(
+        '--checkpoint', default='load_cache.checkpoint',
+        help='file recording progress for resuming')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only load rows inserted since the last complete load')
+    parser.add_argument(
+        '--restart', action='store_true',
+        help='ignore an unfinished load in the checkpoint file')
     return parser
 
 
-async def load_cache(database, user, redis_uri):
-    pool = await asyncpg.create_pool(database=database, user=user)
-    redis = await aioredis.create_redis_pool(
-        redis_uri, encoding='utf-8', minsize=5, maxsize=10)
+def read_checkpoint(path: str) -> Dict:
+    try:
+        with open(path) as fo:
+            return json.load(fo)
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(path: str, checkpoint: Dict) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fo:
+        json.dump(checkpoint, fo)
+    os.replace(tmp, path)
+
+
+class Progress:
+    """
+    track written pages, pages can finish out of order so the checkpoint
+    only moves past pages that are all written.
+    """
+
+    def __init__(self, checkpoint: Dict, path: str,
+                 total: Optional[int]=None, interval: float=1) -> None:
+        self.checkpoint = checkpoint
+        self.path = path
+        self.total = total
+        self.interval = interval
+        self.rows = 0
+        self.started = self.saved = time.monotonic()
+        self._next = 0
+        self._finished: Dict[int, str] = {}
+
+    def page_done(self, index: int, last_slug: str, rows: int) -> None:
+        self.rows += rows
+        self._finished[index] = last_slug
+        while self._next in self._finished:
+            self.checkpoint['slug'] = self._finished.pop(self._next)
+            self._next += 1
+        now = time.monotonic()
+        if now - self.saved >= self.interval:
+            self.saved = now
+            write_checkpoint(self.path, self.checkpoint)
+            self.report()
+
+    def report(self) -> None:
+        elapsed = time.monotonic() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        status = f'\r{self.rows} rows {rate:.0f} rows/sec'
+        if self.total:
+            status += f' {self.rows / self.total * 100:.2f}%'
+        sys.stdout.write(status)
+        sys.stdout.flush()
+
+    def complete(self) -> None:
+        self.checkpoint['complete'] = True
+        write_checkpoint(self.path, self.checkpoint)
+        self.report()
+        sys.stdout.write('\n')
+
+
+async def read_pages(connection, queue: asyncio.Queue, after: str,
+                     batch_size: int, since: Optional[int],
+                     writers: int) -> None:
+    if since is None:
+        query = '''
+            SELECT slug, url FROM short_url WHERE slug > $1
+            ORDER BY slug LIMIT $2
+        '''
+        args: Tuple = ()
+    else:
+        query = '''
+            SELECT slug, url FROM short_url
+            WHERE slug > $1 AND xmin::text::bigint >= $3
+            ORDER BY slug LIMIT $2
+        '''
+        args = (since % 2 ** 32,)
+    for index in itertools.count():
+        records = await connection.fetch(query, after, batch_size, *args)
+        if not records:
+            break
+        pairs = [(record['slug'].strip(), record['url'])
+                 for record in records]
+        await queue.put((index, pairs))
+        after = pairs[-1][0]
+    for _ in range(writers):
+        await queue.put(None)
+
+
+async def write_pages(redis, queue: asyncio.Queue,
+                      progress: Progress) -> None:
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        index, pairs = item
+        await redis.mset(*itertools.chain.from_iterable(pairs))
+        progress.page_done(index, pairs[-1][0], len(pairs))
+
+
+async def load_cache(database, user, redis_uri, batch_size=1000, writers=4,
+                     checkpoint_path='load_cache.checkpoint',
+                     incremental=False, restart=False, layout='flat',
+                     bucket_prefix=4):
+    pool = await asyncpg.create_pool(
+        database=database, user=user, min_size=1, max_size=1)
+    redis = with_layout(
+        await aioredis.create_redis_pool(
+            redis_uri, encoding='utf-8', minsize=writers, maxsize=writers),
+        layout, bucket_prefix)
 
     async with pool.acquire() as connection:
-        record = await connection.fetchrow('SELECT COUNT(slug) from short_url')
-        count = record['count']
-        print(f'start loading.\ntotal record {count}.')
-        i = 0
-        async with connection.transaction():
-            async for record in connection.cursor('SELECT * FROM short_url'):
-                await redis.set(record['slug'].strip(), record['url'])
-                i += 1
-                if i % 100 == 0:
-                    sys.stdout.write(f'\r{i / count * 100:.2f}%')
-                    sys.stdout.flush()
-            else:
-                sys.stdout.write('\r100.00%\n')
+        checkpoint = {} if restart else read_checkpoint(checkpoint_path)
+        if checkpoint and not checkpoint.get('complete'):
+            print(f'resume loading after slug {checkpoint["slug"]!r}.')
+        else:
+            if incremental and not checkpoint:
+                sys.exit('no complete load found to continue from.')
+            checkpoint = {
+                'since': checkpoint['xid'] if incremental else None,
+                'xid': await connection.fetchval(
+                    'SELECT txid_snapshot_xmin(txid_current_snapshot())'),
+                'slug': '',
+                'complete': False,
+            }
+            write_checkpoint(checkpoint_path, checkpoint)
+        total = None
+        if checkpoint['since'] is None:
+            total = await connection.fetchval(
+                'SELECT COUNT(slug) FROM short_url WHERE slug > $1',
+                checkpoint['slug'])
+            print(f'start loading.\ntotal record {total}.')
+        else:
+            print('start loading rows inserted since last load.')
+        progress = Progress(checkpoint, checkpoint_path, total)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=writers * 2)
+        await asyncio.gather(
+            read_pages(connection, queue, checkpoint['slug'], batch_size,
+                       checkpoint['since'], writers),
+            *[write_pages(redis, queue, progress) for _ in range(writers)]
+        )
+        progress.complete()
         print('done!')
 
 
@@ -49,7 +211,11 @@ def main(argv=None):
     args = argument_parser().parse_args(argv)
     loop = asyncio.get_event_loop()
     loop.run_until_complete(
-        load_cache(args.database, args.user, args.redis_uri))
+        load_cache(args.database, args.user, args.redis_uri,
+                   batch_size=args.batch_size, writers=args.writers,
+                   checkpoint_path=args.checkpoint,
+                   incremental=args.incremental, restart=args.restart,
+                   layout=args.layout, bucket_prefix=args.bucket_prefix))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+logging that doesn't block the event loop
+
+records are put on a queue and written from a background thread in
+batches. records of http requests carry the route they are for and can be
+sampled per route.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp.abc import AbstractAccessLogger
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    one json object per line
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        route = getattr(record, 'route', None)
+        if route is not None:
+            data['route'] = route
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    keep a fraction of the records with a route below warning, by default
+    rate, or the rate given for the route
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]]=None,
+                 default: float=1) -> None:
+        super().__init__()
+        self.rates = rates or {}
+        self.default = default
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = getattr(record, 'route', None)
+        # warnings and errors are always kept
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(route, self.default)
+        return rate >= 1 or random.random() < rate
+
+
+class BatchFlush:
+    """
+    a stream handler flushed once per batch by the listener rather than
+    after every record
+    """
+
+    def flush(self) -> None:
+        pass
+
+    def flush_batch(self) -> None:
+        logging.StreamHandler.flush(self)  # type: ignore
+
+
+class BatchStreamHandler(BatchFlush, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(BatchFlush,
+                               logging.handlers.RotatingFileHandler):
+    pass
+
+
+class BatchListener:
+    """
+    write the records put on a queue to handlers from a background thread,
+    taking up to batch_size records at a time and flushing the handlers
+    after each batch
+    """
+
+    def __init__(self, records: queue.Queue, *handlers: logging.Handler,
+                 batch_size: int=100) -> None:
+        self.queue = records
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        write the records already queued and wait for the thread to end
+        """
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _consume(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    stopped = True
+                else:
+                    self.handle(record)
+            for handler in self.handlers:
+                if isinstance(handler, BatchFlush):
+                    handler.flush_batch()
+
+
+class AccessLogger(AbstractAccessLogger):
+    """
+    aiohttp access log with the route of the request for sampling
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return self.logger.isEnabledFor(logging.INFO)
+
+    def log(self, request, response, time: float) -> None:
+        self.logger.info(
+            '%s %s %s %s %.3fms', request.remote, request.method,
+            request.path_qs, response.status, time * 1000,
+            extra={'route': route_of(request)})
+
+
+def route_of(request) -> str:
+    """
+    the route a request matched, e.g. /{slug}, rather than its path
+    """
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else 'unmatched'
+
+
+def parse_rate(value: str) -> Tuple[str, float]:
+    """
+    parse a sampling rate given as route=rate
+    """
+    route, sep, rate = value.rpartition('=')
+    try:
+        if not sep or not route or not 0 <= float(rate) <= 1:
+            raise ValueError
+    except ValueError:
+        raise ValueError(
+            f'expected route=rate with rate between 0 and 1, got {value}')
+    return route, float(rate)
+
+
+def worker_file(filename: str, pid: int) -> str:
+    """
+    log file of a worker process, output.log becomes output.1234.log
+    """
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{pid}{ext}'
+
+
+def configure(level: str='INFO', filename: Optional[str]='output.log',
+              max_bytes: int=0, backups: int=5, json_format: bool=False,
+              sample_rates: Sequence[Tuple[str, float]]=(),
+              sample_default: float=1,
+              batch_size: int=100) -> BatchListener:
+    """
+    log to the console and filename through a queue, returns the started
+    listener which should be stopped on exit to write what is left
+    """
+    formatter = JSONFormatter() if json_format else \
+        logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [BatchStreamHandler(sys.stderr)]
+    if filename:
+        handlers.append(BatchRotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backups))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records: queue.Queue = queue.Queue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(dict(sample_rates),
+                                           sample_default))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener = BatchListener(records, *handlers, batch_size=batch_size)
+    listener.start()
+    return listener
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+in-process metrics exposed in prometheus text format
+"""
+import asyncio
+import bisect
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+    2.5, 5)
+
+
+def _labels(names: Sequence[str], values: Sequence[str],
+            extra: str='') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str,
+                 labelnames: Sequence[str]=()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float=1) -> None:
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in sorted(self.values.items()):
+            yield (f'{self.name}{_labels(self.labelnames, labelvalues)} '
+                   f'{value}')
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]=(),
+                 buckets: Sequence[float]=LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # per label values: count per bucket with +Inf last, sum
+        self.values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        try:
+            counts, total = self.values[labelvalues]
+        except KeyError:
+            counts, total = self.values[labelvalues] = (
+                [0] * (len(self.buckets) + 1), [0.0])
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _labels(
+                    self.labelnames, labelvalues, f'le="{bound}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels} {total[0]}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'minikin_requests_total', 'http requests by route, method and status',
+    ('route', 'method', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'minikin_request_seconds', 'http request latency by route',
+    ('route', 'method')))
+LOOKUPS = REGISTRY.register(Counter(
+    'minikin_lookups_total',
+    'slug lookups by the tier that answered them', ('tier',)))
+SHORTENS = REGISTRY.register(Counter(
+    'minikin_shortens_total',
+    'shortened urls by where they were found to be stored already, '
+    'postgres if they were written', ('tier',)))
+REDIS_SECONDS = REGISTRY.register(Histogram(
+    'minikin_redis_seconds', 'redis command latency', ('command',)))
+REDIS_ERRORS = REGISTRY.register(Counter(
+    'minikin_redis_errors_total', 'failed redis commands', ('command',)))
+POSTGRES_SECONDS = REGISTRY.register(Histogram(
+    'minikin_postgres_seconds', 'postgres query latency', ('query',)))
+STATEMENT_SECONDS = REGISTRY.register(Histogram(
+    'minikin_statement_seconds', 'postgres statement latency',
+    ('statement',)))
+POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'minikin_pool_wait_seconds',
+    'time waiting for a postgres connection from the pool'))
+REJECTED = REGISTRY.register(Counter(
+    'minikin_rejected_total',
+    'requests rejected by admission control by route and reason',
+    ('route', 'reason')))
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    'minikin_event_loop_lag_seconds',
+    'delay of the event loop in running a scheduled callback'))
+
+
+def format_stats(prefix: str, stats: Dict[str, float],
+                 labels: str='') -> List[str]:
+    """
+    gauges for the stats of a component, e.g. the hits of a cache
+    """
+    return [f'{prefix}_{key}{labels} {value}' for key, value in stats.items()]
+
+
+async def monitor_loop_lag(interval: float=0.5) -> None:
+    """
+    sample the event loop lag until cancelled
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = time.perf_counter() - start - interval
+        LOOP_LAG_SECONDS.observe(max(lag, 0.0))
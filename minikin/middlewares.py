@@ -3,9 +3,14 @@
 middlewares
 """
 import logging
+import time
 
 from aiohttp import web
 
+from . import codec, metrics
+from .admission import Admission, Overloaded
+from .logs import route_of
+
 
 logger = logging.getLogger('root')
 
@@ -20,7 +25,7 @@ def create_error_middleware(overrides):
             try:
                 return await overrides[exc.status](request)
             except KeyError:
-                return web.json_response(
+                return codec.json_response(
                     {'error': exc.text}, status=exc.status)
         except Exception:
             return await overrides[500](request)
@@ -30,7 +35,7 @@ def create_error_middleware(overrides):
 
 async def handle_404(request) -> web.Response:
     """json response for 404 Not Found"""
-    return web.json_response(
+    return codec.json_response(
         {'error': f'cannot find url {request.url}'}, status=404)
 
 
@@ -42,10 +47,59 @@ async def handle_500(request) -> web.Response:
         'unepxected error for handling request=%s headers=%s body=%s',
         request, request.headers, body
     )
-    return web.json_response({'error': error}, status=500)
+    return codec.json_response({'error': error}, status=500)
 
 
 error_middleware = create_error_middleware({
     404: handle_404,
     500: handle_500
 })
+
+
+def create_admission_middleware(admission: Admission, priorities=None,
+                                default_priority=1, exempt=('/metrics',),
+                                retry_after=1):
+    """
+    limit the requests in flight with admission, requests it rejects get a
+    503. priorities maps routes to their priority, 0 is the highest.
+    """
+    priorities = priorities or {}
+    body = codec.dumps({'error': 'server is busy, please retry later'})
+    headers = {
+        'Content-Type': 'application/json', 'Retry-After': str(retry_after)}
+
+    @web.middleware
+    async def _admission_middleware(request, handler):
+        route = route_of(request)
+        if route in exempt:
+            return await handler(request)
+        try:
+            await admission.acquire(priorities.get(route, default_priority))
+        except Overloaded as exc:
+            metrics.REJECTED.inc(route, exc.reason)
+            return web.Response(status=503, body=body, headers=headers)
+        try:
+            return await handler(request)
+        finally:
+            admission.release()
+
+    return _admission_middleware
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """record count and latency of requests per route"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        route = route_of(request)
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, route, request.method)
+        metrics.REQUESTS.inc(route, request.method, str(status))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+script for moving the cache from the flat to the bucket layout
+
+flat keys are scanned in batches, their urls written to buckets with one
+round trip per batch and, with --delete, the flat keys removed afterwards.
+run the app with --redis-layout bucket --redis-flat-fallback while
+migrating so that slugs are found in either layout, then drop the fallback
+once the flat keys are deleted.
+"""
+import argparse
+import re
+import sys
+import time
+from typing import List, Tuple
+
+import aioredis
+import asyncio
+
+from minikin.layout import BucketRedis
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(
+        description='move cache from flat to bucket layout')
+    parser.add_argument(
+        '--redis', '-r', help='redis uri', dest='redis_uri',
+        default='redis://localhost')
+    parser.add_argument(
+        '--length', type=int, default=7,
+        help='length of the slugs, other keys are left alone')
+    parser.add_argument(
+        '--bucket-prefix', type=int, default=4,
+        help='number of slug characters in the name of a bucket')
+    parser.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='number of keys scanned and written in one round trip')
+    parser.add_argument(
+        '--delete', action='store_true',
+        help='delete flat keys once they are written to buckets')
+    return parser
+
+
+async def migrate_batch(redis, buckets: BucketRedis, keys: List[str],
+                        delete: bool=False, length: int=7) -> int:
+    """
+    copy the flat keys among keys to buckets, returns how many were copied.
+    only keys that are slugs of length are, buckets and the other keys of
+    the app, e.g. the bloom filter, are left alone.
+    """
+    slug = re.compile(f'[0-9a-zA-Z]{{{length}}}')
+    keys = [key for key in keys if slug.fullmatch(key)]
+    if not keys:
+        return 0
+    # keys that aren't strings come back as None and are left alone
+    pairs: List[Tuple[str, str]] = [
+        (key, url) for key, url in zip(keys, await redis.mget(*keys))
+        if url is not None]
+    if not pairs:
+        return 0
+    await buckets.mset(*[item for pair in pairs for item in pair])
+    if delete:
+        await redis.delete(*[key for key, _ in pairs])
+    return len(pairs)
+
+
+async def migrate_cache(redis_uri, bucket_prefix=4, batch_size=1000,
+                        delete=False, length=7):
+    redis = await aioredis.create_redis(redis_uri, encoding='utf-8')
+    buckets = BucketRedis(redis, bucket_prefix)
+    started = time.monotonic()
+    cursor, migrated = None, 0
+    while cursor != 0:
+        cursor, keys = await redis.scan(cursor or 0, count=batch_size)
+        migrated += await migrate_batch(
+            redis, buckets, keys, delete, length)
+        rate = migrated / (time.monotonic() - started or 1)
+        sys.stdout.write(f'\r{migrated} keys {rate:.0f} keys/sec')
+        sys.stdout.flush()
+    sys.stdout.write('\n')
+    redis.close()
+    await redis.wait_closed()
+    print('done!')
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        migrate_cache(args.redis_uri, bucket_prefix=args.bucket_prefix,
+                      batch_size=args.batch_size, delete=args.delete,
+                      length=args.length))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+routing of queries between database pools
+"""
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import time
+import urllib.parse
+from typing import (
+    Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple)
+
+import asyncpg
+from asyncpg.pool import Pool
+
+from . import metrics
+
+logger = logging.getLogger('root')
+
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.InterfaceError,
+)
+
+
+async def _run_on(pool: Pool, func: Callable[..., Awaitable], *args) -> Any:
+    start = time.perf_counter()
+    async with pool.acquire() as connection:
+        acquired = time.perf_counter()
+        metrics.POOL_WAIT_SECONDS.observe(acquired - start)
+        try:
+            return await func(connection, *args)
+        finally:
+            metrics.POSTGRES_SECONDS.observe(
+                time.perf_counter() - acquired, func.__name__)
+
+
+class ReplicaPool:
+    """
+    spread reads over replica pools in turn. replicas failing a health
+    check or a query are skipped until they pass a check again, the primary
+    serves reads when no replica is healthy. with fallback_on_miss a read
+    that finds nothing on a replica is tried again on the primary in case
+    the replica is lagging behind.
+    """
+
+    def __init__(self, primary: Pool, replicas: List[Pool],
+                 fallback_on_miss: bool=False, check_interval: float=5,
+                 check_timeout: float=1) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.fallback_on_miss = fallback_on_miss
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.healthy = list(replicas)
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Future] = None
+
+    def choose(self) -> Pool:
+        healthy = self.healthy
+        if not healthy:
+            return self.primary
+        return healthy[next(self._turn) % len(healthy)]
+
+    def acquire(self, *, timeout=None):
+        return self.choose().acquire(timeout=timeout)
+
+    def mark_unhealthy(self, replica: Pool) -> None:
+        if replica in self.healthy:
+            logger.warning('replica %s is unavailable', replica)
+            self.healthy = [r for r in self.healthy if r is not replica]
+
+    async def run(self, func: Callable[..., Awaitable], *args) -> Any:
+        """
+        run func(connection, *args) on a replica connection
+        """
+        pool = self.choose()
+        try:
+            result = await _run_on(pool, func, *args)
+        except CONNECTION_ERRORS:
+            if pool is self.primary:
+                raise
+            self.mark_unhealthy(pool)
+            result = None
+        else:
+            if result is not None or not self.fallback_on_miss:
+                return result
+        if pool is self.primary:
+            return result
+        return await _run_on(self.primary, func, *args)
+
+    async def check(self) -> None:
+        healthy = []
+        for replica in self.replicas:
+            try:
+                async with replica.acquire(
+                        timeout=self.check_timeout) as connection:
+                    await connection.fetchval(
+                        'SELECT 1', timeout=self.check_timeout)
+            except CONNECTION_ERRORS:
+                continue
+            healthy.append(replica)
+        for replica in healthy:
+            if replica not in self.healthy:
+                logger.info('replica %s is available', replica)
+        self.healthy = healthy
+
+    async def _run_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception('error checking replicas')
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run_checks())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.gather(*[replica.close() for replica in self.replicas])
+
+
+class ShardRouter:
+    """
+    map slugs to shard pools with a consistent hash ring. each shard owns
+    many points on the ring so adding a shard only moves about 1/n of the
+    slugs. while resharding, pass the old layout as previous and lookups
+    that miss on the new shard are tried on the old one.
+    """
+
+    def __init__(self, shards: Dict[str, Pool], points: int=128,
+                 previous: 'ShardRouter'=None) -> None:
+        if not shards:
+            raise ValueError('at least one shard is required')
+        self.shards = shards
+        self.previous = previous
+        ring = sorted(
+            (self.hash(f'{name}:{i}'), name)
+            for name in shards for i in range(points))
+        self._hashes = [point for point, _ in ring]
+        self._names = [name for _, name in ring]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(
+            hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def shard_for(self, slug: str) -> str:
+        index = bisect.bisect(self._hashes, self.hash(slug))
+        return self._names[index % len(self._names)]
+
+    def pool_for(self, slug: str) -> Pool:
+        return self.shards[self.shard_for(slug)]
+
+    def split(self, rows: Iterable[Sequence]) -> Dict[str, List]:
+        """
+        group rows starting with a slug by shard name
+        """
+        groups: Dict[str, List] = {}
+        for row in rows:
+            groups.setdefault(self.shard_for(row[0]), []).append(row)
+        return groups
+
+    async def run(self, slug: str, func: Callable[..., Awaitable], *args,
+                  read: bool=False) -> Any:
+        pool = self.pool_for(slug)
+        result = await run_query(pool, func, *args)
+        if read and result is None and self.previous is not None:
+            old = self.previous.pool_for(slug)
+            if old is not pool:
+                result = await run_query(old, func, *args)
+        return result
+
+    async def close(self) -> None:
+        pools = list(self.shards.values())
+        if self.previous is not None:
+            pools.extend(self.previous.shards.values())
+        await asyncio.gather(*[pool.close() for pool in set(pools)])
+
+
+async def run_query(pool: Pool, func: Callable[..., Awaitable], *args,
+                    slug: Optional[str]=None, read: bool=False) -> Any:
+    """
+    run func(connection, *args) with a connection from pool. a ShardRouter
+    runs it on the shard owning slug, a read returning None is tried again
+    on the shard of the previous layout.
+    """
+    if isinstance(pool, ShardRouter):
+        if slug is None:
+            raise ValueError('a slug is needed to pick the shard')
+        return await pool.run(slug, func, *args, read=read)
+    if isinstance(pool, ReplicaPool):
+        return await pool.run(func, *args)
+    return await _run_on(pool, func, *args)
+
+
+async def run_rows(pool: Pool, func: Callable[..., Awaitable],
+                   rows: List[Tuple]) -> None:
+    """
+    run func(connection, rows) for rows starting with a slug, split between
+    shards by a ShardRouter
+    """
+    if isinstance(pool, ShardRouter):
+        await asyncio.gather(*[
+            run_query(pool.shards[name], func, group)
+            for name, group in pool.split(rows).items()])
+    else:
+        await run_query(pool, func, rows)
+
+
+def primary_pools(pool: Pool) -> List[Pool]:
+    """
+    the pools holding all the data
+    """
+    if isinstance(pool, ShardRouter):
+        return list(pool.shards.values())
+    if isinstance(pool, ReplicaPool):
+        return [pool.primary]
+    return [pool]
+
+
+def stored_pools(pool: Pool) -> List[Pool]:
+    """
+    the pools holding all the data, with the shards of the previous layout
+    while rows are being moved off them
+    """
+    pools = primary_pools(pool)
+    if isinstance(pool, ShardRouter) and pool.previous is not None:
+        pools.extend(shard for shard in pool.previous.shards.values()
+                     if shard not in pools)
+    return pools
+
+
+def dsn_options(dsn: str, database: str=None,
+                user: str=None) -> Dict[str, str]:
+    """
+    database and user to connect to dsn with, the ones in the dsn win over
+    the defaults given
+    """
+    parsed = urllib.parse.urlparse(dsn)
+    query = urllib.parse.parse_qs(parsed.query)
+    options = {}
+    if database and not parsed.path.strip('/') and \
+            'dbname' not in query and 'database' not in query:
+        options['database'] = database
+    if user and not parsed.username and 'user' not in query:
+        options['user'] = user
+    return options
+
+
+def parse_shard(value: str) -> Tuple[str, str]:
+    """
+    parse a shard given as name=dsn
+    """
+    name, sep, dsn = value.partition('=')
+    if not sep or not name or not dsn:
+        raise ValueError(f'expected name=dsn, got {value}')
+    return name, dsn
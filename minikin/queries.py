@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+sql statements run on every request
+
+asyncpg prepares a statement the first time its text is run on a connection
+and reuses the prepared statement afterwards, so each statement is kept as
+one constant and run through execute or fetchval, which also time it.
+"""
+import time
+from typing import Any
+
+from . import metrics
+
+STATEMENTS = {
+    'select_url': 'SELECT url FROM short_url WHERE slug = $1',
+    # do an upsert and ignore hash collision as the probability
+    # is extremely low, however, if collision is to be eliminated
+    # completely, it can be done in sacrifice of efficiency.
+    'insert_url': (
+        'INSERT INTO short_url(slug, url) VALUES($1, $2) '
+        'ON CONFLICT (slug) DO NOTHING'),
+    'insert_many': (
+        'INSERT INTO short_url(slug, url) '
+        'SELECT * FROM unnest($1::text[], $2::text[]) '
+        'ON CONFLICT (slug) DO NOTHING'),
+    'upsert_clicks': (
+        'INSERT INTO click(slug, clicks, last_click) '
+        'SELECT * FROM unnest($1::text[], $2::bigint[], $3::timestamptz[]) '
+        'ON CONFLICT (slug) DO UPDATE SET '
+        'clicks = click.clicks + EXCLUDED.clicks, '
+        'last_click = GREATEST(click.last_click, EXCLUDED.last_click)'),
+    'select_clicks': (
+        'SELECT clicks, last_click FROM click WHERE slug = $1'),
+}
+
+
+async def execute(connection, name: str, *args) -> str:
+    start = time.perf_counter()
+    try:
+        return await connection.execute(STATEMENTS[name], *args)
+    finally:
+        metrics.STATEMENT_SECONDS.observe(time.perf_counter() - start, name)
+
+
+async def fetchval(connection, name: str, *args) -> Any:
+    start = time.perf_counter()
+    try:
+        return await connection.fetchval(STATEMENTS[name], *args)
+    finally:
+        metrics.STATEMENT_SECONDS.observe(time.perf_counter() - start, name)
+
+
+async def fetchrow(connection, name: str, *args) -> Any:
+    start = time.perf_counter()
+    try:
+        return await connection.fetchrow(STATEMENTS[name], *args)
+    finally:
+        metrics.STATEMENT_SECONDS.observe(time.perf_counter() - start, name)
+
+
+# arguments with which a statement can be run without changing anything
+WARM_UP_ARGS = {
+    'select_url': ('',),
+    'insert_many': ([], []),
+}
+
+
+async def warm_up(connection, names=('select_url', 'insert_many')) -> None:
+    """
+    prepare statements on a new connection by running them with harmless
+    arguments, used as the init of a pool
+    """
+    for name in names:
+        await connection.execute(STATEMENTS[name], *WARM_UP_ARGS[name])
+
+
+async def warm_up_reads(connection) -> None:
+    await warm_up(connection, ('select_url',))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+script for moving rows between shards after the shard layout changes
+
+while it runs, start the servers with the new layout as --shard and the old
+one as --previous-shard so that lookups missing on the new shard are tried
+on the old one. rows are copied to their new shard before they are deleted
+from the old one, so every row stays readable throughout.
+"""
+import argparse
+from typing import Dict, List, Tuple
+
+import asyncio
+import asyncpg
+
+from minikin.batch import insert_many
+from minikin.pools import ShardRouter, dsn_options, parse_shard, run_rows
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='move rows between shards')
+    parser.add_argument(
+        'database', nargs='?', help='database name', default='minikin')
+    parser.add_argument(
+        '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--from', dest='source', action='append', type=parse_shard,
+        required=True, help='name=dsn of a shard in the old layout')
+    parser.add_argument(
+        '--to', dest='target', action='append', type=parse_shard,
+        required=True, help='name=dsn of a shard in the new layout')
+    parser.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='number of rows read from a shard at a time')
+    parser.add_argument(
+        '--keep', action='store_true',
+        help='keep moved rows on the old shard')
+    return parser
+
+
+async def move_rows(name: str, pool, router: ShardRouter, batch_size: int,
+                    delete: bool=True) -> int:
+    """
+    copy the rows of shard name that belong elsewhere in router's layout
+    """
+    moved = 0
+    after = ''
+    while True:
+        async with pool.acquire() as connection:
+            records = await connection.fetch(
+                '''
+                SELECT slug, url FROM short_url WHERE slug > $1
+                ORDER BY slug LIMIT $2
+                ''', after, batch_size)
+        if not records:
+            return moved
+        after = records[-1]['slug']
+        rows: List[Tuple[str, str]] = [
+            (record['slug'].strip(), record['url']) for record in records
+            if router.shard_for(record['slug'].strip()) != name]
+        if not rows:
+            continue
+        await run_rows(router, insert_many, rows)
+        if delete:
+            async with pool.acquire() as connection:
+                await connection.execute(
+                    'DELETE FROM short_url WHERE slug = any($1::bpchar[])',
+                    [slug for slug, _ in rows])
+        moved += len(rows)
+
+
+async def reshard(database, user, source, target, batch_size=1000,
+                  delete=True):
+    pools: Dict[str, asyncpg.pool.Pool] = {}
+    for name, dsn in source + target:
+        if name not in pools:
+            pools[name] = await asyncpg.create_pool(
+                dsn, **dsn_options(dsn, database, user))
+    router = ShardRouter({name: pools[name] for name, _ in target})
+    for name, _ in source:
+        moved = await move_rows(
+            name, pools[name], router, batch_size, delete)
+        print(f'moved {moved} rows from shard {name}.')
+    print('done!')
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        reshard(args.database, args.user, args.source, args.target,
+                batch_size=args.batch_size, delete=not args.keep))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+script for restoring a dump of short_url, installed as minikin-restore
+
+the files of a dump made by minikin-dump are copied in in parallel with
+binary COPY. with --redis each file is copied in batches of rows, each
+written to the cache once it is committed, so the cache is rebuilt in the
+same pass, and the shared bloom filter is dropped so the servers load it
+again with the restored slugs. a file that fails half way through keeps
+the batches already committed, restore it again with --skip-existing.
+
+COPY fails on slugs already in the table, restore into an empty table or
+use --skip-existing, which copies into a temporary table first and inserts
+the rows that are new from there.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import zlib
+from typing import AsyncIterator, List
+
+import aioredis
+import asyncio
+import asyncpg
+
+from minikin import bloom, codec
+from minikin.bulk import (
+    BINARY, COLUMNS, HEADER, TRAILER, CopyDecoder, Row, encode_rows,
+    read_manifest)
+from minikin.layout import LAYOUTS, with_layout
+
+CHUNK_SIZE = 1 << 20
+MSET_SIZE = 10000
+# rows copied and committed at a time when the cache is rebuilt too
+BATCH_SIZE = 100000
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='restore short_url')
+    parser.add_argument(
+        'database', nargs='?', help='database name', default='minikin')
+    parser.add_argument(
+        '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--db-host', help='host of the database', default=None)
+    parser.add_argument(
+        '--input', '-i', default='minikin.dump',
+        help='directory of the dump')
+    parser.add_argument(
+        '--workers', type=int, default=4,
+        help='number of files copied in parallel')
+    parser.add_argument(
+        '--skip-existing', action='store_true',
+        help='leave slugs already in the table alone instead of failing')
+    parser.add_argument(
+        '--batch-size', type=int, default=BATCH_SIZE,
+        help='rows copied and committed at a time with --redis')
+    parser.add_argument(
+        '--redis', '-r', dest='redis_uri', default=None,
+        help='redis uri, to also rebuild the cache')
+    parser.add_argument(
+        '--layout', choices=LAYOUTS, default='flat',
+        help='layout of the cache in redis')
+    parser.add_argument(
+        '--bucket-prefix', type=int, default=4,
+        help='number of slug characters in the name of a bucket')
+    return parser
+
+
+async def read_chunks(path: str) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=31)
+    with open(path, 'rb') as fo:
+        while True:
+            chunk = fo.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+def parse_lines(lines: List[bytes]) -> List[Row]:
+    items = [codec.loads(line) for line in lines if line]
+    return [(item['slug'], item['url']) for item in items]
+
+
+async def read_rows(path: str, fmt: str) -> AsyncIterator[List[Row]]:
+    """
+    rows of a dump file, those of one chunk at a time
+    """
+    if fmt == BINARY:
+        decoder = CopyDecoder()
+        async for chunk in read_chunks(path):
+            yield decoder.feed(chunk)
+        return
+    pending = b''
+    async for chunk in read_chunks(path):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield parse_lines(lines)
+    yield parse_lines([pending])
+
+
+async def copy_source(path: str, fmt: str) -> AsyncIterator[bytes]:
+    """
+    binary copy stream of a dump file
+    """
+    if fmt == BINARY:
+        async for chunk in read_chunks(path):
+            yield chunk
+        return
+    yield HEADER
+    async for rows in read_rows(path, fmt):
+        yield encode_rows(rows)
+    yield TRAILER
+
+
+async def batches(path: str, fmt: str,
+                  size: int) -> AsyncIterator[List[Row]]:
+    """
+    rows of a dump file, size at a time
+    """
+    batch: List[Row] = []
+    async for rows in read_rows(path, fmt):
+        batch.extend(rows)
+        while len(batch) >= size:
+            yield batch[:size]
+            del batch[:size]
+    if batch:
+        yield batch
+
+
+async def batch_source(rows: List[Row]) -> AsyncIterator[bytes]:
+    yield HEADER + encode_rows(rows) + TRAILER
+
+
+async def copy_rows(connection, source: AsyncIterator[bytes],
+                    skip_existing: bool=False) -> None:
+    if not skip_existing:
+        await connection.copy_to_table(
+            'short_url', source=source, columns=COLUMNS, format='binary')
+        return
+    async with connection.transaction():
+        await connection.execute(
+            'CREATE TEMPORARY TABLE restore_short_url '
+            '(LIKE short_url) ON COMMIT DROP')
+        await connection.copy_to_table(
+            'restore_short_url', source=source, columns=COLUMNS,
+            format='binary')
+        await connection.execute(
+            'INSERT INTO short_url(slug, url) '
+            'SELECT slug, url FROM restore_short_url '
+            'ON CONFLICT (slug) DO NOTHING')
+
+
+async def write_cache(redis, pairs: List[Row]) -> None:
+    for i in range(0, len(pairs), MSET_SIZE):
+        await redis.mset(
+            *itertools.chain.from_iterable(pairs[i:i + MSET_SIZE]))
+
+
+async def restore_file(connection, path: str, fmt: str=BINARY, redis=None,
+                       skip_existing: bool=False,
+                       batch_size: int=BATCH_SIZE) -> None:
+    """
+    copy a dump file into short_url. with redis it is copied and committed
+    batch_size rows at a time and each batch is written to redis once it
+    is committed, so the cache never has a slug the table doesn't and no
+    more than a batch is held in memory.
+    """
+    if redis is None:
+        await copy_rows(connection, copy_source(path, fmt), skip_existing)
+        return
+    async for batch in batches(path, fmt, batch_size):
+        await copy_rows(connection, batch_source(batch), skip_existing)
+        await write_cache(
+            redis, [(slug, url) for slug, url in batch if url is not None])
+
+
+async def restore_worker(pool, queue: asyncio.Queue, directory: str,
+                         fmt: str, redis, skip_existing: bool,
+                         progress: dict, batch_size: int=BATCH_SIZE) -> None:
+    async with pool.acquire() as connection:
+        while not queue.empty():
+            name = queue.get_nowait()
+            await restore_file(connection, os.path.join(directory, name),
+                               fmt, redis, skip_existing, batch_size)
+            progress['files'] += 1
+            elapsed = time.monotonic() - progress['started']
+            sys.stdout.write(
+                f'\r{progress["files"]}/{progress["total"]} files '
+                f'{elapsed:.0f}s')
+            sys.stdout.flush()
+
+
+async def restore(database, user, directory, workers=4, skip_existing=False,
+                  redis_uri=None, layout='flat', bucket_prefix=4,
+                  db_host=None, batch_size=BATCH_SIZE):
+    manifest = read_manifest(directory)
+    pool = await asyncpg.create_pool(
+        database=database, user=user, host=db_host, min_size=workers,
+        max_size=workers)
+    redis = raw_redis = None
+    if redis_uri:
+        raw_redis = await aioredis.create_redis_pool(
+            redis_uri, encoding='utf-8', minsize=workers, maxsize=workers)
+        redis = with_layout(raw_redis, layout, bucket_prefix)
+        await raw_redis.delete(bloom.KEY)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in manifest['files']:
+        queue.put_nowait(item['name'])
+    progress = {'files': 0, 'total': len(manifest['files']),
+                'started': time.monotonic()}
+    print(f'restoring {progress["total"]} files.')
+    await asyncio.gather(*[
+        restore_worker(pool, queue, directory, manifest['format'], redis,
+                       skip_existing, progress, batch_size)
+        for _ in range(workers)])
+    if raw_redis is not None:
+        # it may have been loaded again while the files were copied in
+        await raw_redis.delete(bloom.KEY)
+    await pool.close()
+    print('\ndone!')
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        restore(args.database, args.user, args.input, workers=args.workers,
+                skip_existing=args.skip_existing, redis_uri=args.redis_uri,
+                layout=args.layout, bucket_prefix=args.bucket_prefix,
+                db_host=args.db_host, batch_size=args.batch_size))
+
+
+if __name__ == '__main__':
+    main()
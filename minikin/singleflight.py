@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+coalesce concurrent calls for the same key
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    run at most one call per key at a time. callers arriving while a call
+    is in flight wait for it and share its result or exception.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable],
+                 *args) -> Any:
+        future = self._flights.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(func(*args))
+            self._flights[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.shared += 1
+        # shield so that a cancelled caller doesn't cancel the call that
+        # the other callers are waiting for
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._flights.get(key) is future:
+            del self._flights[key]
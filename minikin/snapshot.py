@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+read only snapshot of short_url in one memory mapped file
+
+the file is a header, an optional compression dictionary, an index of
+fixed width entries sorted by slug and a blob of urls:
+
+    header  magic, version, flags, slug width, count, dictionary size
+    index   count entries of slug padded with NUL to width and the offset
+            of its url in the blob, an unsigned 64 bit integer
+    blob    urls back to back, the length of one is the offset of the next
+            minus its own
+
+lookups binary search the index in the mapped file, so nothing is read into
+memory up front and processes mapping the same file share its pages in the
+page cache. with compression each url is deflated on its own against a
+dictionary of common url parts stored in the file.
+
+a new snapshot is written next to the old one and moved over it, processes
+serving the old one notice the new file and map it instead.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger('root')
+
+MAGIC = b'MINIKIN\x00'
+VERSION = 1
+COMPRESSED = 1
+HEADER = struct.Struct('<8sBBHQI')
+OFFSET = struct.Struct('<Q')
+MAX_DICTIONARY = 32768
+
+
+class SnapshotWriter:
+    """
+    write slugs and urls, added in ascending order of slug, to path. the
+    index and the blob are written to temporary files as they are added so
+    memory stays constant, and put together at close.
+    """
+
+    def __init__(self, path: str, width: int=7, compress: bool=False,
+                 dictionary: bytes=b'') -> None:
+        self.path = path
+        self.width = width
+        self.compress = compress
+        self.dictionary = dictionary[-MAX_DICTIONARY:] if compress else b''
+        self.count = 0
+        self._size = 0
+        self._last = b''
+        self._index = open(f'{path}.tmp', 'wb')
+        self._index.write(b'\x00' * HEADER.size + self.dictionary)
+        self._blob = open(f'{path}.blob.tmp', 'w+b')
+
+    def add(self, slug: str, url: str) -> None:
+        key = slug.encode('utf-8')
+        if len(key) > self.width:
+            raise ValueError(f'slug {slug} is longer than {self.width}')
+        key = key.ljust(self.width, b'\x00')
+        if key <= self._last:
+            raise ValueError(f'slug {slug} is not after the previous slug')
+        self._last = key
+        data = url.encode('utf-8')
+        if self.compress:
+            compressor = zlib.compressobj(
+                9, zlib.DEFLATED, -15, zdict=self.dictionary)
+            data = compressor.compress(data) + compressor.flush()
+        self._index.write(key + OFFSET.pack(self._size))
+        self._blob.write(data)
+        self._size += len(data)
+        self.count += 1
+
+    def close(self) -> None:
+        self._blob.seek(0)
+        while True:
+            chunk = self._blob.read(1 << 20)
+            if not chunk:
+                break
+            self._index.write(chunk)
+        self._index.seek(0)
+        self._index.write(HEADER.pack(
+            MAGIC, VERSION, COMPRESSED if self.compress else 0, self.width,
+            self.count, len(self.dictionary)))
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._index.close()
+        self._blob.close()
+        os.remove(f'{self.path}.blob.tmp')
+        os.replace(f'{self.path}.tmp', self.path)
+
+
+class Snapshot:
+    """
+    lookups in a snapshot file mapped into memory
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as fo:
+            stat = os.fstat(fo.fileno())
+            self.version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.map = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, flags, self.width, self.count, dictionary_size = \
+                HEADER.unpack_from(self.map)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f'{path} is not a snapshot')
+        if hasattr(self.map, 'madvise'):
+            # lookups jump around the file, reading ahead is wasted
+            self.map.madvise(mmap.MADV_RANDOM)
+        self._index = HEADER.size + dictionary_size
+        self._entry = self.width + OFFSET.size
+        self._blob = self._index + self.count * self._entry
+        self.dictionary = None
+        if flags & COMPRESSED:
+            self.dictionary = bytes(self.map[HEADER.size:self._index])
+
+    def _url_range(self, position: int) -> Tuple[int, int]:
+        start = OFFSET.unpack_from(self.map, position + self.width)[0]
+        following = position + self._entry
+        if following < self._blob:
+            end = OFFSET.unpack_from(self.map, following + self.width)[0]
+        else:
+            end = len(self.map) - self._blob
+        return self._blob + start, self._blob + end
+
+    def get(self, slug: str) -> Optional[str]:
+        key = slug.encode('utf-8').ljust(self.width, b'\x00')
+        if len(key) != self.width:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = self._index + middle * self._entry
+            found = self.map[position:position + self.width]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                start, end = self._url_range(position)
+                data = self.map[start:end]
+                if self.dictionary is not None:
+                    decompressor = zlib.decompressobj(
+                        -15, zdict=self.dictionary)
+                    data = decompressor.decompress(data)
+                return data.decode('utf-8')
+        return None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self.map.close()
+
+
+class LiveSnapshot:
+    """
+    the snapshot at path, swapped for a new one when the file is replaced
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.current = Snapshot(path)
+        self.swaps = 0
+
+    def get(self, slug: str) -> Optional[str]:
+        return self.current.get(slug)
+
+    def reload(self) -> bool:
+        """
+        map the file again if it has changed, returns whether it had
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == \
+                self.current.version:
+            return False
+        previous, self.current = self.current, Snapshot(self.path)
+        # lookups don't wait on anything, so none is using previous now
+        previous.close()
+        self.swaps += 1
+        logger.info('loaded snapshot %s of %d slugs',
+                    self.path, len(self.current))
+        return True
+
+    async def watch(self, interval: float=5) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('error loading snapshot %s', self.path)
+
+    def stats(self) -> Dict[str, int]:
+        return {'slugs': len(self.current), 'swaps': self.swaps}
+
+    def close(self) -> None:
+        self.current.close()
@@ -2,12 +2,19 @@
 """
 utility functions
 """
+import codecs
 import hashlib
+import json
 import string
+from typing import AsyncIterator, List
 from urllib.parse import urlparse
 
 import validators
 
+from . import codec
+
+NUMBER_CHARS = frozenset('0123456789.eE+-')
+
 
 def base62_encode(num: int) -> str:
     """
@@ -43,3 +50,84 @@ def validate_url(url: str) -> str:
     if not validators.url(url):
         raise ValueError
     return url
+
+
+async def iter_json_batches(
+        stream, max_size: int=500,
+        max_item_size: int=65536) -> AsyncIterator[List]:
+    """
+    read a json array or newline delimited json from a stream with an
+    async readany method and yield the values decoded from each chunk as
+    a list of at most max_size. a value that can't be decoded is yielded
+    as the ValueError raised for it, decoding stops there for a json
+    array, as it does at the end of an array missing its ]. only the
+    incomplete tail of the body is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    array = None
+    finished = False
+    while not finished:
+        chunk = await stream.readany()
+        eof = not chunk
+        try:
+            buffer += utf8.decode(chunk, final=eof)
+        except UnicodeDecodeError as exc:
+            yield [exc]
+            return
+        if array is None:
+            buffer = buffer.lstrip()
+            if not buffer and not eof:
+                continue
+            array = buffer.startswith('[')
+            if array:
+                buffer = buffer[1:]
+        values: List = []
+        if array:
+            while True:
+                buffer = buffer.lstrip().lstrip(',').lstrip()
+                if buffer.startswith(']'):
+                    finished = True
+                    break
+                if not buffer:
+                    if eof:
+                        values.append(ValueError('unterminated json array'))
+                    break
+                try:
+                    value, end = decoder.raw_decode(buffer)
+                except ValueError as exc:
+                    if eof or len(buffer) > max_item_size:
+                        values.append(exc)
+                        finished = True
+                    break
+                # a value is only complete once a delimiter follows it, a
+                # number split at . or e goes on in the next chunk
+                rest = buffer[end:].lstrip()
+                if rest[:1] not in (',', ']'):
+                    incomplete = not rest or buffer[end] in NUMBER_CHARS
+                    if incomplete and not eof and \
+                            len(buffer) <= max_item_size:
+                        break
+                    values.append(ValueError('expected , or ] after a value'))
+                    finished = True
+                    break
+                values.append(value)
+                buffer = rest
+        else:
+            lines = buffer.split('\n')
+            buffer = '' if eof else lines.pop()
+            if len(buffer) > max_item_size:
+                lines.append(buffer)
+                buffer = ''
+                finished = True
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    values.append(codec.loads(line))
+                except ValueError as exc:
+                    values.append(exc)
+        finished = finished or eof
+        for i in range(0, len(values), max_size):
+            yield values[i:i + max_size]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+warm up of a newly started process
+
+the slugs expected to be the hottest, one per line in a file, are looked up
+so their redirects are in the local cache before the load balancer sends
+traffic to the process. /ready reports when this is done.
+"""
+import asyncio
+import logging
+import time
+from typing import List
+
+from . import db
+from .handlers import redirect_parts
+
+logger = logging.getLogger('root')
+
+
+def read_slugs(path: str, limit: int) -> List[str]:
+    slugs = []
+    with open(path) as fo:
+        for line in fo:
+            slug = line.strip()
+            if slug:
+                slugs.append(slug)
+                if len(slugs) >= limit:
+                    break
+    return slugs
+
+
+async def preload(app, slugs: List[str], concurrency: int=50) -> int:
+    """
+    look slugs up and keep their redirects in the local cache, returns the
+    number found
+    """
+    cache = app.get('cache')
+    found = 0
+
+    async def _load(slug):
+        nonlocal found
+        try:
+            url = await db.get_url(
+                app.get('read_pool', app['pool']), slug, app['redis'],
+                bloom=app.get('bloom'), negative=app.get('negative'))
+        except db.URLNotFound:
+            return
+        found += 1
+        if cache is not None:
+            cache.set(slug, redirect_parts(url))
+
+    for i in range(0, len(slugs), concurrency):
+        await asyncio.gather(*[
+            _load(slug) for slug in slugs[i:i + concurrency]])
+    return found
+
+
+async def warm_up(app, path: str, limit: int) -> None:
+    start = time.perf_counter()
+    try:
+        slugs = read_slugs(path, limit)
+        found = await preload(app, slugs)
+        logger.info('warmed up %d of %d slugs in %.1fs', found, len(slugs),
+                    time.perf_counter() - start)
+    except Exception:
+        logger.exception('error warming up from %s', path)
+    app['ready'].set()
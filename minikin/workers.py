@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+run several worker processes sharing one listening socket
+
+the supervisor opens the socket and starts each worker as a fresh python
+process that inherits the socket's file descriptor. the kernel spreads
+incoming connections between the workers.
+
+signals handled by the supervisor:
+- SIGHUP: graceful reload, start new workers and then stop the old ones
+- SIGTERM, SIGINT: stop the workers and exit
+"""
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('root')
+
+
+def create_socket(path: Optional[str]=None,
+                  port: Optional[int]=None) -> socket.socket:
+    """
+    listening socket on a unix path or on all interfaces at port
+    """
+    if path:
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', int(port or 8080)))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """
+    keep number of worker processes running, restart any that exits.
+    """
+
+    def __init__(self, sock: socket.socket, argv: List[str], number: int,
+                 stop_timeout: float=30, restart_delay: float=1) -> None:
+        self.sock = sock
+        self.argv = argv
+        self.number = number
+        self.stop_timeout = stop_timeout
+        self.restart_delay = restart_delay
+        self.workers: Dict[subprocess.Popen, float] = {}
+        self._stopping = False
+        self._reloading = False
+
+    def command(self) -> List[str]:
+        return [
+            sys.executable, '-m', 'minikin.app', *self.argv,
+            '--workers', '1', '--fd', str(self.sock.fileno())
+        ]
+
+    def spawn(self) -> subprocess.Popen:
+        process = subprocess.Popen(
+            self.command(), pass_fds=(self.sock.fileno(),))
+        self.workers[process] = time.monotonic()
+        logger.info('started worker pid=%s', process.pid)
+        return process
+
+    def stop(self, workers: List[subprocess.Popen]) -> None:
+        """
+        ask workers to shut down gracefully and kill those that don't
+        """
+        for process in workers:
+            process.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for process in workers:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            self.workers.pop(process, None)
+
+    def reload(self) -> None:
+        old = list(self.workers)
+        for _ in range(self.number):
+            self.spawn()
+        self.stop(old)
+        logger.info('reloaded %d workers', self.number)
+
+    def check(self) -> None:
+        """
+        replace the workers that have exited
+        """
+        for process, started in list(self.workers.items()):
+            if process.poll() is None:
+                continue
+            del self.workers[process]
+            logger.warning('worker pid=%s exited with code %s',
+                           process.pid, process.returncode)
+            if time.monotonic() - started < self.restart_delay:
+                # don't restart in a tight loop if workers die at startup
+                time.sleep(self.restart_delay)
+            self.spawn()
+
+    def _on_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _on_reload(self, signum, frame) -> None:
+        self._reloading = True
+
+    def run(self, interval: float=0.5) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for _ in range(self.number):
+            self.spawn()
+        while not self._stopping:
+            if self._reloading:
+                self._reloading = False
+                self.reload()
+            self.check()
+            time.sleep(interval)
+        self.stop(list(self.workers))
+        self.sock.close()
@@ -4,5 +4,11 @@ setup(
     name='minikin',
     packages=['minikin'],
     include_package_data=True,
-    author='cliff xuan'
+    author='cliff xuan',
+    entry_points={
+        'console_scripts': [
+            'minikin-dump=minikin.dump:main',
+            'minikin-restore=minikin.restore:main',
+        ],
+    },
 )
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+in-memory stand-ins for postgres and redis, with optional simulated
+round trip latency
+"""
+import asyncio
+from typing import Dict, Optional
+
+from tests.unit.helpers import FakeConnection
+
+
+class MemoryConnection(FakeConnection):
+    """
+    a connection to a dict of slug -> url. queries are told apart by their
+    arguments rather than their sql.
+    """
+
+    def __init__(self, rows: Dict[str, str], latency: float=0) -> None:
+        super().__init__()
+        self.rows = rows
+        self.latency = latency
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def execute(self, query, *args, **kw):
+        await self._round_trip()
+        if args and isinstance(args[0], list):
+            pairs = zip(*args)
+        else:
+            pairs = [args[:2]]
+        for slug, url in pairs:
+            self.rows.setdefault(slug, url)
+
+    async def cursor(self, query, *args, **kw):
+        for slug in list(self.rows):
+            yield {'slug': slug}
+
+    async def fetchval(self, query, *args, **kw):
+        await self._round_trip()
+        return self.rows.get(args[0]) if args else 1
+
+
+class MemoryPool:
+
+    def __init__(self, rows: Optional[Dict[str, str]]=None,
+                 latency: float=0) -> None:
+        self.rows = {} if rows is None else rows
+        self.latency = latency
+
+    def acquire(self, *, timeout=None):
+        return MemoryConnection(self.rows, self.latency)
+
+    def get_size(self) -> int:
+        return 1
+
+    def get_idle_size(self) -> int:
+        return 1
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRedis:
+
+    def __init__(self, latency: float=0) -> None:
+        self.data: Dict[str, str] = {}
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.latency = latency
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get(self, key):
+        await self._round_trip()
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        await self._round_trip()
+        self.data[key] = value
+        return True
+
+    async def mset(self, *pairs):
+        await self._round_trip()
+        self.data.update(zip(pairs[::2], pairs[1::2]))
+        return True
+
+    async def hget(self, key, field):
+        await self._round_trip()
+        return self.hashes.get(key, {}).get(field)
+
+    async def hset(self, key, field, value):
+        await self._round_trip()
+        self.hashes.setdefault(key, {})[field] = value
+        return 1
+
+    async def hmset(self, key, *pairs):
+        await self._round_trip()
+        self.hashes.setdefault(key, {}).update(zip(pairs[::2], pairs[1::2]))
+        return True
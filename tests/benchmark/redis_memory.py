@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+memory used by the cache in redis in the flat and the bucket layout
+
+writes the same slugs in each layout to an empty redis database and reports
+the used memory per slug. it needs a running redis and flushes the database
+given with --db before and after each layout.
+
+run from the repository root:
+    python -m tests.benchmark.redis_memory --slugs 1000000
+"""
+import argparse
+import json
+
+import aioredis
+import asyncio
+
+from minikin.layout import BUCKET, FLAT, with_layout
+from minikin.utils import generate_slug
+
+LENGTH = 7
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(
+        description='compare memory of redis cache layouts')
+    parser.add_argument(
+        '--redis', '-r', dest='redis_uri', default='redis://localhost',
+        help='redis uri')
+    parser.add_argument(
+        '--db', type=int, default=15,
+        help='redis database to use, it is flushed')
+    parser.add_argument(
+        '--slugs', '-n', type=int, default=1000000,
+        help='number of slugs written')
+    parser.add_argument(
+        '--bucket-prefix', type=int, nargs='+', default=[3, 4],
+        help='bucket prefixes to measure')
+    parser.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='number of slugs written in one round trip')
+    return parser
+
+
+async def used_memory(redis) -> int:
+    info = await redis.info('memory')
+    return int(info['memory']['used_memory'])
+
+
+async def measure(redis, layout: str, prefix: int, slugs: int,
+                  batch_size: int) -> dict:
+    await redis.flushdb()
+    before = await used_memory(redis)
+    cache = with_layout(redis, layout, prefix)
+    for start in range(0, slugs, batch_size):
+        pairs = []
+        for i in range(start, min(start + batch_size, slugs)):
+            url = f'https://bench.minik.in/{i}'
+            pairs += [generate_slug(url, LENGTH), url]
+        await cache.mset(*pairs)
+    used = await used_memory(redis) - before
+    keys = await redis.dbsize()
+    await redis.flushdb()
+    return {
+        'keys': keys,
+        'used_memory': used,
+        'bytes_per_slug': round(used / slugs, 1),
+    }
+
+
+async def run(args) -> dict:
+    redis = await aioredis.create_redis(
+        args.redis_uri, db=args.db, encoding='utf-8')
+    results = {FLAT: await measure(
+        redis, FLAT, 0, args.slugs, args.batch_size)}
+    for prefix in args.bucket_prefix:
+        results[f'{BUCKET}_{prefix}'] = await measure(
+            redis, BUCKET, prefix, args.slugs, args.batch_size)
+    redis.close()
+    await redis.wait_closed()
+    return results
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    results = asyncio.get_event_loop().run_until_complete(run(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
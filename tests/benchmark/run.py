@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+in-process benchmark of minikin
+
+runs the aiohttp app from minikin.app.init_app against in-memory stand-ins
+of postgres and redis, or against a local database and redis with
+--database, and writes the results as json for comparing runs.
+
+run from the repository root:
+    python -m tests.benchmark.run --output before.json
+    python -m tests.benchmark.run --output after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import timeit
+from typing import Dict, List
+
+import asyncio
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer, make_mocked_request
+
+from minikin import db, handlers
+from minikin.app import init_app
+from minikin.layout import LAYOUTS
+from minikin.utils import generate_slug, validate_url
+from tests.benchmark.fakes import MemoryPool, MemoryRedis
+
+LENGTH = 7
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='run benchmarks')
+    parser.add_argument(
+        '--requests', '-n', type=int, default=20000,
+        help='number of http requests in the traffic mix')
+    parser.add_argument(
+        '--concurrency', '-c', type=int, default=100,
+        help='number of concurrent http clients')
+    parser.add_argument(
+        '--corpus', type=int, default=10000,
+        help='number of urls stored before the run')
+    parser.add_argument(
+        '--pg-latency', type=float, default=0,
+        help='simulated postgres round trip in milliseconds')
+    parser.add_argument(
+        '--redis-latency', type=float, default=0,
+        help='simulated redis round trip in milliseconds')
+    parser.add_argument(
+        '--cache-size', type=int, default=10000,
+        help='size of the in-process cache')
+    parser.add_argument(
+        '--database', default=None,
+        help='benchmark against this local database instead of stand-ins')
+    parser.add_argument(
+        '--user', '-u', help='database user', default='postgres')
+    parser.add_argument(
+        '--redis', '-r', dest='redis_uri', default='redis://localhost',
+        help='redis uri used with --database')
+    parser.add_argument(
+        '--redis-layout', choices=LAYOUTS, default='flat',
+        help='layout of the cache in redis')
+    parser.add_argument(
+        '--output', '-o', default=None, help='file to write results to')
+    parser.add_argument(
+        '--compare', default=None, help='results of a previous run')
+    return parser
+
+
+def summarise(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """
+    throughput and latency percentiles in milliseconds
+    """
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        'count': len(ordered),
+        'ops_per_sec': len(ordered) / elapsed if elapsed else 0,
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def micro(func, args_list: List, repeat: int=5) -> Dict[str, float]:
+    """
+    best of repeat runs of func over args_list
+    """
+    best = min(timeit.repeat(
+        lambda: [func(*args) for args in args_list],
+        number=1, repeat=repeat))
+    return {
+        'count': len(args_list),
+        'ops_per_sec': len(args_list) / best,
+        'mean_ms': best / len(args_list) * 1000,
+    }
+
+
+async def bench_redirect_handler(app, slugs: List[str]) -> Dict[str, float]:
+    """
+    the redirect handler called directly, without http
+    """
+    latencies = []
+    start = time.perf_counter()
+    for slug in slugs:
+        request = make_mocked_request(
+            'GET', f'/{slug}', match_info={'slug': slug}, app=app)
+        begin = time.perf_counter()
+        await handlers.get_url(request)
+        latencies.append(time.perf_counter() - begin)
+    return summarise(latencies, time.perf_counter() - start)
+
+
+async def bench_traffic_mix(app, found: List[str], requests: int,
+                            concurrency: int) -> Dict[str, Dict]:
+    """
+    80% redirects of stored slugs, 10% unknown slugs, 10% shortening
+    """
+    rng = random.Random(0)
+    operations = []
+    for i in range(requests):
+        kind = {0: 'shorten_url', 1: 'not_found'}.get(i % 10, 'found')
+        operations.append(kind)
+    rng.shuffle(operations)
+    latencies: Dict[str, List[float]] = {kind: [] for kind in operations}
+    errors = 0
+    server = TestServer(app)
+    await server.start_server()
+    base = str(server.make_url(''))
+    queue = iter(operations)
+
+    async def _client(session):
+        nonlocal errors
+        for kind in queue:
+            begin = time.perf_counter()
+            if kind == 'found':
+                rsp = await session.get(
+                    f'{base}/{rng.choice(found)}', allow_redirects=False)
+                ok = rsp.status == 302
+            elif kind == 'not_found':
+                slug = generate_slug(f'missing-{rng.random()}', LENGTH)
+                rsp = await session.get(
+                    f'{base}/{slug}', allow_redirects=False)
+                ok = rsp.status == 404
+            else:
+                rsp = await session.post(
+                    f'{base}/shorten_url',
+                    data=json.dumps({'url': f'https://new.minik.in/'
+                                            f'{rng.random()}'}))
+                ok = rsp.status == 201
+            await rsp.read()
+            latencies[kind].append(time.perf_counter() - begin)
+            errors += not ok
+
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*[_client(session) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    await server.close()
+    results = {
+        f'mix_{kind}': summarise(values, elapsed)
+        for kind, values in latencies.items()}
+    results['mix_total'] = summarise(
+        [value for values in latencies.values() for value in values],
+        elapsed)
+    results['mix_total']['errors'] = errors
+    return results
+
+
+async def seed(app, corpus: int) -> List[str]:
+    urls = [f'https://bench.minik.in/{i}' for i in range(corpus)]
+    slugs = []
+    for i in range(0, len(urls), 1000):
+        slugs.extend(await db.shorten_urls(
+            app['pool'], urls[i:i + 1000], LENGTH, app['redis']))
+    return slugs
+
+
+async def run(args) -> Dict[str, Dict]:
+    options = {'cache_size': args.cache_size,
+               'redis_layout': args.redis_layout}
+    if args.database is None:
+        options['pool'] = MemoryPool(latency=args.pg_latency / 1000)
+        options['redis'] = MemoryRedis(latency=args.redis_latency / 1000)
+    app = await init_app(
+        args.database, args.user, args.redis_uri, LENGTH,
+        'http://localhost:8080', **options)
+    slugs = await seed(app, args.corpus)
+    urls = [(f'https://bench.minik.in/{i}', LENGTH) for i in range(10000)]
+    results = {
+        'generate_slug': micro(generate_slug, urls),
+        'validate_url': micro(validate_url, [(url,) for url, _ in urls]),
+        'redirect_handler': await bench_redirect_handler(app, slugs),
+    }
+    results.update(await bench_traffic_mix(
+        app, slugs, args.requests, args.concurrency))
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    print(f'{"benchmark":<24}{"metric":<14}{"before":>12}{"after":>12}'
+          f'{"change":>10}')
+    for name, values in results.items():
+        for metric in ('ops_per_sec', 'p99_ms'):
+            if metric not in values or metric not in baseline.get(name, {}):
+                continue
+            before, after = baseline[name][metric], values[metric]
+            change = (after - before) / before * 100 if before else 0
+            print(f'{name:<24}{metric:<14}{before:>12.2f}{after:>12.2f}'
+                  f'{change:>+9.1f}%')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(run(args))
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'storage': 'local' if args.database else 'memory',
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as fo:
+            compare(results, json.load(fo)['results'])
+    else:
+        print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as fo:
+            json.dump(report, fo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
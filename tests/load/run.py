@@ -1,85 +1,324 @@
 # -*- coding: utf-8 -*-
 """
-load test using locustio in distributed mode
+load test using an asyncio http client
+
+closed loop mode keeps --concurrency requests in flight. open loop mode
+sends --rate requests per second on a fixed schedule whatever the response
+times are, and measures latency from the scheduled send time so that a
+slow server can't hide its queueing delay. load can be spread over several
+processes with --processes.
+
+requests are generated with the traffic mix of locustfile.py from a slug
+corpus, or replayed from a request log with --replay. a log line is either
+"METHOD PATH [BODY]" or an nginx access log line.
 """
 import argparse
+import json
+import multiprocessing
 import os
-import subprocess
+import random
+import re
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import asyncio
+import aiohttp
+import uvloop
+
+from minikin.utils import generate_slug
 
 PWD = os.path.abspath(os.path.dirname(__file__))
+NGINX_REQUEST = re.compile(r'"(GET|POST) (\S+) HTTP/[\d.]+"')
 
 
 def argument_parser():
-    default_locustfile = os.path.join(PWD, 'locustfile.py')
-    parser = argparse.ArgumentParser(description='run locust load test')
-    parser.add_argument(
-        '--file', '-f',
-        dest='locustfile',
-        help=f'locust file default to {default_locustfile}',
-        default=default_locustfile
-    )
+    parser = argparse.ArgumentParser(description='run load test')
     parser.add_argument(
         '--host', '-t', help='host of server under test',
         default='http://localhost:8080')
     parser.add_argument(
-        '--web', action='store_true',
-        help='run with web UI')
+        '--processes', '-n', type=int, default=1,
+        help='number of load generating processes')
+    parser.add_argument(
+        '--concurrency', '-c', type=int, default=100,
+        help='number of requests in flight in closed loop mode')
+    parser.add_argument(
+        '--rate', type=float, default=None,
+        help='requests per second, switches to open loop mode')
     parser.add_argument(
-        '--num', '-n', type=int,
-        help='number of slaves', default=2)
+        '--max-inflight', type=int, default=10000,
+        help='requests in flight before open loop mode drops requests')
     parser.add_argument(
-        '--concurrency', '-c', help='number of concurrent users',
-        default=1000)
+        '--duration', '-d', type=float, default=30,
+        help='seconds to run for')
     parser.add_argument(
-        '--hatch-rate', '-r', help='hatch rate',
-        default=1000)
+        '--slugs', default=os.path.join(PWD, 'slugs'),
+        help='slug corpus in the format of psql output')
+    parser.add_argument(
+        '--replay', default=None, help='request log to replay')
     return parser
 
 
-def run(locustfile, host, num, web, concurrency, hatch_rate):
-    if web:
-        master = subprocess.Popen([
-            'locust', '-f', locustfile, f'--host={host}', '--master'])
+class Histogram:
+    """
+    log-linear histogram of latencies in microseconds, within 1% of the
+    true value, in the spirit of HdrHistogram. histograms from different
+    processes can be merged.
+    """
 
-        slaves = [
-            subprocess.Popen([
-                'locust', '-f', locustfile,
-                f'--host={host}', '--slave',
-                '--master-host=localhost'
-            ])
-            for i in range(num)
-        ]
-    else:
-        master = subprocess.Popen([
-            'locust', '-f', locustfile, '--no-web',
-            '-c', f'{concurrency}', '-r', f'{hatch_rate}',
-            f'--host={host}', '--master',
-            f'--expect-slaves={num}'
-        ])
-
-        slaves = [
-            subprocess.Popen([
-                'locust', '-f', locustfile,
-                f'--host={host}', '--slave',
-                '--master-host=localhost'
-            ])
-            for i in range(num)
-        ]
+    SUB_BUCKETS = 128
+
+    def __init__(self, counts: Optional[Dict[int, int]]=None) -> None:
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    def _index(self, value: int) -> int:
+        if value < 2 * self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BUCKETS.bit_length()
+        return shift * self.SUB_BUCKETS + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        lowest = (index - shift * self.SUB_BUCKETS) << shift
+        return lowest + (1 << shift) // 2
+
+    def record(self, seconds: float) -> None:
+        index = self._index(max(0, int(seconds * 1000000)))
+        self.counts[index] = self.counts.get(index, 0) + 1
+
+    def merge(self, other: 'Histogram') -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def percentile(self, p: float) -> float:
+        """
+        latency in milliseconds at percentile p between 0 and 100
+        """
+        total = self.total
+        if not total:
+            return 0
+        rank = max(1, int(round(total * p / 100)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self._value(index) / 1000
+        return self._value(max(self.counts)) / 1000
+
+
+def read_slugs(path: str) -> List[str]:
+    """
+    slugs from `SELECT * FROM short_url` output of psql
+    """
+    with open(path) as fo:
+        return [row.split('|')[0].strip()
+                for row in fo.readlines()[2:-2]]  # ommit header and footer
+
+
+def read_log(path: str) -> List[Tuple[str, str, Optional[str]]]:
+    requests = []
+    with open(path) as fo:
+        for line in fo:
+            match = NGINX_REQUEST.search(line)
+            if match:
+                requests.append((match.group(1), match.group(2), None))
+                continue
+            parts = line.strip().split(' ', 2)
+            if len(parts) >= 2 and parts[0] in ('GET', 'POST'):
+                body = parts[2] if len(parts) == 3 else None
+                requests.append((parts[0], parts[1], body))
+    return requests
+
+
+def gen_url(rng: random.Random) -> str:
+    return f'https://{uuid.UUID(int=rng.getrandbits(128)).hex}.com/path'
+
+
+def generate(slugs: List[str],
+             rng: random.Random) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    endless (name, method, path, body) with the traffic mix of locustfile
+    """
+    while True:
+        choice = rng.random()
+        if choice < 0.1:
+            yield ('/shorten_url', 'POST', '/shorten_url',
+                   json.dumps({'url': gen_url(rng)}))
+        elif choice < 0.2:
+            slug = generate_slug(gen_url(rng), 7)
+            yield '/[not-found]', 'GET', f'/{slug}', ''
+        else:
+            yield '/[found]', 'GET', f'/{rng.choice(slugs)}', ''
+
+
+def route_name(method: str, path: str) -> str:
+    """
+    group replayed requests by route rather than by slug
+    """
+    path = path.split('?')[0]
+    if path.startswith('/static/'):
+        path = '/static'
+    elif path not in ('/', '/shorten_url', '/shorten_urls', '/metrics'):
+        path = '/[slug]'
+    return f'{method} {path}'
+
+
+def replay(requests: List[Tuple[str, str, Optional[str]]],
+           rng: random.Random) -> Iterator[Tuple[str, str, str, str]]:
+    while True:
+        for method, path, body in requests:
+            if method == 'POST' and body is None:
+                body = json.dumps({'url': gen_url(rng)})
+            yield route_name(method, path), method, path, body or ''
+
+
+class Stats:
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.dropped = 0
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+            self.errors[name] = 0
+        histogram.record(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def merge(self, other: 'Stats') -> None:
+        for name, histogram in other.histograms.items():
+            self.histograms.setdefault(name, Histogram()).merge(histogram)
+            self.errors[name] = self.errors.get(name, 0) + other.errors[name]
+        self.dropped += other.dropped
+
+
+async def send(session: aiohttp.ClientSession, host: str, stats: Stats,
+               request: Tuple[str, str, str, str], scheduled: float) -> None:
+    name, method, path, body = request
     try:
-        while True:
-            master.poll()
-            for slave in slaves:
-                slave.poll()
-    except KeyboardInterrupt:
-        master.kill()
-        for slave in slaves:
-            slave.poll()
+        async with session.request(
+                method, f'{host}{path}', data=body or None,
+                allow_redirects=False) as rsp:
+            await rsp.read()
+            ok = rsp.status < 400 or (
+                rsp.status == 404 and name != '/[found]')
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ok = False
+    stats.record(name, time.perf_counter() - scheduled, ok)
+
+
+async def closed_loop(session, host, stats, requests, concurrency, deadline):
+
+    async def _user():
+        while time.perf_counter() < deadline:
+            await send(session, host, stats, next(requests),
+                       time.perf_counter())
+
+    await asyncio.gather(*[_user() for _ in range(concurrency)])
+
+
+async def open_loop(session, host, stats, requests, rate, max_inflight,
+                    deadline):
+    inflight: set = set()
+    start = time.perf_counter()
+    for i in range(int(rate * (deadline - start))):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(inflight) >= max_inflight:
+            stats.dropped += 1
+            continue
+        task = asyncio.ensure_future(
+            send(session, host, stats, next(requests), scheduled))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.wait(inflight)
+
+
+async def run(host, concurrency, rate, max_inflight, duration, slugs,
+              log, seed) -> Stats:
+    rng = random.Random(seed)
+    requests = replay(log, rng) if log else generate(slugs, rng)
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.perf_counter() + duration
+        if rate:
+            await open_loop(session, host, stats, requests, rate,
+                            max_inflight, deadline)
+        else:
+            await closed_loop(session, host, stats, requests, concurrency,
+                              deadline)
+    return stats
+
+
+def worker(kwargs) -> Stats:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run(**kwargs))
+    finally:
+        loop.close()
+
+
+def report(stats: Stats, elapsed: float) -> None:
+    print(f'{"name":<32}{"reqs":>9}{"errors":>8}{"req/s":>10}{"p50":>9}'
+          f'{"p90":>9}{"p99":>9}{"p99.9":>9}{"max":>9}')
+    total = Histogram()
+    for name, histogram in sorted(stats.histograms.items()):
+        total.merge(histogram)
+        row(name, histogram, stats.errors[name], elapsed)
+    row('total', total, sum(stats.errors.values()), elapsed)
+    if stats.dropped:
+        print(f'dropped {stats.dropped} requests over --max-inflight')
+
+
+def row(name: str, histogram: Histogram, errors: int,
+        elapsed: float) -> None:
+    count = histogram.total
+    print(f'{name:<32}{count:>9}{errors:>8}{count / elapsed:>10.1f}' +
+          ''.join(f'{histogram.percentile(p):>9.1f}'
+                  for p in (50, 90, 99, 99.9, 100)))
 
 
 def main(argv=None):
     args = argument_parser().parse_args(argv)
-    run(args.locustfile, args.host, args.num, args.web,
-        args.concurrency, args.hatch_rate)
+    log = read_log(args.replay) if args.replay else None
+    slugs = [] if log else read_slugs(args.slugs)
+    jobs = [{
+        'host': args.host,
+        'concurrency': max(1, args.concurrency // args.processes),
+        'rate': args.rate / args.processes if args.rate else None,
+        'max_inflight': args.max_inflight,
+        'duration': args.duration,
+        'slugs': slugs,
+        'log': log,
+        'seed': i,
+    } for i in range(args.processes)]
+    start = time.perf_counter()
+    if args.processes == 1:
+        results = [worker(jobs[0])]
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - start
+    stats = Stats()
+    for result in results:
+        stats.merge(result)
+    print('latency in milliseconds')
+    report(stats, elapsed)
 
 
 if __name__ == '__main__':
@@ -16,6 +16,7 @@ class FakeConnection:
         if results is None:
             results = {}
         self.results = results
+        self.executed: list = []
 
     def __aenter__(self):
         future = Future()
@@ -42,6 +43,7 @@ class FakeConnection:
         return _Transaction()
 
     def execute(self, *args, **kw):
+        self.executed.append(args)
         future = Future()
         future.set_result(self.results.get('execute'))
         return future
@@ -51,6 +53,11 @@ class FakeConnection:
         future.set_result(self.results.get('fetchrow'))
         return future
 
+    def fetchval(self, *args, **kw):
+        future = Future()
+        future.set_result(self.results.get('fetchval'))
+        return future
+
 
 def make_future(result=None, exception=None):
     future = Future()
@@ -59,3 +66,65 @@ def make_future(result=None, exception=None):
     else:
         future.set_result(result)
     return future
+
+
+class BitmapRedis:
+    """
+    the redis commands of the shared bloom filter over bytearrays
+    """
+    SET_IF_NOT_EXIST = 'SET_IF_NOT_EXIST'
+
+    def __init__(self) -> None:
+        self.data: dict = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError('redis is down')
+
+    async def getbit(self, key, offset):
+        self._check()
+        value = self.data.get(key, bytearray())
+        if offset >> 3 >= len(value):
+            return 0
+        return int(bool(value[offset >> 3] & (0x80 >> (offset & 7))))
+
+    async def setbit(self, key, offset, bit):
+        self._check()
+        value = self.data.setdefault(key, bytearray())
+        if offset >> 3 >= len(value):
+            value.extend(bytes((offset >> 3) + 1 - len(value)))
+        if bit:
+            value[offset >> 3] |= 0x80 >> (offset & 7)
+        else:
+            value[offset >> 3] &= ~(0x80 >> (offset & 7)) & 0xff
+        return 0
+
+    async def setrange(self, key, offset, data):
+        self._check()
+        value = self.data.setdefault(key, bytearray())
+        if offset + len(data) > len(value):
+            value.extend(bytes(offset + len(data) - len(value)))
+        value[offset:offset + len(data)] = data
+        return len(value)
+
+    async def bitop_or(self, dest, key, *keys):
+        self._check()
+        values = [self.data.get(k, bytearray()) for k in (key, *keys)]
+        result = bytearray(max(len(value) for value in values))
+        for value in values:
+            for i, byte in enumerate(value):
+                result[i] |= byte
+        self.data[dest] = result
+        return len(result)
+
+    async def set(self, key, value, *, expire=0, exist=None):
+        self._check()
+        if exist == self.SET_IF_NOT_EXIST and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def delete(self, key, *keys):
+        self._check()
+        return sum(self.data.pop(k, None) is not None for k in (key, *keys))
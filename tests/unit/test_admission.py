@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from minikin.admission import Admission, Overloaded
+
+
+async def test_acquire_within_limit():
+    admission = Admission(2)
+    await admission.acquire()
+    await admission.acquire()
+    assert admission.in_flight == 2
+    admission.release()
+    assert admission.in_flight == 1
+
+
+async def test_reject_when_queue_full():
+    admission = Admission(1, queue_size=0)
+    await admission.acquire()
+    with pytest.raises(Overloaded) as exc:
+        await admission.acquire()
+    assert exc.value.reason == 'queue_full'
+
+
+async def test_reject_after_timeout():
+    admission = Admission(1, queue_size=1, timeout=0.01)
+    await admission.acquire()
+    with pytest.raises(Overloaded) as exc:
+        await admission.acquire()
+    assert exc.value.reason == 'timeout'
+    assert admission.stats()['waiting'] == 0
+
+
+async def test_release_lets_in_by_priority():
+    admission = Admission(1, queue_size=2)
+    await admission.acquire()
+    order = []
+
+    async def _request(priority):
+        await admission.acquire(priority)
+        order.append(priority)
+        admission.release()
+
+    tasks = [asyncio.ensure_future(_request(1)),
+             asyncio.ensure_future(_request(0))]
+    await asyncio.sleep(0)
+    admission.release()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1]
+    assert admission.in_flight == 0
+
+
+async def test_higher_priority_evicts_waiting_request():
+    admission = Admission(1, queue_size=1)
+    await admission.acquire()
+    low = asyncio.ensure_future(admission.acquire(1))
+    await asyncio.sleep(0)
+    high = asyncio.ensure_future(admission.acquire(0))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as exc:
+        await low
+    assert exc.value.reason == 'evicted'
+    admission.release()
+    await high
+    assert admission.in_flight == 1
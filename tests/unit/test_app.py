@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock
+
+import pytest
+
+from minikin.app import init_app
+
+
+@pytest.mark.parametrize('count_clicks', [False, True])
+async def test_stats_route_needs_click_counting(count_clicks):
+    app = await init_app(
+        'minikin', 'postgres', None, 7, 'https://minik.in',
+        count_clicks=count_clicks, pool=Mock(), redis=Mock())
+    paths = [resource.canonical for resource in app.router.resources()]
+    assert ('/{slug}/stats' in paths) is count_clicks
+    assert '/{slug}' in paths
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+from aiohttp import web
+
+from minikin.assets import (
+    IMMUTABLE, REVALIDATE, accepted_encodings, load_asset, load_assets)
+from minikin.handlers import static
+
+BODY = b'body { color: black; }\n' * 100
+
+
+def make_app(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'site.css').write_bytes(BODY)
+    (tmp_path / 'logo.0123abcd.png').write_bytes(b'\x89PNG')
+    app = web.Application()
+    app['assets'] = load_assets(str(tmp_path))
+    app.router.add_get('/static/{name:.+}', static)
+    return app
+
+
+def test_load_asset(tmp_path):
+    path = tmp_path / 'site.css'
+    path.write_bytes(BODY)
+    asset = load_asset(str(path))
+    assert asset.headers['Content-Type'] == 'text/css; charset=utf8'
+    assert asset.headers['Cache-Control'] == REVALIDATE
+    assert gzip.decompress(asset.encodings['gzip']) == BODY
+
+
+def test_fingerprinted_asset_is_immutable(tmp_path):
+    path = tmp_path / 'logo.0123abcd.png'
+    path.write_bytes(b'\x89PNG')
+    asset = load_asset(str(path))
+    assert asset.headers['Cache-Control'] == IMMUTABLE
+    assert asset.encodings == {}
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, deflate;q=0.5, br;q=0') == \
+        ['gzip', 'deflate']
+
+
+async def test_static(aiohttp_client, tmp_path):
+    client = await aiohttp_client(make_app(tmp_path))
+    rsp = await client.get(
+        '/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    assert rsp.status == 200
+    assert rsp.headers['Content-Encoding'] == 'gzip'
+    assert await rsp.read() == BODY
+    rsp = await client.get('/static/logo.0123abcd.png')
+    assert rsp.headers['Cache-Control'] == IMMUTABLE
+
+
+async def test_static_not_modified(aiohttp_client, tmp_path):
+    client = await aiohttp_client(make_app(tmp_path))
+    rsp = await client.get('/static/css/site.css')
+    etag = rsp.headers['ETag']
+    rsp = await client.get(
+        '/static/css/site.css', headers={'If-None-Match': etag})
+    assert rsp.status == 304
+    rsp = await client.get(
+        '/static/css/site.css',
+        headers={'If-Modified-Since': rsp.headers['Last-Modified']})
+    assert rsp.status == 304
+
+
+async def test_static_not_found(aiohttp_client, tmp_path):
+    client = await aiohttp_client(make_app(tmp_path))
+    rsp = await client.get('/static/missing.css')
+    assert rsp.status == 404
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from minikin.batch import InsertBatcher, insert_many
+from .helpers import FakeConnection
+
+
+async def test_insert_many():
+    connection = FakeConnection()
+    await insert_many(connection, [('a', 'http://a'), ('b', 'http://b')])
+    (_, slugs, urls), = connection.executed
+    assert slugs == ['a', 'b']
+    assert urls == ['http://a', 'http://b']
+
+
+async def test_insert_many_without_rows():
+    connection = FakeConnection()
+    await insert_many(connection, [])
+    assert connection.executed == []
+
+
+async def test_concurrent_inserts_are_written_together():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    batcher = InsertBatcher(pool, window=0.01, max_size=100)
+    await asyncio.gather(
+        batcher.insert('a', 'http://a'),
+        batcher.insert('b', 'http://b'),
+        batcher.insert('a', 'http://a'),
+    )
+    assert len(connection.executed) == 1
+    assert batcher.stats()['batches'] == 1
+    assert batcher.stats()['rows'] == 2
+
+
+async def test_flush_when_batch_is_full():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    batcher = InsertBatcher(pool, window=60, max_size=2)
+    await asyncio.gather(
+        batcher.insert('a', 'http://a'),
+        batcher.insert('b', 'http://b'),
+    )
+    assert batcher.max_batch_size == 2
+
+
+async def test_insert_fails_with_batch():
+    pool = Mock(**{'acquire.side_effect': RuntimeError})
+    batcher = InsertBatcher(pool, window=0.001)
+    with pytest.raises(RuntimeError):
+        await batcher.insert('a', 'http://a')
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from minikin.bloom import BloomFilter, SharedBloomFilter
+from minikin.breaker import OPEN, CircuitBreaker
+from minikin.utils import generate_slug
+from .helpers import BitmapRedis
+
+
+def test_no_false_negative():
+    bloom = BloomFilter(1000, 0.01)
+    slugs = [generate_slug(str(i), 7) for i in range(1000)]
+    for slug in slugs:
+        bloom.add(slug)
+    assert all(slug in bloom for slug in slugs)
+    assert len(bloom) == 1000
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(generate_slug(str(i), 7))
+    false_positives = sum(
+        generate_slug(f'missing-{i}', 7) in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.parametrize('capacity,error_rate', [
+    (0, 0.01),
+    (10, 0),
+    (10, 1),
+])
+def test_invalid_arguments(capacity, error_rate):
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, error_rate)
+
+
+async def test_shared_filter_miss_is_not_authoritative_until_loaded():
+    bloom = SharedBloomFilter(BitmapRedis(), 10)
+    assert await bloom.might_contain('PTFeSGv')
+    await bloom.upload(BloomFilter(10))
+    assert await bloom.is_loaded()
+    assert not await bloom.might_contain('PTFeSGv')
+
+
+async def test_shared_filter_between_processes():
+    redis = BitmapRedis()
+    first = SharedBloomFilter(redis, 1000)
+    second = SharedBloomFilter(redis, 1000)
+    local = BloomFilter(1000)
+    local.add('stored1')
+    await first.upload(local)
+    await second.add(['PTFeSGv'])
+    assert await first.might_contain('stored1')
+    assert await first.might_contain('PTFeSGv')
+
+
+async def test_shared_filter_upload_keeps_added_slugs():
+    redis = BitmapRedis()
+    bloom = SharedBloomFilter(redis, 1000)
+    await bloom.add(['PTFeSGv'])
+    await bloom.upload(BloomFilter(1000))
+    assert await bloom.might_contain('PTFeSGv')
+    assert 'minikin:bloom:upload' not in redis.data
+
+
+async def test_shared_filter_lost_by_redis():
+    redis = BitmapRedis()
+    bloom = SharedBloomFilter(redis, 10)
+    await bloom.upload(BloomFilter(10))
+    redis.data.clear()
+    assert not await bloom.is_loaded()
+    assert await bloom.might_contain('PTFeSGv')
+
+
+async def test_shared_filter_redis_down():
+    redis = BitmapRedis()
+    bloom = SharedBloomFilter(redis, 10)
+    await bloom.upload(BloomFilter(10))
+    redis.fail = True
+    assert await bloom.might_contain('PTFeSGv')
+    await bloom.add(['PTFeSGv'])
+    assert bloom.pending == {'PTFeSGv'}
+
+
+async def test_shared_filter_circuit_open():
+    breaker = CircuitBreaker('redis')
+    bloom = SharedBloomFilter(BitmapRedis(), 10, breaker=breaker)
+    await bloom.upload(BloomFilter(10))
+    breaker.state = OPEN
+    assert await bloom.might_contain('PTFeSGv')
+
+
+async def test_shared_filter_add_circuit_open():
+    redis = BitmapRedis()
+    breaker = CircuitBreaker('redis')
+    bloom = SharedBloomFilter(redis, 10, breaker=breaker)
+    breaker.state = OPEN
+    redis.fail = True  # would raise if it were called
+    await bloom.add(['PTFeSGv'])
+    assert bloom.pending == {'PTFeSGv'}
+
+
+async def test_shared_filter_sync_pending():
+    redis = BitmapRedis()
+    bloom = SharedBloomFilter(redis, 10)
+    await bloom.upload(BloomFilter(10))
+    bloom.pending.add('PTFeSGv')
+    # other processes may have missed it, the filter has to be loaded again
+    await bloom.sync()
+    assert not bloom.pending
+    assert not await bloom.is_loaded()
+    await bloom.upload(BloomFilter(10))
+    assert await bloom.might_contain('PTFeSGv')
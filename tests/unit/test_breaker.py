@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import Mock, patch
+
+import pytest
+
+from minikin.breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, GuardedRedis)
+from .helpers import make_future
+
+
+def test_open_after_failures():
+    breaker = CircuitBreaker('redis', failure_threshold=2)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats() == {'open': 1, 'opened': 1, 'skipped': 1}
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker('redis', failure_threshold=2)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_slow_call_is_a_failure():
+    breaker = CircuitBreaker('redis', failure_threshold=1, slow_call=0.1)
+    breaker.record(True, 0.2)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker('redis', failure_threshold=1, reset_timeout=5)
+    with patch('minikin.breaker.time.monotonic', return_value=100):
+        breaker.record(False)
+    with patch('minikin.breaker.time.monotonic', return_value=106):
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()  # one probe at a time
+        breaker.record(False)
+        assert breaker.state == OPEN
+    with patch('minikin.breaker.time.monotonic', return_value=112):
+        assert breaker.allow()
+        breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+def test_late_outcomes_ignored():
+    breaker = CircuitBreaker('redis', failure_threshold=1, reset_timeout=5)
+    with patch('minikin.breaker.time.monotonic', return_value=100):
+        assert breaker.allow()
+        late = breaker.generation
+        breaker.record(False)
+        assert breaker.state == OPEN
+        # let through before the circuit opened
+        breaker.record(True, generation=late)
+        assert breaker.state == OPEN
+    with patch('minikin.breaker.time.monotonic', return_value=106):
+        assert breaker.allow()
+        probe = breaker.generation
+        breaker.record(True, generation=late)
+        breaker.abandon(late)
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()  # still probing
+        breaker.record(True, generation=probe)
+    assert breaker.state == CLOSED
+
+
+async def test_guarded_redis_timeout():
+
+    async def _slow_get(key):
+        await asyncio.sleep(1)
+
+    redis = Mock(get=_slow_get)
+    breaker = CircuitBreaker('redis', failure_threshold=1)
+    guarded = GuardedRedis(redis, breaker, timeout=0.01)
+    with pytest.raises(asyncio.TimeoutError):
+        await guarded.get('abc')
+    with pytest.raises(CircuitOpen):
+        await guarded.get('abc')
+
+
+async def test_guarded_redis():
+    redis = Mock(**{'set.return_value': make_future(True)})
+    guarded = GuardedRedis(redis, CircuitBreaker('redis'), timeout=1)
+    assert await guarded.set('abc', 'http://a') is True
+    redis.set.assert_called_once_with('abc', 'http://a')
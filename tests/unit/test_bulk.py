@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from minikin.bulk import (
+    HEADER, TRAILER, CopyDecoder, encode_rows, range_query, ranges,
+    read_manifest, sample_bounds, write_manifest)
+from .helpers import FakeConnection
+
+ROWS = [('PTFeSGv', 'https://minik.in'), ('abcdefg', None),
+        ('zzzzzzz', 'https://例え.jp')]
+
+
+def test_decode_in_chunks_of_any_size():
+    stream = HEADER + encode_rows(ROWS) + TRAILER
+    for size in (1, 7, len(stream)):
+        decoder = CopyDecoder()
+        rows = []
+        for i in range(0, len(stream), size):
+            rows += decoder.feed(stream[i:i + size])
+        assert rows == ROWS
+        assert decoder.done
+
+
+def test_decode_strips_char_padding():
+    decoder = CopyDecoder()
+    assert decoder.feed(HEADER + encode_rows([('abc  ', 'x')])) == \
+        [('abc', 'x')]
+
+
+def test_decode_invalid_stream():
+    with pytest.raises(ValueError):
+        CopyDecoder().feed(b'slug,url\nabc,https://minik.in\n')
+
+
+def test_ranges():
+    assert ranges([]) == [(None, None)]
+    assert ranges(['g', 'p']) == [(None, 'g'), ('g', 'p'), ('p', None)]
+
+
+def test_range_query():
+    assert range_query(None, None) == ('SELECT slug, url FROM short_url', [])
+    assert range_query('g', None) == (
+        'SELECT slug, url FROM short_url WHERE slug >= $1', ['g'])
+    assert range_query('g', 'p') == (
+        'SELECT slug, url FROM short_url WHERE slug >= $1 AND slug < $2',
+        ['g', 'p'])
+
+
+async def test_sample_bounds_keep_collation_order():
+    # en_US.UTF-8 sorts case insensitively first, unlike python
+    connection = FakeConnection(
+        {'fetchval': ['a0', 'B1', 'B1', None, 'b2', 'C3']})
+    assert await sample_bounds(connection, 6) == ['a0', 'B1', 'b2', 'C3']
+    assert await sample_bounds(connection, 1) == []
+
+
+def test_manifest(tmpdir):
+    write_manifest(str(tmpdir), {'format': 'binary', 'files': []})
+    assert read_manifest(str(tmpdir)) == {'format': 'binary', 'files': []}
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from minikin.cache import LRUCache
+
+
+def test_get_and_set():
+    cache = LRUCache(2)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.stats() == {
+        'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_evict_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+def test_pinned_keys_are_not_evicted():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.pin(['a'])
+    cache.set('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    cache.pin(['a', 'c'])
+    cache.set('d', 4)
+    assert len(cache) == 2
+    assert cache.evictions == 2
+
+
+def test_expire_after_ttl():
+    cache = LRUCache(2, ttl=10)
+    with patch('minikin.cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+    with patch('minikin.cache.time.monotonic', return_value=109):
+        assert cache.get('a') == 1
+    with patch('minikin.cache.time.monotonic', return_value=110):
+        assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_disabled_when_maxsize_is_zero():
+    cache = LRUCache(0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
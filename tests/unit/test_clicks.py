@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+from minikin.clicks import ClickCounter, get_clicks, upsert_clicks
+from .helpers import FakeConnection
+
+
+def make_pool(fetchrow=None):
+    connection = FakeConnection({'fetchrow': fetchrow})
+    return connection, Mock(**{'acquire.return_value': connection})
+
+
+async def test_upsert_clicks():
+    connection = FakeConnection()
+    now = datetime.now(timezone.utc)
+    await upsert_clicks(connection, [('abc', 2, now), ('def', 1, now)])
+    (_, slugs, clicks, last_clicks), = connection.executed
+    assert slugs == ['abc', 'def']
+    assert clicks == [2, 1]
+
+
+async def test_counts_are_written_after_interval():
+    connection, pool = make_pool()
+    counter = ClickCounter(pool, interval=0.01)
+    for slug in ['abc', 'abc', 'def']:
+        counter.record(slug)
+    assert counter.pending('abc')[0] == 2
+    assert connection.executed == []
+    await asyncio.sleep(0.05)
+    (_, slugs, clicks, _), = connection.executed
+    assert dict(zip(slugs, clicks)) == {'abc': 2, 'def': 1}
+    assert counter.stats()['pending'] == 0
+
+
+async def test_new_slugs_dropped_when_full():
+    connection, pool = make_pool()
+    counter = ClickCounter(pool, interval=10, max_slugs=2)
+    counter._flushing.update([Mock(), Mock()])  # writes in flight
+    for slug in ['abc', 'def', 'ghi', 'abc']:
+        counter.record(slug)
+    assert counter.pending('abc')[0] == 2
+    assert counter.stats()['dropped'] == 1
+    counter._flushing.clear()
+    await counter.close()
+    assert len(connection.executed) == 1
+
+
+async def test_flush_again_after_writes_in_flight():
+    connection, pool = make_pool()
+    counter = ClickCounter(pool, interval=0.01)
+    in_flight = [Mock(), Mock()]
+    counter._flushing.update(in_flight)
+    counter.record('abc')
+    await asyncio.sleep(0.02)
+    assert connection.executed == []
+    counter._flushing.clear()
+    await asyncio.sleep(0.05)
+    assert len(connection.executed) == 1
+    assert counter.stats()['pending'] == 0
+
+
+async def test_flush_when_a_write_is_done_and_full():
+    connection, pool = make_pool()
+    counter = ClickCounter(pool, interval=10, max_slugs=1)
+    done, running = Mock(), Mock()
+    counter._flushing.update([done, running])
+    counter.record('abc')
+    counter._written(done)
+    await asyncio.sleep(0)
+    assert len(connection.executed) == 1
+    counter._flushing.discard(running)
+    await counter.close()
+
+
+async def test_get_clicks():
+    last = datetime(2018, 8, 9, tzinfo=timezone.utc)
+    _, pool = make_pool({'clicks': 3, 'last_click': last})
+    counter = ClickCounter(pool)
+    counter.record('abc')
+    clicks, last_click = await get_clicks(pool, 'abc', counter)
+    assert clicks == 4
+    assert last_click > last.timestamp()
+    await counter.close()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from minikin import codec
+
+
+@pytest.fixture
+def json_codec():
+    codec.use('json')
+    yield
+    codec.use(codec.DEFAULT)
+
+
+def test_dumps_and_loads():
+    data = {'url': 'https://minik.in/ü'}
+    assert codec.loads(codec.dumps(data)) == data
+    assert json.loads(codec.dumps(data)) == data
+
+
+def test_loads_invalid_json_raises_value_error():
+    with pytest.raises(ValueError):
+        codec.loads('{"url": ')
+
+
+def test_use(json_codec):
+    assert codec.dumps({'a': 1}) == b'{"a": 1}'
+
+
+def test_use_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.use('nope')
+
+
+def test_register():
+    codec.register('upper', lambda obj: str(obj).upper().encode(), str)
+    try:
+        codec.use('upper')
+        assert codec.dumps('a') == b'A'
+    finally:
+        codec.use(codec.DEFAULT)
+        del codec.CODECS['upper']
+
+
+def test_json_response():
+    response = codec.json_response({'error': 'e'}, status=400)
+    assert response.status == 400
+    assert response.content_type == 'application/json'
+    assert json.loads(response.body) == {'error': 'e'}
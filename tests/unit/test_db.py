@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
+import asyncio
 from unittest.mock import Mock, patch
 
 from aioredis.commands import Redis
 import pytest
 
+from minikin.batch import InsertBatcher
+from minikin.bloom import BloomFilter, SharedBloomFilter
+from minikin.breaker import CircuitOpen
+from minikin.cache import LRUCache
 from minikin.db import (
-    URLNotFound, write_to_redis_if_exists, shorten_url, get_url)
-from .helpers import FakeConnection, make_future
+    URLNotFound, write_to_redis_if_exists, shorten_url, shorten_urls,
+    get_url, load_bloom_filter, wait_for_write_backs)
+from .helpers import BitmapRedis, FakeConnection, make_future
 
 
 async def test_write_to_redis_when_redis_is_none():
@@ -36,10 +42,33 @@ async def test_shorten_url():
     assert result == 'PTFeSGv'
 
 
+async def test_shorten_url_recently_shortened():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    shortened = LRUCache(10)
+    for _ in range(2):
+        result = await shorten_url(
+            pool, 'https://minik.in/long-url', size=7, shortened=shortened)
+        assert result == 'PTFeSGv'
+    assert len(connection.executed) == 1
+
+
+async def test_shorten_url_found_in_redis():
+    url = 'https://minik.in/long-url'
+    pool = Mock()
+    redis = Mock(spec=Redis)
+    redis.get.return_value = make_future(url)
+    result = await shorten_url(pool, url, size=7, redis=redis,
+                               check_redis=True)
+    assert result == 'PTFeSGv'
+    pool.acquire.assert_not_called()
+    redis.set.assert_not_called()
+
+
 async def test_get_url_without_redis():
     url = 'https://minik.in/long-url'
     pool = Mock(**{
-        'acquire.return_value': FakeConnection({'fetchrow': {'url': url}})
+        'acquire.return_value': FakeConnection({'fetchval': url})
     })
     result = await get_url(pool, 'PTFeSGv', None)
     assert result == url
@@ -58,7 +87,7 @@ async def test_get_url_found_in_redis():
 async def test_get_url_not_found_in_redis_but_found_in_db():
     url = 'https://minik.in/long-url'
     pool = Mock(**{
-        'acquire.return_value': FakeConnection({'fetchrow': {'url': url}})
+        'acquire.return_value': FakeConnection({'fetchval': url})
     })
     redis = Mock(spec=Redis)
     redis.get.return_value = make_future()
@@ -69,6 +98,20 @@ async def test_get_url_not_found_in_redis_but_found_in_db():
     patched.assert_called_once()
 
 
+async def test_get_url_when_redis_fails():
+    url = 'https://minik.in/long-url'
+    pool = Mock(**{
+        'acquire.return_value': FakeConnection({'fetchval': url})
+    })
+    for exception in (ConnectionError, CircuitOpen('redis')):
+        redis = Mock(spec=Redis)
+        redis.get.return_value = make_future(exception=exception)
+        redis.set.return_value = make_future(True)
+        assert await get_url(pool, 'PTFeSGv', redis) == url
+        await wait_for_write_backs()
+        redis.set.assert_called_once_with('PTFeSGv', url)
+
+
 async def test_get_url_not_found_in_redis_nor_db():
     slug = 'PTFeSGv'
     pool = Mock(**{'acquire.return_value': FakeConnection()})
@@ -77,3 +120,118 @@ async def test_get_url_not_found_in_redis_nor_db():
     with pytest.raises(URLNotFound) as exc:
         await get_url(pool, slug, redis)
     assert exc.value.slug == slug
+
+
+async def test_get_url_rejected_by_bloom_filter():
+    slug = 'PTFeSGv'
+    pool = Mock()
+    negative = LRUCache(10)
+    bloom = SharedBloomFilter(BitmapRedis(), 10)
+    await bloom.upload(BloomFilter(10))
+    with pytest.raises(URLNotFound):
+        await get_url(pool, slug, None, bloom=bloom, negative=negative)
+    pool.acquire.assert_not_called()
+    assert negative.get(slug)
+
+
+async def test_get_url_bloom_filter_not_loaded():
+    url = 'https://minik.in/long-url'
+    pool = Mock(**{
+        'acquire.return_value': FakeConnection({'fetchval': url})
+    })
+    bloom = SharedBloomFilter(BitmapRedis(), 10)
+    assert await get_url(pool, 'PTFeSGv', None, bloom=bloom) == url
+
+
+async def test_load_bloom_filter():
+    class CursorConnection(FakeConnection):
+        async def cursor(self, query):
+            for slug in ['PTFeSGv', 'abcdefg']:
+                yield {'slug': slug}
+
+    pool = Mock(**{'acquire.return_value': CursorConnection()})
+    redis = BitmapRedis()
+    bloom = SharedBloomFilter(redis, 10)
+    assert await load_bloom_filter(pool, bloom)
+    assert await bloom.might_contain('PTFeSGv')
+    assert await bloom.might_contain('abcdefg')
+    assert 'minikin:bloom:lock' not in redis.data
+    # loaded once, whichever process gets to it first
+    assert not await load_bloom_filter(pool, SharedBloomFilter(redis, 10))
+
+
+async def test_load_bloom_filter_locked():
+    pool = Mock()
+    redis = BitmapRedis()
+    redis.data['minikin:bloom:lock'] = '1'
+    assert not await load_bloom_filter(pool, SharedBloomFilter(redis, 10))
+    pool.acquire.assert_not_called()
+
+
+async def test_get_url_found_in_negative_cache():
+    slug = 'PTFeSGv'
+    pool = Mock()
+    redis = Mock(spec=Redis)
+    negative = LRUCache(10)
+    negative.set(slug, True)
+    with pytest.raises(URLNotFound):
+        await get_url(pool, slug, redis, negative=negative)
+    redis.get.assert_not_called()
+    pool.acquire.assert_not_called()
+
+
+async def test_shorten_url_updates_negative_filters():
+    pool = Mock(**{'acquire.return_value': FakeConnection()})
+    bloom = SharedBloomFilter(BitmapRedis(), 10)
+    await bloom.upload(BloomFilter(10))
+    negative = LRUCache(10)
+    negative.set('PTFeSGv', True)
+    slug = await shorten_url(
+        pool, 'https://minik.in/long-url', size=7, bloom=bloom,
+        negative=negative)
+    assert await bloom.might_contain(slug)
+    assert negative.get(slug) is None
+
+
+async def test_shorten_url_with_batcher():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    batcher = InsertBatcher(pool, window=0.001)
+    result = await shorten_url(
+        pool, 'https://minik.in/long-url', size=7, batcher=batcher)
+    assert result == 'PTFeSGv'
+    assert batcher.rows == 1
+
+
+async def test_concurrent_get_url_queries_db_once():
+    url = 'https://minik.in/long-url'
+    connection = FakeConnection({'fetchval': url})
+    pool = Mock(**{'acquire.return_value': connection})
+    results = await asyncio.gather(
+        *[get_url(pool, 'PTFeSGv', None) for _ in range(3)])
+    assert results == [url] * 3
+    pool.acquire.assert_called_once()
+
+
+async def test_shorten_urls():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    redis = Mock(spec=Redis)
+    redis.mset.return_value = make_future(True)
+    result = await shorten_urls(
+        pool, ['https://minik.in/long-url', 'https://minik.in'], 7, redis)
+    assert result[0] == 'PTFeSGv'
+    assert len(connection.executed) == 1
+    redis.mset.assert_called_once()
+
+
+async def test_shorten_urls_recently_shortened():
+    connection = FakeConnection()
+    pool = Mock(**{'acquire.return_value': connection})
+    shortened = LRUCache(10)
+    urls = ['https://minik.in/long-url', 'https://minik.in']
+    await shorten_urls(pool, urls[:1], 7, shortened=shortened)
+    result = await shorten_urls(pool, urls, 7, shortened=shortened)
+    assert result[0] == 'PTFeSGv'
+    (_, slugs, _), = connection.executed[1:]
+    assert slugs == [result[1]]
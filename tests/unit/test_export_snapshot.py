@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock, patch
+
+import pytest
+
+from minikin.export_snapshot import export_snapshot, sample_dictionary
+from minikin.snapshot import MAX_DICTIONARY, Snapshot
+from .helpers import FakeConnection, make_future
+
+ROWS = [('PTFeSGv', 'https://minik.in/a'), ('abc    ', 'https://abc.com'),
+        ('zzzzzzz', 'https://z.com/?q=1')]
+
+
+class ExportConnection(FakeConnection):
+    """
+    a connection with a cursor over rows padded like a char column
+    """
+
+    def __init__(self, rows=ROWS):
+        super().__init__()
+        self.rows = rows
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        return [{'url': url} for _, url in self.rows[:args[0]]]
+
+    async def cursor(self, query, *args, **kw):
+        self.queries.append((query, args))
+        for slug, url in self.rows:
+            yield {'slug': slug, 'url': url}
+
+    async def close(self):
+        self.closed = True
+
+
+async def test_sample_dictionary():
+    connection = ExportConnection()
+    assert await sample_dictionary(connection, 2) == \
+        b'https://minik.in/ahttps://abc.com'
+    assert connection.queries == [
+        ('SELECT url FROM short_url LIMIT $1', (2,))]
+
+
+async def test_sample_dictionary_keeps_the_end():
+    connection = ExportConnection([('a', 'x' * MAX_DICTIONARY),
+                                   ('b', 'https://b.com')])
+    dictionary = await sample_dictionary(connection, 2)
+    assert len(dictionary) == MAX_DICTIONARY
+    assert dictionary.endswith(b'https://b.com')
+
+
+@pytest.mark.parametrize('compress', [False, True])
+async def test_export_snapshot(tmpdir, compress):
+    path = str(tmpdir.join('snapshot'))
+    connection = ExportConnection()
+    with patch('minikin.export_snapshot.asyncpg.connect',
+               Mock(return_value=make_future(connection))):
+        await export_snapshot('minikin', 'postgres', path, compress=compress)
+    assert connection.closed
+    assert 'ORDER BY slug COLLATE "C"' in connection.queries[-1][0]
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 3
+    for slug, url in ROWS:
+        assert snapshot.get(slug.strip()) == url
+    assert snapshot.get('PTFeSGw') is None
+    snapshot.close()
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import json
 from unittest.mock import Mock, patch
 
 from aiohttp import web
 
-from minikin.handlers import get_url, shorten_url, index
+from minikin.cache import LRUCache
+from minikin.handlers import (
+    get_url, get_stats, shorten_url, shorten_urls, index, get_metrics,
+    get_ready, get_hot_keys)
 from minikin.db import URLNotFound
+from minikin.middlewares import error_middleware
+from minikin.hotkeys import HotKeys
+from minikin.snapshot import LiveSnapshot, SnapshotWriter
 from .helpers import make_future
 
 
@@ -22,6 +29,24 @@ async def test_get_url_with_url_exists(aiohttp_client):
     assert rsp.headers['location'] == dest
 
 
+async def test_get_url_caches_redirect(aiohttp_client):
+    app = web.Application()
+    app.router.add_get('/{slug:[0-9a-zA-z]{3}}', get_url)
+    app['pool'] = Mock()
+    app['redis'] = Mock()
+    app['cache'] = LRUCache(10)
+    client = await aiohttp_client(app)
+    dest = 'https://minik.in'
+    with patch('minikin.handlers.db.get_url',
+               Mock(return_value=make_future(dest))) as db_get_url:
+        for _ in range(2):
+            rsp = await client.get('/abc', allow_redirects=False)
+            assert rsp.status == 302
+            assert rsp.headers['location'] == dest
+            assert await rsp.json() == {'location': dest}
+    db_get_url.assert_called_once()
+
+
 async def test_get_url_with_url_not_exists(aiohttp_client):
     app = web.Application()
     app.router.add_get('/{slug:[0-9a-zA-z]{3}}', get_url)
@@ -90,3 +115,137 @@ async def test_index(aiohttp_client):
     assert rsp.status == 200
     assert rsp.content_type == 'text/html'
     assert rsp.charset == 'utf8'
+
+
+async def test_shorten_urls(aiohttp_client):
+    base_url = 'https://minik.in'
+    app = web.Application()
+    app['pool'] = Mock()
+    app['redis'] = Mock()
+    app['settings'] = {'length': 3, 'base_url': base_url}
+    app.router.add_post('/', shorten_urls)
+    client = await aiohttp_client(app)
+    body = '\n'.join([
+        json.dumps({'url': 'https://helloworld.com'}),
+        json.dumps({'url': 'not a valid url'}),
+        json.dumps({'wrong_key': 'https://minik.in'}),
+    ])
+    with patch('minikin.handlers.db.shorten_urls',
+               Mock(return_value=make_future(['abc']))):
+        rsp = await client.post('/', data=body)
+    assert rsp.status == 200
+    lines = (await rsp.text()).splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'url': 'https://helloworld.com',
+         'shortened_url': f'{base_url}/abc'},
+        {'error': 'cannot shorten an invalid url not a valid url'},
+        {'error': "invalid item {'wrong_key': 'https://minik.in'}"},
+    ]
+
+
+async def test_shorten_urls_error_while_streaming(aiohttp_client):
+    app = web.Application()
+    app['pool'] = Mock()
+    app['redis'] = Mock()
+    app['settings'] = {'length': 3, 'base_url': 'https://minik.in'}
+    app.router.add_post('/', shorten_urls)
+    app.middlewares.append(error_middleware)
+    client = await aiohttp_client(app)
+    body = json.dumps({'url': 'https://helloworld.com'})
+    with patch('minikin.handlers.db.shorten_urls',
+               Mock(return_value=make_future(exception=RuntimeError))):
+        rsp = await client.post('/', data=body)
+    assert rsp.status == 200
+    lines = (await rsp.text()).splitlines()
+    assert [json.loads(line) for line in lines] == [{
+        'error': 'sorry, an unexpected error occurred. we are notified.'}]
+
+
+async def test_get_metrics(aiohttp_client):
+    app = web.Application()
+    app['cache'] = LRUCache(10)
+    app.router.add_get('/metrics', get_metrics)
+    client = await aiohttp_client(app)
+    rsp = await client.get('/metrics')
+    assert rsp.status == 200
+    assert rsp.headers['content-type'].startswith('text/plain')
+    text = await rsp.text()
+    assert '# TYPE minikin_request_seconds histogram' in text
+    assert 'minikin_l1_cache_hits 0' in text
+
+
+async def test_get_url_from_snapshot(aiohttp_client, tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    writer = SnapshotWriter(path, width=3)
+    writer.add('abc', 'https://minik.in')
+    writer.close()
+    app = web.Application()
+    app.router.add_get('/{slug:[0-9a-zA-z]{3}}', get_url)
+    app['snapshot'] = LiveSnapshot(path)
+    client = await aiohttp_client(app)
+    rsp = await client.get('/abc', allow_redirects=False)
+    assert rsp.status == 302
+    assert rsp.headers['location'] == 'https://minik.in'
+    rsp = await client.get('/abd', allow_redirects=False)
+    assert rsp.status == 404
+
+
+async def test_get_hot_keys(aiohttp_client):
+    app = web.Application()
+    app['cache'] = LRUCache(10)
+    app['cache'].set('abc', (b'{}', {'Location': 'https://minik.in'}))
+    app['hot_keys'] = HotKeys(10)
+    app.router.add_get('/admin/hot_keys', get_hot_keys)
+    app.router.add_get('/{slug:[0-9a-zA-z]{3}}', get_url)
+    client = await aiohttp_client(app)
+    for _ in range(3):
+        await client.get('/abc', allow_redirects=False)
+    rsp = await client.get('/admin/hot_keys?limit=1')
+    assert await rsp.json() == {
+        'total': 3, 'coverage': 1.0,
+        'slugs': [{'slug': 'abc', 'count': 3}]}
+    rsp = await client.get('/admin/hot_keys?limit=x')
+    assert rsp.status == 400
+
+
+async def test_get_ready(aiohttp_client):
+    app = web.Application()
+    app['ready'] = asyncio.Event()
+    app.router.add_get('/ready', get_ready)
+    client = await aiohttp_client(app)
+    rsp = await client.get('/ready')
+    assert rsp.status == 503
+    app['ready'].set()
+    rsp = await client.get('/ready')
+    assert rsp.status == 200
+    assert await rsp.json() == {'ready': True}
+
+
+async def test_get_stats(aiohttp_client):
+    app = web.Application()
+    app['pool'] = Mock()
+    app['redis'] = None
+    app.router.add_get('/{slug:[0-9a-zA-z]{3}}/stats', get_stats)
+    client = await aiohttp_client(app)
+    with patch('minikin.handlers.get_clicks',
+               Mock(return_value=make_future((3, 1533812147.0)))):
+        rsp = await client.get('/abc/stats')
+    assert rsp.status == 200
+    assert await rsp.json() == {
+        'slug': 'abc', 'clicks': 3,
+        'last_click': '2018-08-09T10:55:47+00:00'}
+
+
+async def test_get_stats_not_found(aiohttp_client):
+    app = web.Application()
+    app['pool'] = Mock()
+    app['redis'] = None
+    app.router.add_get('/{slug:[0-9a-zA-z]{3}}/stats', get_stats)
+    client = await aiohttp_client(app)
+    with patch('minikin.handlers.get_clicks',
+               Mock(return_value=make_future((0, None)))), \
+            patch('minikin.handlers.db.get_url',
+                  Mock(return_value=make_future(
+                      exception=URLNotFound('abc')))):
+        rsp = await client.get('/abc/stats')
+    assert rsp.status == 404
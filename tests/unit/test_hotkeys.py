@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from minikin.cache import LRUCache
+from minikin.hotkeys import CountMinSketch, HotKeys, refresh
+from .helpers import FakeConnection
+
+
+def test_sketch_never_underestimates():
+    sketch = CountMinSketch(width=16, depth=2)
+    for i in range(100):
+        sketch.add(f'slug{i % 10}')
+    sketch.add('hot', 50)
+    assert sketch.total == 150
+    assert sketch.estimate('hot') >= 50
+    assert all(sketch.estimate(f'slug{i}') >= 10 for i in range(10))
+    sketch.halve()
+    assert sketch.total == 75
+    assert sketch.estimate('hot') >= 25
+
+
+def test_sketch_size():
+    with pytest.raises(ValueError):
+        CountMinSketch(width=0)
+
+
+def test_top_k():
+    hot_keys = HotKeys(2)
+    for slug, count in [('a', 5), ('b', 1), ('c', 3), ('d', 1)]:
+        for _ in range(count):
+            hot_keys.add(slug)
+    assert hot_keys.most_common() == [('a', 5), ('c', 3)]
+    assert hot_keys.most_common(1) == [('a', 5)]
+    assert hot_keys.stats() == {'total': 10, 'tracked': 2, 'top_count': 8}
+    hot_keys.halve()
+    assert hot_keys.most_common() == [('a', 2), ('c', 1)]
+    for _ in range(3):
+        hot_keys.add('b')
+    assert [slug for slug, _ in hot_keys.most_common()] == ['b', 'a']
+
+
+async def test_refresh_pins_and_saves(tmp_path):
+    app = {
+        'pool': Mock(**{'acquire.return_value': FakeConnection(
+            {'fetchval': 'https://minik.in'})}),
+        'redis': None,
+        'cache': LRUCache(4),
+        'ready': asyncio.Event(),
+        'hot_keys': HotKeys(10),
+    }
+    for slug in ['abc', 'abc', 'def', 'ghi']:
+        app['hot_keys'].add(slug)
+    path = tmp_path / 'hot'
+    await refresh(app, str(path))
+    assert app['cache'].pinned == {'abc', 'def'}
+    assert 'abc' in app['cache'] and 'def' in app['cache']
+    assert path.read_text() == 'abc\ndef\n'
+    assert app['hot_keys'].most_common() == [('abc', 1)]
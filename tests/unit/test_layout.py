@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock, call
+
+import pytest
+from aioredis.commands import Redis
+
+from minikin.layout import BucketRedis, with_layout
+from .helpers import make_future
+
+
+def test_bucket():
+    assert BucketRedis(None, 4).bucket('PTFeSGv') == ('u:PTFe', 'SGv')
+    assert BucketRedis(None, 3).bucket('PTFeSGv') == ('u:PTF', 'eSGv')
+
+
+async def test_get_from_bucket():
+    redis = Mock(spec=Redis)
+    redis.hget.return_value = make_future('https://minik.in')
+    assert await BucketRedis(redis).get('PTFeSGv') == 'https://minik.in'
+    redis.hget.assert_called_once_with('u:PTFe', 'SGv')
+    redis.get.assert_not_called()
+
+
+async def test_get_falls_back_to_flat_key():
+    redis = Mock(spec=Redis)
+    redis.hget.return_value = make_future()
+    redis.get.return_value = make_future('https://minik.in')
+    assert await BucketRedis(redis).get('PTFeSGv') is None
+    redis.hget.return_value = make_future()
+    assert await BucketRedis(redis, fallback=True).get('PTFeSGv') == \
+        'https://minik.in'
+    redis.get.assert_called_once_with('PTFeSGv')
+
+
+async def test_set_and_mset():
+    redis = Mock(spec=Redis)
+    redis.hset.return_value = make_future(1)
+    redis.hmset.side_effect = lambda *args: make_future(True)
+    buckets = BucketRedis(redis)
+    assert await buckets.set('PTFeSGv', 'https://a')
+    redis.hset.assert_called_once_with('u:PTFe', 'SGv', 'https://a')
+    assert await buckets.mset('PTFeSGv', 'https://a', 'PTFeXYz', 'https://b',
+                              'abcdefg', 'https://c')
+    assert sorted(redis.hmset.call_args_list) == [
+        call('u:PTFe', 'SGv', 'https://a', 'XYz', 'https://b'),
+        call('u:abcd', 'efg', 'https://c'),
+    ]
+
+
+def test_with_layout():
+    redis = Mock(spec=Redis)
+    assert with_layout(redis) is redis
+    buckets = with_layout(redis, 'bucket', 3, True)
+    assert buckets.redis is redis
+    assert buckets.prefix == 3
+    assert buckets.fallback
+    with pytest.raises(ValueError):
+        with_layout(redis, 'tree')
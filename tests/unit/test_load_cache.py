@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import Mock
+
+from aioredis.commands import Redis
+
+from minikin.load_cache import (
+    Progress, read_checkpoint, read_pages, write_pages)
+from .helpers import make_future
+
+
+def test_checkpoint_waits_for_earlier_pages(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    progress = Progress({'slug': ''}, path, interval=0)
+    progress.page_done(1, 'b', 10)
+    assert read_checkpoint(path) == {'slug': ''}
+    progress.page_done(0, 'a', 10)
+    assert read_checkpoint(path) == {'slug': 'b'}
+    progress.complete()
+    assert read_checkpoint(path) == {'slug': 'b', 'complete': True}
+    assert progress.rows == 20
+
+
+def test_read_missing_checkpoint(tmpdir):
+    assert read_checkpoint(str(tmpdir.join('checkpoint'))) == {}
+
+
+async def test_read_and_write_pages(tmpdir):
+    pages = [
+        [{'slug': 'a', 'url': 'http://a'}, {'slug': 'b', 'url': 'http://b'}],
+        [{'slug': 'c', 'url': 'http://c'}],
+        [],
+    ]
+    connection = Mock(**{
+        'fetch.side_effect': [make_future(page) for page in pages]})
+    redis = Mock(spec=Redis)
+    redis.mset.return_value = make_future(True)
+    path = str(tmpdir.join('checkpoint'))
+    progress = Progress({'slug': ''}, path)
+    queue: asyncio.Queue = asyncio.Queue()
+    await asyncio.gather(
+        read_pages(connection, queue, '', 2, None, 2),
+        write_pages(redis, queue, progress),
+        write_pages(redis, queue, progress),
+    )
+    assert progress.rows == 3
+    assert progress.checkpoint['slug'] == 'c'
+    assert connection.fetch.call_args[0][1] == 'c'
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from tests.load.run import Histogram, read_log, route_name
+
+
+def test_histogram_small_values_are_exact():
+    histogram = Histogram()
+    for micros in range(1, 101):
+        histogram.record(micros / 1000000)
+    assert histogram.total == 100
+    assert histogram.percentile(50) == 0.05
+    assert histogram.percentile(100) == 0.1
+
+
+@pytest.mark.parametrize('seconds', [0.0005, 0.0123, 0.25, 1.5, 42])
+def test_histogram_within_one_percent(seconds):
+    histogram = Histogram()
+    histogram.record(seconds)
+    assert histogram.percentile(50) == pytest.approx(
+        seconds * 1000, rel=0.01)
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+    assert histogram.percentile(50) == pytest.approx(500, rel=0.01)
+    assert histogram.percentile(99) == pytest.approx(990, rel=0.01)
+    assert histogram.percentile(100) == pytest.approx(1000, rel=0.01)
+    assert Histogram().percentile(99) == 0
+
+
+def test_histogram_merge():
+    first, second = Histogram(), Histogram()
+    first.record(0.001)
+    second.record(0.001)
+    second.record(0.1)
+    # as sent back from a worker process
+    first.merge(Histogram(second.counts))
+    assert first.total == 3
+    assert first.percentile(50) == pytest.approx(1, rel=0.01)
+    assert second.total == 2
+
+
+def test_read_log(tmpdir):
+    path = tmpdir.join('requests.log')
+    path.write('\n'.join([
+        'GET /PTFeSGv',
+        'POST /shorten_url {"url": "https://a.com"}',
+        'POST /shorten_url',
+        '127.0.0.1 - - [10/Oct/2020:13:55:36 +0000] '
+        '"GET /abcdefg?x=1 HTTP/1.1" 302 0 "-" "curl/7.64.1"',
+        'DELETE /PTFeSGv',
+        'garbage',
+        '',
+    ]))
+    assert read_log(str(path)) == [
+        ('GET', '/PTFeSGv', None),
+        ('POST', '/shorten_url', '{"url": "https://a.com"}'),
+        ('POST', '/shorten_url', None),
+        ('GET', '/abcdefg?x=1', None),
+    ]
+
+
+@pytest.mark.parametrize('method,path,expected', [
+    ('GET', '/PTFeSGv', 'GET /[slug]'),
+    ('GET', '/PTFeSGv/stats?x=1', 'GET /[slug]'),
+    ('GET', '/', 'GET /'),
+    ('GET', '/metrics?name=x', 'GET /metrics'),
+    ('GET', '/static/app.js', 'GET /static'),
+    ('POST', '/shorten_url', 'POST /shorten_url'),
+    ('POST', '/shorten_urls', 'POST /shorten_urls'),
+])
+def test_route_name(method, path, expected):
+    assert route_name(method, path) == expected
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import queue
+
+import pytest
+
+from minikin.logs import (
+    BatchListener, BatchStreamHandler, JSONFormatter, SamplingFilter,
+    parse_rate, worker_file)
+
+
+def make_record(msg='hello', route=None):
+    record = logging.LogRecord(
+        'root', logging.INFO, __file__, 1, msg, None, None)
+    if route is not None:
+        record.route = route
+    return record
+
+
+def test_json_formatter():
+    line = JSONFormatter().format(make_record(route='/shorten_url'))
+    data = json.loads(line)
+    assert data['message'] == 'hello'
+    assert data['level'] == 'INFO'
+    assert data['route'] == '/shorten_url'
+
+
+def test_sampling_filter():
+    sampler = SamplingFilter({'/{slug}': 0}, default=1)
+    assert sampler.filter(make_record())
+    assert sampler.filter(make_record(route='/shorten_url'))
+    assert not sampler.filter(make_record(route='/{slug}'))
+
+
+def test_sampling_filter_keeps_errors():
+    sampler = SamplingFilter(default=0)
+    for level in (logging.WARNING, logging.ERROR):
+        record = make_record(route='/shorten_urls')
+        record.levelno = level
+        assert sampler.filter(record)
+    assert not sampler.filter(make_record(route='/shorten_urls'))
+
+
+def test_parse_rate():
+    assert parse_rate('/{slug}=0.01') == ('/{slug}', 0.01)
+    for value in ('/{slug}', '=0.1', '/{slug}=2', '/{slug}=x'):
+        with pytest.raises(ValueError):
+            parse_rate(value)
+
+
+def test_worker_file():
+    assert worker_file('output.log', 1234) == 'output.1234.log'
+    assert worker_file('logs/minikin', 1234) == 'logs/minikin.1234'
+
+
+def test_batch_listener(tmp_path):
+    path = tmp_path / 'out.log'
+    records: queue.Queue = queue.Queue()
+    with open(path, 'w') as stream:
+        handler = BatchStreamHandler(stream)
+        listener = BatchListener(records, handler, batch_size=2)
+        for i in range(5):
+            records.put(make_record(f'line {i}'))
+        listener.start()
+        listener.stop()
+    assert path.read_text().splitlines() == [f'line {i}' for i in range(5)]
+
+
+def test_batch_listener_handler_level(tmp_path):
+    path = tmp_path / 'out.log'
+    records: queue.Queue = queue.Queue()
+    with open(path, 'w') as stream:
+        handler = BatchStreamHandler(stream)
+        handler.setLevel(logging.WARNING)
+        listener = BatchListener(records, handler)
+        listener.start()
+        records.put(make_record('skipped'))
+        warning = make_record('kept')
+        warning.levelno = logging.WARNING
+        records.put(warning)
+        listener.stop()
+        listener.stop()  # stopping twice is harmless
+    assert path.read_text().splitlines() == ['kept']
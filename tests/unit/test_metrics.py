@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from minikin.metrics import Counter, Histogram, Registry, format_stats
+
+
+def test_counter():
+    counter = Counter('requests_total', 'requests', ('route',))
+    counter.inc('/a')
+    counter.inc('/a', amount=2)
+    counter.inc('/b')
+    assert list(counter.samples()) == [
+        'requests_total{route="/a"} 3',
+        'requests_total{route="/b"} 1',
+    ]
+
+
+def test_histogram():
+    histogram = Histogram('latency_seconds', 'latency', buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(3)
+    assert list(histogram.samples()) == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 3.65',
+        'latency_seconds_count 4',
+    ]
+
+
+def test_registry_render():
+    registry = Registry()
+    registry.register(Counter('hits_total', 'cache hits')).inc()
+    assert registry.render() == (
+        '# HELP hits_total cache hits\n'
+        '# TYPE hits_total counter\n'
+        'hits_total 1\n'
+    )
+
+
+def test_format_stats():
+    assert format_stats('cache', {'hits': 1, 'misses': 2}) == [
+        'cache_hits 1', 'cache_misses 2']
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from aiohttp import web
 
-from minikin.middlewares import error_middleware
+from minikin.admission import Admission
+from minikin.metrics import REJECTED, REQUESTS, REQUEST_SECONDS
+from minikin.middlewares import (
+    create_admission_middleware, error_middleware, metrics_middleware)
 
 
 async def test_404(aiohttp_client):
@@ -42,3 +45,43 @@ async def test_other_error(aiohttp_client):
     assert rsp.status == 405
     data = await rsp.json()
     assert 'error' in data
+
+
+async def test_metrics_middleware(aiohttp_client):
+
+    async def _handler(request):
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.middlewares.append(metrics_middleware)
+    app.middlewares.append(error_middleware)
+    app.router.add_get('/{name}', _handler)
+    client = await aiohttp_client(app)
+    before = REQUESTS.values.get(('/{name}', 'GET', '200'), 0)
+    await client.get('/abc')
+    assert REQUESTS.values[('/{name}', 'GET', '200')] == before + 1
+    assert ('/{name}', 'GET') in REQUEST_SECONDS.values
+
+
+async def test_admission_middleware(aiohttp_client):
+
+    async def _handler(request):
+        return web.Response(status=200)
+
+    admission = Admission(1)
+    app = web.Application()
+    app.middlewares.append(
+        create_admission_middleware(admission, retry_after=2))
+    app.router.add_get('/busy', _handler)
+    app.router.add_get('/metrics', _handler)
+    client = await aiohttp_client(app)
+    rsp = await client.get('/busy')
+    assert rsp.status == 200
+    assert admission.in_flight == 0
+    await admission.acquire()
+    rsp = await client.get('/busy')
+    assert rsp.status == 503
+    assert rsp.headers['Retry-After'] == '2'
+    assert REJECTED.values[('/busy', 'queue_full')] >= 1
+    rsp = await client.get('/metrics')
+    assert rsp.status == 200
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock
+
+from aioredis.commands import Redis
+
+from minikin.layout import BucketRedis
+from minikin.migrate_cache import migrate_batch
+from .helpers import make_future
+
+
+async def test_migrate_batch():
+    redis = Mock(spec=Redis)
+    redis.mget.return_value = make_future(['https://a', None])
+    redis.hmset.return_value = make_future(True)
+    redis.delete.return_value = make_future(1)
+    migrated = await migrate_batch(
+        redis, BucketRedis(redis), ['PTFeSGv', 'u:abcd', 'abcdefg'],
+        delete=True)
+    assert migrated == 1
+    redis.mget.assert_called_once_with('PTFeSGv', 'abcdefg')
+    redis.hmset.assert_called_once_with('u:PTFe', 'SGv', 'https://a')
+    redis.delete.assert_called_once_with('PTFeSGv')
+
+
+async def test_migrate_batch_of_buckets():
+    redis = Mock(spec=Redis)
+    assert await migrate_batch(redis, BucketRedis(redis), ['u:abcd']) == 0
+    redis.mget.assert_not_called()
+
+
+async def test_migrate_batch_leaves_other_keys_alone():
+    redis = Mock(spec=Redis)
+    keys = ['minikin:bloom', 'minikin:bloom:lock', 'minikin:bloom:upload',
+            'clicks', 'PTFeSGv8', 'PTFe_Gv']
+    assert await migrate_batch(
+        redis, BucketRedis(redis), keys, delete=True) == 0
+    redis.mget.assert_not_called()
+    redis.delete.assert_not_called()
+
+
+async def test_migrate_batch_slug_length():
+    redis = Mock(spec=Redis)
+    redis.mget.return_value = make_future(['https://a'])
+    redis.hmset.return_value = make_future(True)
+    assert await migrate_batch(
+        redis, BucketRedis(redis), ['PTFeSGv', 'abcd'], length=4) == 1
+    redis.mget.assert_called_once_with('abcd')
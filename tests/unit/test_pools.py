@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from unittest.mock import Mock
+
+import asyncpg
+import pytest
+
+from minikin.batch import insert_many
+from minikin.db import fetch_url
+from minikin.pools import (
+    ReplicaPool, ShardRouter, dsn_options, parse_shard, primary_pools,
+    run_query, run_rows, stored_pools)
+from minikin.utils import generate_slug
+from .helpers import FakeConnection
+
+
+def make_pool(url=None):
+    return Mock(**{
+        'acquire.return_value': FakeConnection({'fetchval': url})})
+
+
+def test_choose_replicas_in_turn():
+    primary, first, second = Mock(), Mock(), Mock()
+    pool = ReplicaPool(primary, [first, second])
+    assert [pool.choose() for _ in range(4)] == [
+        first, second, first, second]
+
+
+def test_choose_primary_when_no_replica_is_healthy():
+    primary, replica = Mock(), Mock()
+    pool = ReplicaPool(primary, [replica])
+    pool.mark_unhealthy(replica)
+    assert pool.choose() is primary
+
+
+async def test_run_on_replica():
+    primary, replica = make_pool(), make_pool('http://a')
+    pool = ReplicaPool(primary, [replica])
+    assert await pool.run(fetch_url, 'abc') == 'http://a'
+    primary.acquire.assert_not_called()
+
+
+async def test_run_on_primary_when_replica_fails():
+    primary = make_pool('http://a')
+    replica = Mock(**{'acquire.side_effect': ConnectionRefusedError})
+    pool = ReplicaPool(primary, [replica])
+    assert await pool.run(fetch_url, 'abc') == 'http://a'
+    assert pool.healthy == []
+
+
+async def test_fallback_on_miss():
+    primary, replica = make_pool('http://a'), make_pool()
+    pool = ReplicaPool(primary, [replica], fallback_on_miss=True)
+    assert await pool.run(fetch_url, 'abc') == 'http://a'
+
+
+async def test_no_fallback_on_miss():
+    primary, replica = make_pool('http://a'), make_pool()
+    pool = ReplicaPool(primary, [replica])
+    assert await pool.run(fetch_url, 'abc') is None
+    primary.acquire.assert_not_called()
+
+
+async def test_check_restores_healthy_replicas():
+    up = Mock(**{'acquire.return_value': FakeConnection({'fetchval': 1})})
+    down = Mock(**{
+        'acquire.side_effect': asyncpg.CannotConnectNowError('starting')})
+    pool = ReplicaPool(Mock(), [up, down])
+    pool.healthy = []
+    await pool.check()
+    assert pool.healthy == [up]
+
+
+def test_shard_router_spreads_slugs():
+    router = ShardRouter({'a': Mock(), 'b': Mock(), 'c': Mock()})
+    counts = Counter(
+        router.shard_for(generate_slug(str(i), 7)) for i in range(3000))
+    assert set(counts) == {'a', 'b', 'c'}
+    assert min(counts.values()) > 700
+
+
+def test_adding_shard_moves_few_slugs():
+    old = ShardRouter({'a': Mock(), 'b': Mock(), 'c': Mock()})
+    new = ShardRouter({'a': Mock(), 'b': Mock(), 'c': Mock(), 'd': Mock()})
+    slugs = [generate_slug(str(i), 7) for i in range(3000)]
+    moved = [slug for slug in slugs
+             if old.shard_for(slug) != new.shard_for(slug)]
+    assert all(new.shard_for(slug) == 'd' for slug in moved)
+    assert len(moved) < 1200
+
+
+async def test_shard_router_reads_previous_layout_on_miss():
+    moved, empty = make_pool('http://a'), make_pool()
+    previous = ShardRouter({'a': moved})
+    router = ShardRouter({'b': empty}, previous=previous)
+    assert await run_query(
+        router, fetch_url, 'abc', slug='abc', read=True) == 'http://a'
+    assert await run_query(router, fetch_url, 'abc', slug='abc') is None
+
+
+async def test_shard_router_needs_a_slug():
+    with pytest.raises(ValueError):
+        await run_query(ShardRouter({'a': make_pool()}), fetch_url, 'abc')
+
+
+async def test_run_rows_split_between_shards():
+    first, second = FakeConnection(), FakeConnection()
+    router = ShardRouter({
+        'a': Mock(**{'acquire.return_value': first}),
+        'b': Mock(**{'acquire.return_value': second}),
+    })
+    rows = [(generate_slug(str(i), 7), str(i)) for i in range(20)]
+    await run_rows(router, insert_many, rows)
+    assert len(first.executed) == 1
+    assert len(second.executed) == 1
+    slugs = first.executed[0][1] + second.executed[0][1]
+    assert sorted(slugs) == sorted(slug for slug, _ in rows)
+
+
+def test_stored_pools_include_previous_layout():
+    a, b, c = make_pool(), make_pool(), make_pool()
+    router = ShardRouter({'a': a, 'b': b},
+                         previous=ShardRouter({'b': b, 'c': c}))
+    assert primary_pools(router) == [a, b]
+    assert stored_pools(router) == [a, b, c]
+    assert stored_pools(a) == [a]
+
+
+@pytest.mark.parametrize('dsn,expected', [
+    ('postgres://host', {'database': 'minikin', 'user': 'postgres'}),
+    ('postgres://app@host/urls', {}),
+    ('postgres://host/urls', {'user': 'postgres'}),
+    ('postgres://app@host', {'database': 'minikin'}),
+    ('postgres://host?dbname=urls&user=app', {}),
+])
+def test_dsn_options(dsn, expected):
+    assert dsn_options(dsn, 'minikin', 'postgres') == expected
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('a=postgres://host', ('a', 'postgres://host')),
+    ('a=postgres://host/db?x=1', ('a', 'postgres://host/db?x=1')),
+])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['a', '=postgres://host', 'a='])
+def test_parse_invalid_shard(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from minikin import metrics, queries
+from .helpers import FakeConnection
+
+
+async def test_fetchval():
+    connection = FakeConnection({'fetchval': 'http://a'})
+    assert await queries.fetchval(connection, 'select_url', 'abc') == \
+        'http://a'
+    assert ('select_url',) in metrics.STATEMENT_SECONDS.values
+
+
+async def test_execute_runs_same_statement_text():
+    connection = FakeConnection()
+    await queries.execute(connection, 'insert_url', 'a', 'http://a')
+    await queries.execute(connection, 'insert_url', 'b', 'http://b')
+    first, second = connection.executed
+    assert first[0] == second[0] == queries.STATEMENTS['insert_url']
+    assert first[1:] == ('a', 'http://a')
+
+
+async def test_warm_up():
+    connection = FakeConnection()
+    await queries.warm_up(connection)
+    assert [args[0] for args in connection.executed] == [
+        queries.STATEMENTS['select_url'], queries.STATEMENTS['insert_many']]
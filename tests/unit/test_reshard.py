@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock
+
+from minikin.pools import ShardRouter
+from minikin.reshard import move_rows
+from minikin.utils import generate_slug
+from .helpers import FakeConnection, make_future
+
+
+async def test_move_rows():
+    slugs = [generate_slug(str(i), 7) for i in range(20)]
+    records = [{'slug': slug, 'url': slug} for slug in sorted(slugs)]
+    source = FakeConnection()
+    source.fetch = Mock(side_effect=[make_future(records), make_future([])])
+    target = FakeConnection()
+    router = ShardRouter({
+        'a': Mock(**{'acquire.return_value': source}),
+        'b': Mock(**{'acquire.return_value': target}),
+    })
+    moved = await move_rows('a', router.shards['a'], router, 100)
+    expected = sorted(slug for slug in slugs if router.shard_for(slug) == 'b')
+    assert moved == len(expected)
+    (_, inserted, _), = target.executed
+    assert sorted(inserted) == expected
+    (_, deleted), = source.executed
+    assert sorted(deleted) == expected
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import Mock
+
+import pytest
+
+from minikin.bulk import HEADER, TRAILER, CopyDecoder, encode_rows
+from minikin.dump import dump_range
+from minikin.restore import restore_file
+from .helpers import FakeConnection, make_future
+
+ROWS = [('PTFeSGv', 'https://minik.in'), ('abcdefg', 'https://a.com'),
+        ('zzzzzzz', None)]
+
+
+class CopyConnection(FakeConnection):
+    """
+    a connection copying a binary stream out in small chunks and keeping
+    what is copied in
+    """
+
+    def __init__(self, stream=b''):
+        super().__init__()
+        self.stream = stream
+        self.copied = {}
+
+    async def copy_from_query(self, query, *args, output, format):
+        self.copied_query = query, args
+        for i in range(0, len(self.stream), 5):
+            await output(self.stream[i:i + 5])
+
+    async def copy_to_table(self, table, *, source, columns, format):
+        self.copied[table] = b''.join([chunk async for chunk in source])
+
+
+@pytest.mark.parametrize('fmt', ['binary', 'ndjson'])
+async def test_dump_and_restore(tmpdir, fmt):
+    path = str(tmpdir.join('part'))
+    stream = HEADER + encode_rows(ROWS) + TRAILER
+    connection = CopyConnection(stream)
+    assert await dump_range(connection, path, 'P', None, fmt) == len(stream)
+    assert connection.copied_query == (
+        'SELECT slug, url FROM short_url WHERE slug >= $1', ('P',))
+    redis = Mock()
+    redis.mset.side_effect = lambda *args: make_future(True)
+    await restore_file(connection, path, fmt, redis)
+    decoder = CopyDecoder()
+    assert decoder.feed(connection.copied['short_url']) == ROWS
+    assert decoder.done
+    pairs = [arg for call in redis.mset.call_args_list for arg in call[0]]
+    assert pairs == ['PTFeSGv', 'https://minik.in',
+                     'abcdefg', 'https://a.com']
+
+
+async def test_restore_writes_redis_after_commit(tmpdir):
+    path = str(tmpdir.join('part'))
+    connection = CopyConnection(HEADER + encode_rows(ROWS) + TRAILER)
+    await dump_range(connection, path, None, None)
+
+    async def copy_to_table(table, *, source, columns, format):
+        async for _ in source:
+            pass
+        raise RuntimeError('copy failed')
+
+    connection.copy_to_table = copy_to_table
+    redis = Mock()
+    with pytest.raises(RuntimeError):
+        await restore_file(connection, path, redis=redis)
+    redis.mset.assert_not_called()
+
+
+@pytest.mark.parametrize('fmt', ['binary', 'ndjson'])
+async def test_restore_in_bounded_batches(tmpdir, fmt):
+    rows = [(f'{i:07d}', f'https://{i}.com') for i in range(25)]
+    path = str(tmpdir.join('part'))
+    connection = CopyConnection(HEADER + encode_rows(rows) + TRAILER)
+    await dump_range(connection, path, None, None, fmt)
+    events = []
+
+    async def copy_to_table(table, *, source, columns, format):
+        copied = CopyDecoder().feed(b''.join([c async for c in source]))
+        events.append(('copy', copied))
+
+    def mset(*args):
+        events.append(('mset', list(zip(args[::2], args[1::2]))))
+        return make_future(True)
+
+    connection.copy_to_table = copy_to_table
+    redis = Mock(**{'mset.side_effect': mset})
+    await restore_file(connection, path, fmt, redis, batch_size=10)
+    # every batch is copied, then cached, before the next is read
+    assert [name for name, _ in events] == ['copy', 'mset'] * 3
+    assert [len(batch) for _, batch in events] == [10, 10, 10, 10, 5, 5]
+    assert [row for name, batch in events if name == 'copy'
+            for row in batch] == rows
+
+
+async def test_restore_skip_existing(tmpdir):
+    path = str(tmpdir.join('part'))
+    connection = CopyConnection(HEADER + encode_rows(ROWS) + TRAILER)
+    await dump_range(connection, path, None, None)
+    await restore_file(connection, path, skip_existing=True)
+    assert 'restore_short_url' in connection.copied
+    assert 'ON CONFLICT (slug) DO NOTHING' in connection.executed[-1][0]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from minikin.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_are_shared():
+    calls = []
+
+    async def _func(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    flight = SingleFlight()
+    results = await asyncio.gather(*[flight.do('key', _func, i)
+                                     for i in range(5)])
+    assert results == [0] * 5
+    assert calls == [0]
+    assert flight.shared == 4
+    await asyncio.sleep(0)
+    assert len(flight) == 0
+
+
+async def test_exception_is_shared():
+
+    async def _func():
+        await asyncio.sleep(0.01)
+        raise KeyError('key')
+
+    flight = SingleFlight()
+    results = await asyncio.gather(
+        flight.do('key', _func), flight.do('key', _func),
+        return_exceptions=True)
+    assert all(isinstance(result, KeyError) for result in results)
+    assert flight.calls == 1
+
+
+async def test_cancelled_caller_does_not_cancel_others():
+
+    async def _func():
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    flight = SingleFlight()
+    first = asyncio.ensure_future(flight.do('key', _func))
+    second = asyncio.ensure_future(flight.do('key', _func))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 'value'
+    with pytest.raises(asyncio.CancelledError):
+        await first
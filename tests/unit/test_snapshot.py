@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from minikin.snapshot import LiveSnapshot, Snapshot, SnapshotWriter
+
+ROWS = [('PTFeSGv', 'https://minik.in'), ('aaaaaaa', 'https://a.com/path'),
+        ('abc', 'https://abc.com'), ('zzzzzzz', 'https://z.com/?q=1')]
+
+
+def write(path, rows=ROWS, **options):
+    writer = SnapshotWriter(path, **options)
+    for slug, url in rows:
+        writer.add(slug, url)
+    writer.close()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_write_and_read(tmpdir, compress):
+    path = str(tmpdir.join('snapshot'))
+    write(path, compress=compress, dictionary=b'https://.com')
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 4
+    for slug, url in ROWS:
+        assert snapshot.get(slug) == url
+    assert snapshot.get('PTFeSGw') is None
+    assert snapshot.get('0000000') is None
+    assert snapshot.get('toolongslug') is None
+    assert os.listdir(str(tmpdir)) == ['snapshot']
+    snapshot.close()
+
+
+def test_compressed_entries(tmpdir):
+    rows = [(f'{i:07d}', f'https://example.com/articles/{i}?ref=été')
+            for i in range(200)]
+    plain, compressed = str(tmpdir.join('plain')), str(tmpdir.join('small'))
+    write(plain, rows)
+    write(compressed, rows, compress=True,
+          dictionary=b'https://example.com/articles/?ref=')
+    snapshot = Snapshot(compressed)
+    assert [snapshot.get(slug) for slug, _ in rows] == [
+        url for _, url in rows]
+    assert snapshot.get('0000200') is None
+    assert os.path.getsize(compressed) < os.path.getsize(plain)
+    snapshot.close()
+
+
+def test_empty_snapshot(tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    write(path, [])
+    assert Snapshot(path).get('PTFeSGv') is None
+
+
+def test_slugs_must_be_in_order(tmpdir):
+    writer = SnapshotWriter(str(tmpdir.join('snapshot')))
+    writer.add('b', 'https://b.com')
+    with pytest.raises(ValueError):
+        writer.add('a', 'https://a.com')
+    with pytest.raises(ValueError):
+        writer.add('b', 'https://b.com')
+    with pytest.raises(ValueError):
+        writer.add('toolongslug', 'https://c.com')
+
+
+def test_not_a_snapshot(tmpdir):
+    path = tmpdir.join('snapshot')
+    path.write('slug,url\n')
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_reload_new_snapshot(tmpdir):
+    path = str(tmpdir.join('snapshot'))
+    write(path, ROWS[:1])
+    live = LiveSnapshot(path)
+    assert not live.reload()
+    assert live.get('zzzzzzz') is None
+    write(path)
+    assert live.reload()
+    assert live.get('zzzzzzz') == 'https://z.com/?q=1'
+    assert live.stats() == {'slugs': 4, 'swaps': 1}
+    os.remove(path)
+    assert not live.reload()
+    assert live.get('PTFeSGv') == 'https://minik.in'
+    live.close()
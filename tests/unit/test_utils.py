@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import pytest
 
-from minikin.utils import base62_encode, generate_slug, validate_url
+from minikin.utils import (
+    base62_encode, generate_slug, iter_json_batches, validate_url)
 
 
 @pytest.mark.parametrize('num,expected', [
@@ -49,3 +50,84 @@ def test_valid_url(url):
 def test_invalid_url(url):
     with pytest.raises(ValueError):
         validate_url(url)
+
+
+class FakeStream:
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    async def readany(self):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+async def collect(chunks, **kw):
+    values = []
+    async for batch in iter_json_batches(FakeStream(chunks), **kw):
+        values.extend(batch)
+    return values
+
+
+@pytest.mark.parametrize('chunks', [
+    [b'[{"url": "a"}, {"url": "b"}]'],
+    [b' [{"url": ', b'"a"}', b', {"u', b'rl": "b"}', b']'],
+    [b'{"url": "a"}\n{"url": "b"}\n'],
+    [b'{"url": "a"}\n{"u', b'rl": "b"}'],
+])
+async def test_iter_json_batches(chunks):
+    values = await collect(chunks)
+    assert values == [{'url': 'a'}, {'url': 'b'}]
+
+
+async def test_iter_json_batches_max_size():
+    batches = []
+    stream = FakeStream([b'[1, 2, 3]'])
+    async for batch in iter_json_batches(stream, max_size=2):
+        batches.append(batch)
+    assert batches == [[1, 2], [3]]
+
+
+async def test_iter_json_batches_invalid_line():
+    values = await collect([b'{"url": "a"}\nabc\n{"url": "b"}'])
+    assert values[0] == {'url': 'a'}
+    assert isinstance(values[1], ValueError)
+    assert values[2] == {'url': 'b'}
+
+
+async def test_iter_json_batches_invalid_array():
+    values = await collect([b'[{"url": "a"}, abc, {"url": "b"}]'])
+    assert values[0] == {'url': 'a'}
+    assert isinstance(values[1], ValueError)
+    assert len(values) == 2
+
+
+@pytest.mark.parametrize('chunks', [
+    [b'[3', b'.5, 1', b'e2]'],
+    [b'[3.', b'5, 1e', b'2]'],
+    [b'[3.5', b' , 100 ', b']'],
+])
+async def test_iter_json_batches_split_numbers(chunks):
+    assert await collect(chunks) == [3.5, 100]
+
+
+@pytest.mark.parametrize('chunks,expected', [
+    ([b'[1, 2'], [1]),
+    ([b'[1, 2', b', '], [1, 2]),
+    ([b'['], []),
+])
+async def test_iter_json_batches_unterminated_array(chunks, expected):
+    values = await collect(chunks)
+    assert values[:-1] == expected
+    assert isinstance(values[-1], ValueError)
+
+
+async def test_iter_json_batches_missing_comma():
+    values = await collect([b'[1 2]'])
+    assert len(values) == 1
+    assert isinstance(values[0], ValueError)
+
+
+async def test_iter_json_batches_item_too_large():
+    values = await collect([b'[{"url": "', b'a' * 100], max_item_size=10)
+    assert len(values) == 1
+    assert isinstance(values[0], ValueError)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import Mock
+
+from minikin.cache import LRUCache
+from minikin.warmup import preload, read_slugs, warm_up
+from .helpers import FakeConnection
+
+
+def make_app(url):
+    return {
+        'pool': Mock(**{
+            'acquire.return_value': FakeConnection({'fetchval': url})}),
+        'redis': None,
+        'cache': LRUCache(10),
+        'ready': asyncio.Event(),
+    }
+
+
+def test_read_slugs(tmp_path):
+    path = tmp_path / 'slugs'
+    path.write_text('abc\n\ndef\nghi\n')
+    assert read_slugs(str(path), 2) == ['abc', 'def']
+
+
+async def test_preload():
+    app = make_app('https://minik.in')
+    assert await preload(app, ['abc', 'def']) == 2
+    body, headers = app['cache'].get('abc')
+    assert headers['Location'] == 'https://minik.in'
+
+
+async def test_preload_missing_slug():
+    app = make_app(None)
+    assert await preload(app, ['abc']) == 0
+    assert app['cache'].get('abc') is None
+
+
+async def test_warm_up(tmp_path):
+    path = tmp_path / 'slugs'
+    path.write_text('abc\n')
+    app = make_app('https://minik.in')
+    await warm_up(app, str(path), 10)
+    assert app['ready'].is_set()
+    assert len(app['cache']) == 1
+
+
+async def test_warm_up_without_file(tmp_path):
+    app = make_app('https://minik.in')
+    await warm_up(app, str(tmp_path / 'missing'), 10)
+    assert app['ready'].is_set()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import socket
+import sys
+from unittest.mock import Mock, patch
+
+from minikin.workers import Supervisor, create_socket
+
+
+def test_create_unix_socket(tmpdir):
+    path = str(tmpdir.join('minikin.sock'))
+    sock = create_socket(path=path)
+    try:
+        assert sock.family == socket.AF_UNIX
+        assert sock.getsockname() == path
+        assert sock.get_inheritable()
+    finally:
+        sock.close()
+
+
+def test_command_passes_socket_to_worker():
+    sock = Mock(**{'fileno.return_value': 5})
+    supervisor = Supervisor(sock, ['minikin', '--workers', '4'], 4)
+    assert supervisor.command() == [
+        sys.executable, '-m', 'minikin.app', 'minikin', '--workers', '4',
+        '--workers', '1', '--fd', '5']
+
+
+def test_restart_exited_worker():
+    sock = Mock(**{'fileno.return_value': 5})
+    supervisor = Supervisor(sock, [], 2, restart_delay=0)
+    alive = Mock(**{'poll.return_value': None})
+    dead = Mock(**{'poll.return_value': 1, 'returncode': 1})
+    supervisor.workers = {alive: 0, dead: 0}
+    with patch('minikin.workers.subprocess.Popen') as popen:
+        supervisor.check()
+    popen.assert_called_once()
+    assert dead not in supervisor.workers
+    assert len(supervisor.workers) == 2
+
+
+def test_reload_replaces_workers():
+    sock = Mock(**{'fileno.return_value': 5})
+    supervisor = Supervisor(sock, [], 2)
+    old = [Mock(), Mock()]
+    supervisor.workers = {process: 0 for process in old}
+    with patch('minikin.workers.subprocess.Popen',
+               side_effect=[Mock(), Mock()]):
+        supervisor.reload()
+    for process in old:
+        process.terminate.assert_called_once()
+        assert process not in supervisor.workers
+    assert len(supervisor.workers) == 2